@@ -1,7 +1,24 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, g, render_template, request, jsonify, send_file, stream_with_context
+from datetime import date
+import io
 import os
+import tempfile
+from time import perf_counter
 import swisseph as swe
-from astrology_logic import generate_horoscope_markdown, geocode
+import ephemeris_store
+import json
+import metrics
+import prerender
+from astrology_logic import (
+    calculate_chart, chart_options, chart_to_json, generate_horoscope, generate_horoscope_json,
+    iter_horoscope, render_request_key, resolve_points,
+)
+from batch import read_records, run_batch, write_dataset
+from columnar import FLOAT_DTYPES
+from chart_cache import MARKDOWN_MAX_CHARS, chart_cache_stats, markdown_etag, markdown_results
+from geocoding import geocode_cache_stats, geocode_many
+from render import RENDERERS
+from transits import calculate_transits, transits_to_markdown
 
 app = Flask(__name__)
 
@@ -12,131 +29,440 @@ project_root = os.path.dirname(os.path.abspath(__file__))
 ephe_path = os.path.join(project_root, 'ephe')
 swe.set_ephe_path(ephe_path)
 
+# Open the ephemeris at startup rather than on the first request (cold starts), and map
+# the optional precomputed table (ASTROMD_EPHEMERIS_TABLE or data/ephemeris.bin, see
+# ephemeris_store.py).
+ephemeris_store.warm_up()
+ephemeris_store.load_store()
+
+# --- Instrumentation ---
+# Stage timings (metrics.stage) are returned per request as a Server-Timing header and kept
+# as histograms for /metrics. ASTROMD_METRICS=0 disables both.
+
+def route_label():
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+
+@app.before_request
+def start_timing():
+    g.request_start = metrics.start_request()
+
+
+@app.after_request
+def finish_timing(response):
+    # Streamed bodies are produced after this runs, so their later stages only reach /metrics.
+    if metrics.ENABLED and 'request_start' in g:
+        elapsed = perf_counter() - g.request_start
+        metrics.observe('astromd_request_seconds', elapsed, route=route_label())
+        metrics.increment('astromd_requests_total', route=route_label(), status=response.status_code)
+        response.headers['Server-Timing'] = metrics.server_timing(metrics.request_timings(), elapsed)
+    return response
+
+
+def log_error(e):
+    # Logs the traceback with the route and counts it, instead of swallowing it in a 500.
+    app.logger.exception("Unhandled error in %s: %s", route_label(), e)
+    metrics.increment('astromd_errors_total', route=route_label())
+
+
+def cache_metrics():
+    # Cache counters and hit ratios, read at scrape time from the caches' own statistics.
+    lines = [
+        "# HELP astromd_cache_lookups_total Cache lookups by cache and result.",
+        "# TYPE astromd_cache_lookups_total counter",
+    ]
+    ratios = []
+    cache_stats = chart_cache_stats()
+    for cache, stats in cache_stats.items():
+        for result in ('hits', 'shared_hits', 'misses'):
+            lines.append(f'astromd_cache_lookups_total{{cache="{cache}",result="{result}"}} {stats[result]}')
+        ratios.append((cache, stats['hits'] + stats['shared_hits'], stats['misses']))
+    geocode_stats = geocode_cache_stats()
+    coalesced = {cache: stats['coalesced'] for cache, stats in cache_stats.items()}
+    coalesced['geocode'] = geocode_stats.pop('coalesced')
+    for result, value in geocode_stats.items():
+        lines.append(f'astromd_cache_lookups_total{{cache="geocode",result="{result}"}} {value}')
+    geocode_hits = sum(geocode_stats[key] for key in ('gazetteer_hits', 'memory_hits', 'disk_hits', 'negative_hits'))
+    ratios.append(('geocode', geocode_hits, geocode_stats['misses']))
+    lines += ["# HELP astromd_cache_coalesced_total Misses that waited for an identical in-flight computation.",
+              "# TYPE astromd_cache_coalesced_total counter"]
+    for cache, value in coalesced.items():
+        lines.append(f'astromd_cache_coalesced_total{{cache="{cache}"}} {value}')
+    lines += ["# HELP astromd_cache_hit_ratio Share of lookups answered from cache since start.",
+              "# TYPE astromd_cache_hit_ratio gauge"]
+    for cache, hits, misses in ratios:
+        lines.append(f'astromd_cache_hit_ratio{{cache="{cache}"}} {hits / (hits + misses) if hits + misses else 0:.4f}')
+    return lines
+
+
+metrics.register_collector(cache_metrics)
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    # Prometheus text exposition format.
+    return app.response_class(metrics.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# --- Pre-rendered pages ---
+# After `python prerender.py` the content pages and fingerprinted assets are served from
+# the build (in memory, pre-compressed) with no template work; without a build the
+# templates are rendered per request as before.
+site = prerender.load_site()
+
+
+def page(template):
+    response = site.page(request.path) if site else None
+    return response or render_template(template)
+
+
+@app.route('/assets/<path:name>')
+def assets(name):
+    # Fingerprinted static files from the build, cacheable for a year.
+    response = site.asset(name) if site else None
+    return response or (jsonify({'error': 'Not found.'}), 404)
+
+
 @app.route('/')
 def index():
     # Renders the main input form.
-    return render_template('index.html')
+    return page('index.html')
 
 
 @app.route('/faq')
 def faq():
     # Renders the FAQ page.
-    return render_template('faq.html')
+    return page('faq.html')
 
 @app.route('/synastry')
 def synastry():
     # Renders the double chart (synastry) input form.
-    return render_template('synastry.html')
+    return page('synastry.html')
 
 @app.route('/examples')
 def examples():
     # Renders the examples page.
-    return render_template('examples.html')
+    return page('examples.html')
+
+MINOR_ASPECTS = ['Quincunx', 'Semisextile', 'Semisquare', 'Sesquiquadrate', 'Quintile', 'Biquintile']
+
+
+def parse_chart_form(form, suffix=''):
+    """Reads one chart's birth data and minor-aspect selection from the form.
+
+    `suffix` is '' for chart 1 and '2' for chart 2. Returns (None, None) when the
+    core fields (year, month, day, location_name) are not all present.
+    """
+    year = form.get(f'year{suffix}')
+    month = form.get(f'month{suffix}')
+    day = form.get(f'day{suffix}')
+    hour = form.get(f'hour{suffix}')
+    minute = form.get(f'minute{suffix}')
+    location_name = form.get(f'location_name{suffix}')
+
+    if not year or not month or not day or not location_name:
+        return None, None
+
+    # Determine if birth time is unknown (checkbox preferred, fallback to hour missing)
+    time_unknown = bool(form.get(f'time_unknown{suffix}')) or (not hour or str(hour).strip() == '')
+
+    # Fallbacks: if time is unknown, assume 12:00
+    if time_unknown:
+        hour = '12'
+    if not minute or str(minute).strip() == '':
+        minute = '0'
+
+    data = {
+        'name': form.get(f'name{suffix}'),  # optional
+        'year': year,
+        'month': month,
+        'day': day,
+        'hour': hour,
+        'minute': minute,
+        'location_name': location_name,
+        'time_unknown': time_unknown,
+        'timezone': form.get(f'timezone{suffix}') or None,  # optional IANA name; default: from coordinates
+        # optional, comma-separated or repeated; the first of each is the chart's own
+        'house_systems': ','.join(form.getlist(f'house_systems{suffix}')) or None,
+        'zodiacs': ','.join(form.getlist(f'zodiacs{suffix}')) or None,
+        'point_set': ','.join(form.getlist(f'point_set{suffix}')) or None,  # optional; default 'classic'
+    }
+    selected_aspects = {name: form.get(f'{name}{suffix}') == 'true' for name in MINOR_ASPECTS}
+    return data, selected_aspects
+
+
+def geocode_charts(charts):
+    # Fills lat/lon on each chart in place; returns the first location name that was not found.
+    with metrics.stage('geocode'):
+        locations = geocode_many([chart['location_name'] for chart in charts])
+    return apply_locations(charts, locations)
+
+
+def apply_locations(charts, locations):
+    for chart, (lat, lon) in zip(charts, locations):
+        if lat is None or lon is None:
+            return chart['location_name']
+        chart['lat'] = lat
+        chart['lon'] = lon
+    return None
+
+
+MISSING_FIELDS_ERROR = 'Missing required fields: year, month, day, and location_name are required.'
+
+
+def unknown_format_error(output_format):
+    return f"Unknown format: {output_format} (expected one of {', '.join(RENDERERS)})"
+
+
+def parse_generate_form(form):
+    """Reads a /generate form into a job (generate_result() keyword arguments).
+
+    Returns (job, None), or (None, error message) for a 400 response. Shared with the
+    ASGI entry point (asgi.py), so both validate requests the same way.
+    """
+    data1, selected_aspects1 = parse_chart_form(form)
+    if data1 is None:
+        return None, MISSING_FIELDS_ERROR
+    data2, selected_aspects2 = parse_chart_form(form, '2')
+    output_format = form.get('format') or 'markdown'
+    if output_format not in RENDERERS:
+        return None, unknown_format_error(output_format)
+    job = {
+        'output_format': output_format,
+        'data1': data1, 'selected_aspects1': selected_aspects1,
+        'data2': data2, 'selected_aspects2': selected_aspects2,
+        'sections': ','.join(form.getlist('sections')) or None,
+    }
+    error = check_options(job_charts(job), job['sections'])
+    return (None, error) if error else (job, None)
+
+
+def check_options(charts, sections=None):
+    # The error message for the first unknown option name in the charts or sections, or None.
+    try:
+        for chart in charts:
+            chart_options(chart, sections)
+    except ValueError as e:
+        return str(e)
+    return None
+
+
+def job_charts(job):
+    # The birth data of a job's charts, to be geocoded in place.
+    return [job['data1']] if job['data2'] is None else [job['data1'], job['data2']]
+
+
+def generate_result(output_format, data1, selected_aspects1, data2=None, selected_aspects2=None, sections=None):
+    # The /generate result for geocoded charts: a dict for 'json', the document text otherwise.
+    # `sections` (json only) limits what is calculated, e.g. 'points' for positions only.
+    if output_format == 'json':
+        return generate_horoscope_json(data1, selected_aspects1, data2, selected_aspects2, sections)
+    # Markdown, csv or the compact variant for LLM prompts. Not generate_horoscope_markdown(),
+    # which turns errors into document text: bad birth data must reach the 400 handlers.
+    return generate_horoscope(output_format, data1, selected_aspects1, data2, selected_aspects2)
+
+
+def json_body(data):
+    # Byte-for-byte what jsonify sends outside debug mode.
+    return (app.json.dumps(data, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+def generate_outcome(job, if_none_match):
+    """Runs a geocoded job; returns the response as (status, body bytes, content type, headers).
+
+    Plain values so that the Flask route and the ASGI entry point (which runs this on
+    its worker pool) send identical responses.
+    """
+    content = generate_result(**job)
+    if job['output_format'] == 'json':
+        return 200, json_body(content), 'application/json', []
+    if job['output_format'] == 'csv':
+        return 200, content.encode('utf-8'), 'text/csv; charset=utf-8', []
+
+    # Markdown as JSON; the ETag lets clients revalidate identical requests.
+    etag = markdown_etag(content)
+    headers = [('ETag', f'"{etag}"')]
+    if etag in if_none_match:
+        return 304, b'', None, headers
+    return 200, json_body({'markdown': content}), 'application/json', headers
+
 
 @app.route('/generate', methods=['POST'])
 def generate():
     # Handles form submission, calculates the horoscope, and returns the result as JSON.
     try:
-        # --- Get Form Data ---
-        year = request.form.get('year')
-        month = request.form.get('month')
-        day = request.form.get('day')
-        hour = request.form.get('hour')
-        minute = request.form.get('minute')
-        location_name = request.form.get('location_name')
-
-        # Determine if birth time is unknown (checkbox preferred, fallback to hour missing)
-        time_unknown1 = bool(request.form.get('time_unknown')) or (not hour or str(hour).strip() == '')
-
-        # Fallbacks: if time is unknown, assume 12:00
-        if time_unknown1:
-            hour = '12'
-        if not minute or str(minute).strip() == '':
-            minute = '0'
-
-        # Basic validation for required fields
-        if not year or not month or not day or not location_name:
-            return jsonify({'error': 'Missing required fields: year, month, day, and location_name are required.'}), 400
-
-        data1 = {
-            'name': request.form.get('name'),  # optional
-            'year': year,
-            'month': month,
-            'day': day,
-            'hour': hour,
-            'minute': minute,
-            'location_name': location_name,
-            'time_unknown': time_unknown1,
-        }
-
-        # --- Geocode Location ---
-        lat, lon = geocode(data1['location_name'])
+        job, error = parse_generate_form(request.form)
+        if error:
+            return jsonify({'error': error}), 400
+
+        # --- Geocode Locations (both charts in parallel) ---
+        missing = geocode_charts(job_charts(job))
+        if missing:
+            return jsonify({'error': f"Could not find location: {missing}"}), 400
+
+        # --- Generate (structured JSON/CSV for API callers, Markdown otherwise) ---
+        status, body, content_type, headers = generate_outcome(job, request.if_none_match)
+        return app.response_class(body, status=status, headers=headers, content_type=content_type)
+
+    except ValueError as e:
+        # Birth data the calculation rejects (e.g. an impossible date).
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        log_error(e)
+        return jsonify({'error': str(e)}), 500
+
+
+def sse_event(event, data):
+    # One Server-Sent Events message; data is JSON so multi-line Markdown stays on one line.
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.route('/generate/stream', methods=['POST'])
+def generate_stream():
+    # Same form as /generate, but the document is sent section by section while later
+    # sections (chart 2, synastry) are still being calculated. Chunked text in the
+    # requested format by default, Server-Sent Events when the client accepts text/event-stream.
+    job, error = parse_generate_form(request.form)
+    if error:
+        return jsonify({'error': error}), 400
+    try:
+        missing = geocode_charts(job_charts(job))
+    except Exception as e:
+        log_error(e)
+        return jsonify({'error': str(e)}), 500
+    if missing:
+        return jsonify({'error': f"Could not find location: {missing}"}), 400
+    try:
+        # Charts are lazy, so this only checks the birth data (dates, time zone), while the
+        # error can still be a 400 instead of text in an already started stream.
+        for chart in job_charts(job):
+            calculate_chart(chart)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    output_format = job['output_format']
+    mimetype = RENDERERS[output_format].mimetype
+    use_sse = request.accept_mimetypes.best_match([mimetype, 'text/event-stream']) == 'text/event-stream'
+    args = (job['data1'], job['selected_aspects1'], job['data2'], job['selected_aspects2'])
+    request_key = render_request_key(output_format, *args)
+    cached = markdown_results.get(request_key)
+    sections = iter([cached]) if cached is not None else iter_horoscope(output_format, *args)
+
+    def generate_sections():
+        parts = []
+        try:
+            for section in sections:
+                parts.append(section)
+                yield sse_event('section', {'text': section}) if use_sse else section
+        except Exception as e:
+            # Headers are already sent, so the error goes into the stream itself.
+            log_error(e)
+            yield sse_event('error', {'error': str(e)}) if use_sse else f"\n\nAn error occurred: {e}"
+            return
+        document = "".join(parts)
+        if cached is None and len(document) <= MARKDOWN_MAX_CHARS:
+            markdown_results.set(request_key, document)
+        if use_sse:
+            yield sse_event('done', {'etag': markdown_etag(document)})
+
+    response = app.response_class(stream_with_context(generate_sections()),
+                                  mimetype='text/event-stream' if use_sse else mimetype)
+    response.headers['Cache-Control'] = 'no-cache'
+    # Disable proxy buffering (nginx) so sections reach the client as they are produced.
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@app.route('/generate/batch', methods=['POST'])
+def generate_batch():
+    # Streams one NDJSON line per birth record (JSON Lines or CSV body), in submission order.
+    # With ?dataset=npz the charts come back as one columnar .npz file instead (columnar.py).
+    fmt = 'csv' if request.mimetype == 'text/csv' else 'jsonl'
+    lines = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+    dataset = request.args.get('dataset')
+    if dataset:
+        return batch_dataset(read_records(lines, fmt), dataset)
+    results = (line + '\n' for line in run_batch(read_records(lines, fmt)))
+    return app.response_class(stream_with_context(results), mimetype='application/x-ndjson')
+
+
+def batch_dataset(records, dataset):
+    # Only npz over HTTP: it is a single file and carries the per-record errors in meta.json.
+    dtype = request.args.get('dtype') or 'float32'
+    if dataset != 'npz' or dtype not in FLOAT_DTYPES:
+        return jsonify({'error': f"Unsupported dataset={dataset} / dtype={dtype} (expected npz, float32 or float64)."}), 400
+    point_set = request.args.get('point_set')
+    try:
+        resolve_points(point_set)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    handle, path = tempfile.mkstemp(suffix='.npz')
+    os.close(handle)
+    try:
+        write_dataset(records, path, 'npz', point_set, dtype)
+        data = open(path, 'rb')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        log_error(e)
+        return jsonify({'error': str(e)}), 500
+    finally:
+        os.unlink(path)
+    return send_file(data, mimetype='application/octet-stream', as_attachment=True, download_name='charts.npz')
+
+
+def parse_date_jd(value, field):
+    # Parses a YYYY-MM-DD form value into a Julian day at 0h UT.
+    # date() rejects impossible dates (2026-02-31) that swe.julday would silently roll over.
+    try:
+        year, month, day = (int(part) for part in str(value).split('-'))
+        date(year, month, day)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid {field} date (expected YYYY-MM-DD): {value}")
+    return swe.julday(year, month, day, 0.0)
+
+
+@app.route('/generate/transits', methods=['POST'])
+def generate_transits():
+    # Transit timeline for one natal chart over [start, end], as Markdown or JSON.
+    try:
+        data1, selected_aspects1 = parse_chart_form(request.form)
+        start = request.form.get('start')
+        end = request.form.get('end')
+        if data1 is None or not start or not end:
+            return jsonify({'error': 'Missing required fields: year, month, day, location_name, start and end are required.'}), 400
+        error = check_options([data1])
+        if error:
+            return jsonify({'error': error}), 400
+        try:
+            start_jd = parse_date_jd(start, 'start')
+            end_jd = parse_date_jd(end, 'end')
+            step_days = float(request.form.get('step') or 1)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        with metrics.stage('geocode'):
+            lat, lon = geocode_many([data1['location_name']])[0]
         if lat is None or lon is None:
             return jsonify({'error': f"Could not find location: {data1['location_name']}"}), 400
-        
         data1['lat'] = lat
         data1['lon'] = lon
 
-        # --- Get Selected Minor Aspects ---
-        selected_aspects1 = {
-            'Quincunx': request.form.get('Quincunx') == 'true',
-            'Semisextile': request.form.get('Semisextile') == 'true',
-            'Semisquare': request.form.get('Semisquare') == 'true',
-            'Sesquiquadrate': request.form.get('Sesquiquadrate') == 'true',
-            'Quintile': request.form.get('Quintile') == 'true',
-            'Biquintile': request.form.get('Biquintile') == 'true',
-        }
-
-        # --- Optional: Chart 2 ---
-        year2 = request.form.get('year2')
-        month2 = request.form.get('month2')
-        day2 = request.form.get('day2')
-        hour2 = request.form.get('hour2')
-        minute2 = request.form.get('minute2')
-        location_name2 = request.form.get('location_name2')
-
-        data2 = None
-        selected_aspects2 = None
-        has_chart2_core = year2 and month2 and day2 and location_name2
-        if has_chart2_core:
-            time_unknown2 = bool(request.form.get('time_unknown2')) or (not hour2 or str(hour2).strip() == '')
-            if time_unknown2:
-                hour2 = '12'
-            if not minute2 or str(minute2).strip() == '':
-                minute2 = '0'
-            data2 = {
-                'name': request.form.get('name2'),  # optional
-                'year': year2,
-                'month': month2,
-                'day': day2,
-                'hour': hour2,
-                'minute': minute2,
-                'location_name': location_name2,
-                'time_unknown': time_unknown2,
-            }
-            lat2, lon2 = geocode(data2['location_name'])
-            if lat2 is None or lon2 is None:
-                return jsonify({'error': f"Could not find location: {data2['location_name']}"}), 400
-            data2['lat'] = lat2
-            data2['lon'] = lon2
-
-            selected_aspects2 = {
-                'Quincunx': request.form.get('Quincunx2') == 'true',
-                'Semisextile': request.form.get('Semisextile2') == 'true',
-                'Semisquare': request.form.get('Semisquare2') == 'true',
-                'Sesquiquadrate': request.form.get('Sesquiquadrate2') == 'true',
-                'Quintile': request.form.get('Quintile2') == 'true',
-                'Biquintile': request.form.get('Biquintile2') == 'true',
-            }
-
-        # --- Generate Markdown ---
-        markdown_content = generate_horoscope_markdown(data1, selected_aspects1, data2, selected_aspects2)
-
-        # --- Return Result as JSON ---
-        return jsonify({'markdown': markdown_content})
+        natal_chart = calculate_chart(data1, selected_aspects1)
+        as_json = request.form.get('format') == 'json'  # Markdown lists the hits only
+        with metrics.stage('transits'):
+            transits = calculate_transits(natal_chart, start_jd, end_jd, step_days, selected_aspects1,
+                                          with_positions=as_json)
+
+        if as_json:
+            return jsonify({'natal': chart_to_json(natal_chart), **transits})
+        return jsonify({'markdown': transits_to_markdown(natal_chart, start, end, transits)})
 
+    except ValueError as e:
+        # Birth data or a range the calculation rejects.
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        # A simple error handler
+        log_error(e)
         return jsonify({'error': str(e)}), 500
 
 
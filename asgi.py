@@ -0,0 +1,146 @@
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from time import perf_counter
+
+from a2wsgi import WSGIMiddleware
+from werkzeug.wrappers import Request
+
+import metrics
+from app import app as flask_app, apply_locations, generate_outcome, job_charts, json_body, parse_generate_form
+from geocoding import close_async_client, geocode_many_async
+
+# --- ASGI entry point ---
+# Usage: uvicorn asgi:app
+#
+# POST /generate runs on the event loop: geocoding awaits Nominatim instead of holding a
+# worker thread, and chart calculation and rendering (CPU-bound) go to a bounded thread
+# pool. A request waiting on Nominatim is then a suspended coroutine rather than a busy
+# thread, so one process can keep hundreds of them in flight. Every other route is the
+# Flask app, run on a2wsgi's thread pool.
+
+CHART_WORKERS = int(os.environ.get('ASTROMD_CHART_WORKERS', os.cpu_count() or 1))
+MAX_FORM_BYTES = 64 * 1024  # the chart forms are a few hundred bytes
+
+_chart_pool = ThreadPoolExecutor(max_workers=CHART_WORKERS, thread_name_prefix='chart')
+_wsgi = WSGIMiddleware(flask_app)
+
+
+async def run_in_chart_pool(fn, *args):
+    # The copied context carries the request's stage timings into the worker thread.
+    context = contextvars.copy_context()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_chart_pool, functools.partial(context.run, fn, *args))
+
+
+async def read_body(receive):
+    # The whole request body, or None if it exceeds MAX_FORM_BYTES or the client went away.
+    body = bytearray()
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        body += message.get('body', b'')
+        if len(body) > MAX_FORM_BYTES:
+            return None
+        if not message.get('more_body'):
+            return bytes(body)
+
+
+def werkzeug_request(scope, body):
+    # Wraps the buffered body in a WSGI environ so form parsing is exactly the Flask routes'.
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'],
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+    }
+    for name, value in scope['headers']:
+        key = name.decode('latin-1').upper().replace('-', '_')
+        if key == 'CONTENT_TYPE':
+            environ[key] = value.decode('latin-1')
+        elif key != 'CONTENT_LENGTH':
+            environ[f'HTTP_{key}'] = value.decode('latin-1')
+    return Request(environ)
+
+
+def json_response(status, data):
+    return status, json_body(data), 'application/json', []
+
+
+async def generate_response(scope, receive):
+    # POST /generate, as in app.generate but geocoding on the event loop and calculating on
+    # the chart pool; returns (status, body, content type, extra headers).
+    body = await read_body(receive)
+    if body is None:
+        return json_response(413, {'error': 'Request body too large.'})
+    request = werkzeug_request(scope, body)
+    try:
+        job, error = parse_generate_form(request.form)
+        if error:
+            return json_response(400, {'error': error})
+
+        charts = job_charts(job)
+        with metrics.stage('geocode'):
+            locations = await geocode_many_async([chart['location_name'] for chart in charts])
+        missing = apply_locations(charts, locations)
+        if missing:
+            return json_response(400, {'error': f"Could not find location: {missing}"})
+
+        return await run_in_chart_pool(generate_outcome, job, request.if_none_match)
+
+    except ValueError as e:
+        return json_response(400, {'error': str(e)})
+    except Exception as e:
+        flask_app.logger.exception("Unhandled error in /generate: %s", e)
+        metrics.increment('astromd_errors_total', route='/generate')
+        return json_response(500, {'error': str(e)})
+
+
+async def generate(scope, receive, send):
+    start = metrics.start_request()
+    status, body, content_type, headers = await generate_response(scope, receive)
+    if content_type:
+        headers.append(('Content-Type', content_type))
+    headers.append(('Content-Length', str(len(body))))
+    if metrics.ENABLED:
+        elapsed = perf_counter() - start
+        metrics.observe('astromd_request_seconds', elapsed, route='/generate')
+        metrics.increment('astromd_requests_total', route='/generate', status=status)
+        headers.append(('Server-Timing', metrics.server_timing(metrics.request_timings(), elapsed)))
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await close_async_client()
+            _chart_pool.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+    elif scope['type'] == 'http' and scope['method'] == 'POST' and scope['path'] == '/generate':
+        await generate(scope, receive, send)
+    else:
+        await _wsgi(scope, receive, send)
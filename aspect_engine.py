@@ -0,0 +1,182 @@
+from functools import lru_cache
+import numpy as np
+from points import MINOR_POINTS, OPPOSITE_POINTS, SENSITIVE_POINTS  # noqa: F401 (re-exported)
+
+# --- Vectorized aspect engine ---
+# One implementation for natal (n x n, upper triangle), synastry and transit (n x m)
+# aspects. Separations are computed as a matrix, every orb test is a broadcast comparison,
+# and the result is a structured array; turning it into text is left to the renderer.
+
+ALL_ASPECTS_DEF = {
+    'Conjunction': (0, 8), 'Opposition': (180, 8), 'Trine': (120, 7),
+    'Square': (90, 7), 'Sextile': (60, 5),
+    'Quincunx': (150, 2), 'Semisextile': (30, 2), 'Semisquare': (45, 2),
+    'Sesquiquadrate': (135, 2), 'Quintile': (72, 2), 'Biquintile': (144, 2),
+}
+MAJOR_ASPECTS = ['Conjunction', 'Opposition', 'Trine', 'Square', 'Sextile']
+ASPECT_NAMES = list(ALL_ASPECTS_DEF)
+ASPECT_IDS = {name: i for i, name in enumerate(ASPECT_NAMES)}
+
+# i, j: point indices into the first and second point lists; aspect: index into ASPECT_NAMES;
+# applying: 1 applying, 0 separating, -1 unknown (no speeds given).
+ASPECT_DTYPE = np.dtype([
+    ('i', np.int16), ('j', np.int16), ('aspect', np.int8), ('orb', np.float64), ('applying', np.int8),
+])
+
+
+class Aspect:
+    """One aspect between point `p1` of the first point list and point `p2` of the second.
+
+    Points are referenced by index so records stay small; names are resolved at render time.
+    `orb` is the exact (unrounded) orb in degrees; `applying` is True/False, or None when
+    the point speeds were not available.
+    """
+
+    __slots__ = ('p1', 'p2', 'aspect', 'orb', 'applying')
+
+    def __init__(self, p1, p2, aspect, orb, applying=None):
+        self.p1 = p1
+        self.p2 = p2
+        self.aspect = aspect
+        self.orb = orb
+        self.applying = applying
+
+    @property
+    def name(self):
+        return ASPECT_NAMES[self.aspect]
+
+    @classmethod
+    def from_records(cls, records):
+        """Converts an ASPECT_DTYPE array from find_aspects() into Aspect objects."""
+        return [
+            cls(i, j, aspect, orb, None if applying < 0 else bool(applying))
+            for i, j, aspect, orb, applying in records.tolist()
+        ]
+
+    def to_row(self):
+        return [self.p1, self.p2, self.aspect, self.orb, self.applying]
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(*row)
+
+    def to_dict(self, names1, names2=None):
+        """JSON-friendly form with point names resolved; `names2` defaults to `names1`."""
+        return {
+            'p1': names1[self.p1],
+            'p2': (names2 or names1)[self.p2],
+            'aspect': self.name,
+            'orb': self.orb,
+            'applying': self.applying,
+        }
+
+    def __repr__(self):
+        return f"Aspect({self.p1}, {self.p2}, {self.name}, orb={self.orb:.4f}, applying={self.applying})"
+
+
+def select_aspects(selected_aspects=None):
+    """Returns {aspect name: (angle, orb)}: the major aspects plus any selected minor ones.
+
+    The dict is shared between calls with the same selection; treat it as read-only.
+    """
+    minor = tuple(
+        name for name, is_selected in (selected_aspects or {}).items()
+        if is_selected and name in ALL_ASPECTS_DEF and name not in MAJOR_ASPECTS
+    )
+    return _aspect_selection(minor)
+
+
+@lru_cache(maxsize=256)
+def _aspect_selection(minor):
+    aspects_to_calculate = {name: ALL_ASPECTS_DEF[name] for name in MAJOR_ASPECTS}
+    for aspect_name in minor:
+        aspects_to_calculate.setdefault(aspect_name, ALL_ASPECTS_DEF[aspect_name])
+    return aspects_to_calculate
+
+
+def separation_matrix(lons1, lons2):
+    """Shortest angular distance (0-180) between every pair of longitudes."""
+    angle = np.abs(np.asarray(lons1, dtype=np.float64)[:, None] - np.asarray(lons2, dtype=np.float64)[None, :])
+    return np.where(angle > 180, 360 - angle, angle)
+
+
+_SENSITIVE = frozenset(SENSITIVE_POINTS)
+_MINOR = frozenset(MINOR_POINTS)
+
+
+def _flags(names, group):
+    # Set lookups; np.isin on short string lists costs far more than the aspect search.
+    return np.fromiter((name in group for name in names), dtype=bool, count=len(names))
+
+
+def _mirrored(names):
+    shown = set(names)
+    return np.fromiter((OPPOSITE_POINTS.get(name) in shown for name in names), dtype=bool, count=len(names))
+
+
+def sensitive_mask(names1, names2, skip1=False, skip2=False):
+    """Pairs allowed to form aspects under the ASC/MC and minor point rules.
+
+    Pairs of two sensitive points (ASC-MC, ASC-Vertex, ...) and pairs of two minor
+    points never count, and neither does a South Node listed with its North Node.
+    `skip1`/`skip2` drop the sensitive points of that side entirely (used when that
+    chart's birth time is unknown).
+    """
+    sensitive1 = _flags(names1, _SENSITIVE)
+    sensitive2 = _flags(names2, _SENSITIVE)
+    mask = ~(sensitive1[:, None] & sensitive2[None, :])
+    mask &= ~(_flags(names1, _MINOR)[:, None] & _flags(names2, _MINOR)[None, :])
+    mask &= ~(_mirrored(names1)[:, None] | _mirrored(names2)[None, :])
+    if skip1:
+        mask &= ~sensitive1[:, None]
+    if skip2:
+        mask &= ~sensitive2[None, :]
+    return mask
+
+
+def find_aspects(lons1, aspects_to_calculate, lons2=None, pair_mask=None, speeds1=None, speeds2=None,
+                 orb_factors1=None, orb_factors2=None):
+    """Finds every aspect between two point sets, sorted by exact orb.
+
+    With `lons2` omitted the points are compared with themselves and only the upper
+    triangle (i < j) is searched. `pair_mask` (n x m booleans) excludes pairs.
+    `orb_factors1`/`orb_factors2` scale the orbs per point; a pair uses the smaller factor.
+    When daily speeds are given (`speeds1`, plus `speeds2` for a second set) each
+    record is marked applying or separating.
+    Returns an ASPECT_DTYPE array; ties keep (i, j, aspect) order.
+    """
+    natal = lons2 is None
+    lons1 = np.asarray(lons1, dtype=np.float64)
+    lons2 = lons1 if natal else np.asarray(lons2, dtype=np.float64)
+    separations = separation_matrix(lons1, lons2)
+    names = list(aspects_to_calculate)
+    angles = np.array([aspects_to_calculate[name][0] for name in names], dtype=np.float64)
+    orbs = np.array([aspects_to_calculate[name][1] for name in names], dtype=np.float64)
+
+    deviation = np.abs(separations[:, :, None] - angles)
+    if orb_factors1 is not None or (orb_factors2 is not None and not natal):
+        factors1 = np.ones(len(lons1)) if orb_factors1 is None else np.asarray(orb_factors1, dtype=np.float64)
+        factors2 = factors1 if natal else np.ones(len(lons2)) if orb_factors2 is None else np.asarray(orb_factors2)
+        orbs = np.minimum(factors1[:, None], factors2[None, :])[:, :, None] * orbs
+    hits = deviation <= orbs
+    if natal:
+        hits &= np.triu(np.ones(separations.shape, dtype=bool), k=1)[:, :, None]
+    if pair_mask is not None:
+        hits &= pair_mask[:, :, None]
+
+    i, j, k = np.nonzero(hits)
+    records = np.empty(len(i), dtype=ASPECT_DTYPE)
+    records['i'] = i
+    records['j'] = j
+    records['aspect'] = np.array([ASPECT_IDS[name] for name in names], dtype=np.int8)[k] if len(k) else k
+    records['orb'] = deviation[i, j, k]
+    records['applying'] = -1
+    if speeds1 is not None and (natal or speeds2 is not None):
+        speeds1 = np.asarray(speeds1, dtype=np.float64)
+        speeds2 = speeds1 if natal else np.asarray(speeds2, dtype=np.float64)
+        # Signed separation in (-180, 180]; the orb shrinks when |separation - angle| decreases.
+        signed = (lons1[i] - lons2[j] + 180) % 360 - 180
+        separation_rate = np.sign(signed) * (speeds1[i] - speeds2[j])
+        orb_rate = np.sign(separations[i, j] - angles[k]) * separation_rate
+        records['applying'] = orb_rate < 0
+    return records[np.argsort(records['orb'], kind='stable')]
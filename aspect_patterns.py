@@ -0,0 +1,210 @@
+from itertools import combinations
+from aspect_engine import ASPECT_NAMES, find_aspects
+from points import PATTERN_POINTS, orb_factors
+
+# --- Complex aspect (pattern) detection on an aspect graph ---
+# Pairwise aspects are computed once into adjacency sets (aspect name -> point -> neighbours).
+# Each pattern is then found by intersecting neighbour sets instead of testing every
+# triple/quadruple of points, so the cost follows the number of aspects, not n^3 or n^4.
+
+
+class AspectGraph:
+    """Undirected graph of the aspects between chart points, one edge set per aspect type."""
+
+    def __init__(self, names, lons, aspects_to_calculate):
+        self.names = names
+        self.adjacency = {aspect_name: [set() for _ in names] for aspect_name in aspects_to_calculate}
+        records = find_aspects(lons, aspects_to_calculate, orb_factors1=orb_factors(names))
+        for i, j, aspect in zip(records['i'].tolist(), records['j'].tolist(), records['aspect'].tolist()):
+            neighbours = self.adjacency[ASPECT_NAMES[aspect]]
+            neighbours[i].add(j)
+            neighbours[j].add(i)
+
+    def neighbours(self, aspect_name, i):
+        """Returns the set of points forming `aspect_name` with point i (empty if not calculated)."""
+        adjacency = self.adjacency.get(aspect_name)
+        return adjacency[i] if adjacency else set()
+
+    def edges(self, aspect_name):
+        """Yields each (i, j) pair with i < j that forms `aspect_name`."""
+        for i, neighbours in enumerate(self.adjacency.get(aspect_name, [])):
+            for j in sorted(neighbours):
+                if i < j:
+                    yield i, j
+
+    def has(self, aspect_name, i, j):
+        return j in self.neighbours(aspect_name, i)
+
+
+def _pattern(pattern_type, names, indices, aspects, apex=None):
+    result = {'type': pattern_type, 'planets': [names[i] for i in indices]}
+    if apex is not None:
+        result['apex_planet'] = names[apex]
+    result['aspects'] = aspects
+    return result
+
+
+def _find_yods(g):
+    n = g.names
+    found = []
+    for a, b in g.edges('Sextile'):
+        for apex in g.neighbours('Quincunx', a) & g.neighbours('Quincunx', b):
+            found.append((sorted((a, b, apex)), _pattern('YOD', n, [a, b, apex], [
+                f"{n[a]} Sextile {n[b]}",
+                f"{n[apex]} Quincunx {n[a]}",
+                f"{n[apex]} Quincunx {n[b]}",
+            ], apex=apex)))
+    return found
+
+
+def _find_cradles(g):
+    n = g.names
+    found = []
+    for a, b in g.edges('Opposition'):
+        supports = (g.neighbours('Trine', a) & g.neighbours('Sextile', b)) | \
+                   (g.neighbours('Sextile', a) & g.neighbours('Trine', b))
+        for c, d in combinations(sorted(supports), 2):
+            found.append(([a, b, c, d], _pattern('Cradle', n, [a, b, c, d], [
+                f"{n[a]} Opposition {n[b]}",
+                f"{n[c]} Trine/Sextile to {n[a]} and {n[b]}",
+                f"{n[d]} Trine/Sextile to {n[a]} and {n[b]}",
+            ])))
+    return found
+
+
+def _find_grand_trines(g):
+    n = g.names
+    found = []
+    for a, b in g.edges('Trine'):
+        for c in sorted(g.neighbours('Trine', a) & g.neighbours('Trine', b)):
+            if c > b:
+                found.append(([a, b, c], _pattern('Grand Trine', n, [a, b, c], [
+                    f"{n[a]} Trine {n[b]}",
+                    f"{n[b]} Trine {n[c]}",
+                    f"{n[a]} Trine {n[c]}",
+                ])))
+    return found
+
+
+def _find_t_squares(g):
+    n = g.names
+    found = []
+    for a, b in g.edges('Opposition'):
+        for apex in sorted(g.neighbours('Square', a) & g.neighbours('Square', b)):
+            found.append(([a, b, apex], _pattern('T-Square', n, [a, b, apex], [
+                f"{n[a]} Opposition {n[b]}",
+                f"{n[apex]} Square {n[a]}",
+                f"{n[apex]} Square {n[b]}",
+            ], apex=apex)))
+    return found
+
+
+def _find_grand_crosses(g):
+    n = g.names
+    found = []
+    for a, b in g.edges('Opposition'):
+        squares = g.neighbours('Square', a) & g.neighbours('Square', b)
+        for c in sorted(squares):
+            for d in sorted(g.neighbours('Opposition', c) & squares):
+                # Each cross has two opposition edges; report it from the lower one only.
+                if (a, b) < tuple(sorted((c, d))) and c < d:
+                    found.append(([a, b, c, d], _pattern('Grand Cross', n, [a, b, c, d], [
+                        f"{n[a]} Opposition {n[b]}",
+                        f"{n[c]} Opposition {n[d]}",
+                        f"{n[c]} and {n[d]} Square {n[a]} and {n[b]}",
+                    ])))
+    return found
+
+
+def _find_kites(g, grand_trines):
+    n = g.names
+    found = []
+    for indices, _ in grand_trines:
+        for head in indices:
+            base = [i for i in indices if i != head]
+            for tail in sorted(g.neighbours('Opposition', head)):
+                if all(g.has('Sextile', tail, i) for i in base):
+                    found.append((indices + [tail], _pattern('Kite', n, indices + [tail], [
+                        f"Grand Trine {' '.join(n[i] for i in indices)}",
+                        f"{n[tail]} Opposition {n[head]}",
+                        f"{n[tail]} Sextile {n[base[0]]} and {n[base[1]]}",
+                    ])))
+    return found
+
+
+def _find_mystic_rectangles(g):
+    n = g.names
+    found = []
+    oppositions = list(g.edges('Opposition'))
+    for (a, b), (c, d) in combinations(oppositions, 2):
+        for x, y in ((c, d), (d, c)):
+            if g.has('Trine', a, x) and g.has('Sextile', a, y) and \
+               g.has('Sextile', b, x) and g.has('Trine', b, y):
+                found.append(([a, b, c, d], _pattern('Mystic Rectangle', n, [a, b, c, d], [
+                    f"{n[a]} Opposition {n[b]}",
+                    f"{n[c]} Opposition {n[d]}",
+                    f"{n[a]} Trine {n[x]}, {n[b]} Trine {n[y]}",
+                    f"{n[a]} Sextile {n[y]}, {n[b]} Sextile {n[x]}",
+                ])))
+                break
+    return found
+
+
+def _find_stelliums(g):
+    """Stellium: a maximal group of three or more points that are all mutually conjunct."""
+    n = g.names
+    found = []
+    adjacency = g.adjacency.get('Conjunction')
+    if not adjacency:
+        return found
+
+    def expand(clique, candidates, excluded):
+        # Bron-Kerbosch with pivoting over the conjunction graph.
+        if not candidates and not excluded:
+            if len(clique) >= 3:
+                indices = sorted(clique)
+                found.append((indices, _pattern('Stellium', n, indices, [
+                    f"{n[i]} Conjunction {n[j]}" for i, j in combinations(indices, 2)
+                ])))
+            return
+        pivot = max(candidates | excluded, key=lambda v: len(adjacency[v]))
+        for v in sorted(candidates - adjacency[pivot]):
+            expand(clique | {v}, candidates & adjacency[v], excluded & adjacency[v])
+            candidates = candidates - {v}
+            excluded = excluded | {v}
+
+    expand(set(), set(range(len(n))), set())
+    return found
+
+
+def detect_complex_aspects(chart_points, aspects_to_calculate):
+    """Finds multi-point aspect patterns among the chart's planets and asteroids.
+
+    Angles, nodes, lots and the other derived points are left out: the nodal axis alone
+    would turn every planet square to it into a T-square.
+
+    Patterns only use aspect types present in `aspects_to_calculate`, so e.g. YODs are
+    reported only when Quincunx is selected.
+    """
+    filtered_chart_points = [p for p in chart_points if p['name'] in PATTERN_POINTS]
+    g = AspectGraph(
+        [p['name'] for p in filtered_chart_points],
+        [p['lon'] for p in filtered_chart_points],
+        aspects_to_calculate,
+    )
+
+    grand_trines = _find_grand_trines(g)
+    complex_aspects = []
+    for found in (
+        _find_yods(g),
+        _find_cradles(g),
+        grand_trines,
+        _find_kites(g, grand_trines),
+        _find_t_squares(g),
+        _find_grand_crosses(g),
+        _find_mystic_rectangles(g),
+        _find_stelliums(g),
+    ):
+        found.sort(key=lambda item: item[0])
+        complex_aspects.extend(pattern for _, pattern in found)
+    return complex_aspects
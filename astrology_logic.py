@@ -1,145 +1,30 @@
 import swisseph as swe
-import os
-import sys
-import requests
+from collections.abc import Mapping
+from aspect_engine import Aspect, find_aspects, select_aspects, sensitive_mask
+from aspect_patterns import detect_complex_aspects
+from metrics import stage
+from timezones import format_offset, timezone_name_at, to_utc
+from zodiac import ZODIACS, ayanamsa, frame_shift
+from chart_cache import MARKDOWN_MAX_CHARS, chart_key, chart_results, content_key, markdown_results
+from points import DEFAULT_POINT_SET, PLANET_IDS, POINT_OPTIONS, compute_points, expand_points, orb_factors  # noqa: F401 (PLANET_IDS re-exported)
+from houses import HOUSE_SYSTEMS, HouseIndex, get_house_for_point, house_cusps  # noqa: F401 (re-exported)
+from render import chart_to_json, format_aspect_string, get_renderer  # noqa: F401 (re-exported)
+
+HOUSE_SYSTEM = 'P'  # Placidus
+DEFAULT_HOUSE_SYSTEMS = ['placidus']
+DEFAULT_ZODIACS = ['tropical']
+
+# Optional chart sections; 'points' is always present. Without 'houses' the points are the
+# planets alone, so neither swe.houses nor the aspect passes run for a positions-only chart.
+SECTIONS = ['points', 'houses', 'aspects', 'patterns']
 
 # --- Core Calculation and Markdown Generation Logic ---
-def format_aspect_string(p1_name, p2_name, aspect_name, orb):
-    """Formats the aspect string with special handling for MC/ASC oppositions."""
-    # Handle MC/IC
-    if aspect_name == 'Opposition' and p2_name == 'MC':
-        return f"{p1_name} Conjunction IC (Orb: {orb:.2f}°)"
-    if aspect_name == 'Opposition' and p1_name == 'MC':
-        return f"{p2_name} Conjunction IC (Orb: {orb:.2f}°)"
-    # Handle ASC/DSC
-    if aspect_name == 'Opposition' and p2_name == 'ASC':
-        return f"{p1_name} Conjunction DSC (Orb: {orb:.2f}°)"
-    if aspect_name == 'Opposition' and p1_name == 'ASC':
-        return f"{p2_name} Conjunction DSC (Orb: {orb:.2f}°)"
-    
-    # Default formatting
-    return f"{p1_name} {aspect_name} {p2_name} (Orb: {orb:.2f}°)"
-
-def get_house_for_point(point_lon, house_cusps):
-    """Determines the house number (1-12) for a given point longitude."""
-    for i in range(12):
-        cusp_start = house_cusps[i]
-        cusp_end = house_cusps[(i + 1) % 12]
-
-        if cusp_start < cusp_end:
-            if cusp_start <= point_lon < cusp_end:
-                return i + 1
-        else:
-            if point_lon >= cusp_start or point_lon < cusp_end:
-                return i + 1
-    return None
-
-def detect_complex_aspects(chart_points, aspects_to_calculate):
-    complex_aspects = []
-    
-    filtered_chart_points = [p for p in chart_points if p['name'] not in ['ASC', 'MC']]
-    
-    def has_aspect(p1_name, p2_name, target_aspect_name, orb_tolerance=None):
-        for i in range(len(chart_points)):
-            if chart_points[i]['name'] == p1_name:
-                point1 = chart_points[i]
-                break
-        else:
-            return False
-
-        for i in range(len(chart_points)):
-            if chart_points[i]['name'] == p2_name:
-                point2 = chart_points[i]
-                break
-        else:
-            return False
-
-        angle = abs(point1['lon'] - point2['lon'])
-        if angle > 180: angle = 360 - angle
-
-        for aspect_name, (aspect_angle, orb) in aspects_to_calculate.items():
-            if aspect_name == target_aspect_name:
-                current_orb = orb_tolerance if orb_tolerance is not None else orb
-                if abs(angle - aspect_angle) <= current_orb:
-                    return True
-        return False
-
-    # YOD detection
-    for i in range(len(filtered_chart_points)):
-        for j in range(i + 1, len(filtered_chart_points)):
-            for k in range(j + 1, len(filtered_chart_points)):
-                p1 = filtered_chart_points[i]
-                p2 = filtered_chart_points[j]
-                p3 = filtered_chart_points[k]
-
-                if has_aspect(p1['name'], p2['name'], 'Sextile') and \
-                   has_aspect(p3['name'], p1['name'], 'Quincunx') and \
-                   has_aspect(p3['name'], p2['name'], 'Quincunx'):
-                    complex_aspects.append({
-                        'type': 'YOD',
-                        'planets': [p1['name'], p2['name'], p3['name']],
-                        'apex_planet': p3['name'],
-                        'aspects': [
-                            f"{p1['name']} Sextile {p2['name']}",
-                            f"{p3['name']} Quincunx {p1['name']}",
-                            f"{p3['name']} Quincunx {p2['name']}"
-                        ]
-                    })
-                elif has_aspect(p1['name'], p3['name'], 'Sextile') and \
-                     has_aspect(p2['name'], p1['name'], 'Quincunx') and \
-                     has_aspect(p2['name'], p3['name'], 'Quincunx'):
-                    complex_aspects.append({
-                        'type': 'YOD',
-                        'planets': [p1['name'], p3['name'], p2['name']],
-                        'apex_planet': p2['name'],
-                        'aspects': [
-                            f"{p1['name']} Sextile {p3['name']}",
-                            f"{p2['name']} Quincunx {p1['name']}",
-                            f"{p2['name']} Quincunx {p3['name']}"
-                        ]
-                    })
-                elif has_aspect(p2['name'], p3['name'], 'Sextile') and \
-                     has_aspect(p1['name'], p2['name'], 'Quincunx') and \
-                     has_aspect(p1['name'], p3['name'], 'Quincunx'):
-                    complex_aspects.append({
-                        'type': 'YOD',
-                        'planets': [p2['name'], p3['name'], p1['name']],
-                        'apex_planet': p1['name'],
-                        'aspects': [
-                            f"{p2['name']} Sextile {p3['name']}",
-                            f"{p1['name']} Quincunx {p2['name']}",
-                            f"{p1['name']} Quincunx {p3['name']}"
-                        ]
-                    })
-    
-    # Cradle detection
-    for i in range(len(filtered_chart_points)):
-        for j in range(i + 1, len(filtered_chart_points)):
-            for k in range(j + 1, len(filtered_chart_points)):
-                for l in range(k + 1, len(filtered_chart_points)):
-                    p1 = filtered_chart_points[i]
-                    p2 = filtered_chart_points[j]
-                    p3 = filtered_chart_points[k]
-                    p4 = filtered_chart_points[l]
-
-                    if has_aspect(p1['name'], p2['name'], 'Opposition'):
-                        if (has_aspect(p3['name'], p1['name'], 'Trine') and has_aspect(p3['name'], p2['name'], 'Sextile')) or \
-                           (has_aspect(p3['name'], p1['name'], 'Sextile') and has_aspect(p3['name'], p2['name'], 'Trine')):
-                            if (has_aspect(p4['name'], p2['name'], 'Trine') and has_aspect(p4['name'], p1['name'], 'Sextile')) or \
-                               (has_aspect(p4['name'], p2['name'], 'Sextile') and has_aspect(p4['name'], p1['name'], 'Trine')):
-                                complex_aspects.append({
-                                    'type': 'Cradle',
-                                    'planets': [p1['name'], p2['name'], p3['name'], p4['name']],
-                                    'aspects': [
-                                        f"{p1['name']} Opposition {p2['name']}",
-                                        f"{p3['name']} Trine/Sextile to {p1['name']} and {p2['name']}",
-                                        f"{p4['name']} Trine/Sextile to {p1['name']} and {p2['name']}"
-                                    ]
-                                })
-    return complex_aspects
-
-def calculate_chart(birth_data, selected_aspects=None):
-    """Calculates all astrological points for a single birth data object."""
+def calculate_chart(birth_data, selected_aspects=None, sections=None):
+    """Calculates all astrological points for a single birth data object.
+
+    Returns a Chart, which reads like a dict but computes each section on first access.
+    `sections` (a list or comma-separated string of SECTIONS names) limits what it holds.
+    """
     try:
         # Coalesce None to empty string to support optional name
         name = (birth_data.get('name') or '').strip()
@@ -152,266 +37,290 @@ def calculate_chart(birth_data, selected_aspects=None):
         lat = float(birth_data['lat'])
         lon = float(birth_data['lon'])
         location_name = birth_data.get('location_name', f"Lat {lat}, Lon {lon}")
+        house_systems, zodiacs, sections, points = chart_options(birth_data, sections)
     except (ValueError, TypeError) as e:
         raise ValueError(f"Invalid or missing data for chart '{name}': {e}")
 
-    hour_jst = hour + minute / 60
-    hour_ut = hour_jst - 9
-    jd = swe.julday(year, month, day, hour_ut)
+    # Local birth time -> UTC using the zone at the birth place (or an explicit IANA name).
+    tz_name = birth_data.get('timezone') or timezone_name_at(lat, lon)
+    try:
+        utc, utc_offset, tz_label = to_utc(year, month, day, hour, minute, tz_name)
+    except ValueError as e:
+        raise ValueError(f"Invalid or missing data for chart '{name}': {e}")
+    jd = swe.julday(utc.year, utc.month, utc.day, utc.hour + utc.minute / 60 + utc.second / 3600)
 
-    planet_ids = {
-        "Sun": swe.SUN, "Moon": swe.MOON, "Mercury": swe.MERCURY, "Venus": swe.VENUS,
-        "Mars": swe.MARS, "Jupiter": swe.JUPITER, "Saturn": swe.SATURN,
-        "Uranus": swe.URANUS, "Neptune": swe.NEPTUNE, "Pluto": swe.PLUTO,
-    }
-    
-    chart_points = []
-    for planet_name, planet_id in planet_ids.items():
-        result = swe.calc_ut(jd, planet_id)
-        if result:
-            lon_val = result[0][0] if isinstance(result[0], (list, tuple)) else result[0]
-            chart_points.append({'name': planet_name, 'lon': lon_val})
-
-    houses, ascmc = swe.houses(jd, lat, lon, b'P')
-    chart_points.append({'name': 'ASC', 'lon': ascmc[0]})
-    chart_points.append({'name': 'MC', 'lon': ascmc[1]})
-
-    all_aspects_def = {
-        'Conjunction': (0, 8), 'Opposition': (180, 8), 'Trine': (120, 7),
-        'Square': (90, 7), 'Sextile': (60, 5),
-        'Quincunx': (150, 2), 'Semisextile': (30, 2), 'Semisquare': (45, 2),
-        'Sesquiquadrate': (135, 2), 'Quintile': (72, 2), 'Biquintile': (144, 2),
-    }
-    
-    aspects_to_calculate = {}
-    for aspect_name in ['Conjunction', 'Opposition', 'Trine', 'Square', 'Sextile']:
-        if aspect_name in all_aspects_def:
-            aspects_to_calculate[aspect_name] = all_aspects_def[aspect_name]
-
-    if selected_aspects:
-        for aspect_name, is_selected in selected_aspects.items():
-            if is_selected and aspect_name not in aspects_to_calculate and aspect_name in all_aspects_def:
-                aspects_to_calculate[aspect_name] = all_aspects_def[aspect_name]
-    
-    found_aspects = []
-    sensitive_points = ['ASC', 'MC']
-    for i in range(len(chart_points)):
-        for j in range(i + 1, len(chart_points)):
-            p1, p2 = chart_points[i], chart_points[j]
-
-            # If birth time is unknown, avoid aspects involving ASC/MC entirely.
-            # Otherwise, only skip ASC-MC pair aspects as before.
-            if time_unknown:
-                if p1['name'] in sensitive_points or p2['name'] in sensitive_points:
-                    continue
-            else:
-                if p1['name'] in sensitive_points and p2['name'] in sensitive_points:
-                    continue
-
-            angle = abs(p1['lon'] - p2['lon'])
-            if angle > 180: angle = 360 - angle
-            for aspect_name, (aspect_angle, orb) in aspects_to_calculate.items():
-                if abs(angle - aspect_angle) <= orb:
-                    exact_orb = abs(angle - aspect_angle)
-                    aspect_str = format_aspect_string(p1['name'], p2['name'], aspect_name, exact_orb)
-                    found_aspects.append(aspect_str)
-    if found_aspects:
-        found_aspects.sort(key=lambda x: float(x.split('(Orb: ')[1][:-2]))
-
-    complex_aspects = detect_complex_aspects(chart_points, aspects_to_calculate)
-
-    return {
+    metadata = {
         "name": name,
-        "date_str": f"{year}-{month:02d}-{day:02d} {hour:02d}:{minute:02d} JST",
+        "date_str": f"{year}-{month:02d}-{day:02d} {hour:02d}:{minute:02d} {tz_label}",
         "location_str": f"{location_name} (Lat: {lat:.4f}, Lon: {lon:.4f})",
-        "points": chart_points,
-        "houses": list(houses),
-        "aspects": found_aspects,
-        "complex_aspects": complex_aspects,
+        "timezone": tz_name,
+        "utc_offset": format_offset(utc_offset),
+        # The first house system and zodiac are the chart's own; the rest ride along as variants.
+        "house_system": house_systems[0],
+        "zodiac": zodiacs[0],
+        "ayanamsa": ayanamsa(jd, zodiacs[0]),
         "time_unknown": time_unknown,
     }
+    return Chart(metadata, jd, lat, lon, select_aspects(selected_aspects), house_systems, zodiacs, sections, points)
+
+def chart_options(birth_data, sections=None):
+    """(house_systems, zodiacs, sections, points) for calculate_chart(); unknown names raise ValueError.
+
+    Routes call this before geocoding, so a bad option is a 400 rather than a failed calculation.
+    """
+    house_systems = _option_list(birth_data.get('house_systems'), HOUSE_SYSTEMS, DEFAULT_HOUSE_SYSTEMS, 'house system')
+    zodiacs = _option_list(birth_data.get('zodiacs'), ZODIACS, DEFAULT_ZODIACS, 'zodiac')
+    sections = _option_list(sections, SECTIONS, SECTIONS, 'section')
+    points = resolve_points(birth_data.get('point_set'))
+    return house_systems, zodiacs, sections, points
+
+def _option_list(value, known, default, kind):
+    """Normalizes a list (or comma-separated string) of option names; unknown names raise ValueError."""
+    if isinstance(value, str):
+        value = value.split(',')
+    names = []
+    for item in value or []:
+        item = str(item).strip().lower().replace(' ', '_').replace('-', '_')
+        if not item:
+            continue
+        if item not in known:
+            raise ValueError(f"Unknown {kind}: {item} (expected one of {', '.join(known)})")
+        if item not in names:
+            names.append(item)
+    return names or list(default)
+
+def resolve_points(point_set=None):
+    """Catalogue ids for a point_set value (point set and point ids; default 'classic')."""
+    return expand_points(_option_list(point_set, POINT_OPTIONS, DEFAULT_POINT_SET, 'point'))
+
+class Chart(Mapping):
+    """A calculated chart whose sections are computed on first access and then kept.
+
+    Reads like the dict calculate_chart() used to return. Keys of sections that were not
+    requested are absent. Each section is cached on its own (chart_results), so identical
+    birth data (examples, a resubmitted synastry chart 1) is only calculated once.
+    """
+    # Chart keys provided by each section, in addition to the metadata.
+    SECTION_KEYS = {
+        'points': ('points',),
+        'houses': ('houses', 'house_index', 'variants'),
+        'aspects': ('aspects',),
+        'patterns': ('complex_aspects',),
+    }
+
+    def __init__(self, metadata, jd, lat, lon, aspects_to_calculate, house_systems, zodiacs, sections, points):
+        self.jd = jd
+        self.lat = lat
+        self.lon = lon
+        self.aspects_to_calculate = aspects_to_calculate
+        self.house_systems = house_systems
+        self.zodiacs = zodiacs
+        self.sections = [name for name in SECTIONS if name == 'points' or name in sections]
+        self.points = points  # catalogue ids
+        # Angles and lots are points only when houses are requested (they need swe.houses).
+        self.with_angles = 'houses' in self.sections
+        self._key = chart_key(jd, lat, lon, metadata['time_unknown'], HOUSE_SYSTEM, aspects_to_calculate, points)
+        self._data = dict(metadata)
+        self._pending = {key: name for name in self.sections for key in self.SECTION_KEYS[name]}
+        self._frames = {}
+
+    def __getitem__(self, key):
+        if key not in self._data:
+            section = self._pending.get(key)
+            if section is None:
+                raise KeyError(key)
+            self._data.update(getattr(self, '_load_' + section)())
+            for loaded in self.SECTION_KEYS[section]:
+                del self._pending[loaded]
+        return self._data[key]
+
+    def __contains__(self, key):
+        return key in self._data or key in self._pending
+
+    def __iter__(self):
+        yield from self._data
+        yield from list(self._pending)
+
+    def __len__(self):
+        return len(self._data) + len(self._pending)
+
+    def __repr__(self):
+        return f"<Chart {self._data['name']!r} {self._data['date_str']} sections={self.sections}>"
+
+    def load(self, *sections):
+        """Computes the given sections (default: all requested) now; returns the chart."""
+        for name in sections or self.sections:
+            if name in self.sections:
+                self[self.SECTION_KEYS[name][0]]
+        return self
+
+    def _cached(self, part, compute):
+        scope = 'full' if self.with_angles else 'planets'
+        return chart_results.get_or_compute(f"{self._key}/{scope}/{part}", compute)
+
+    def _core(self):
+        """Tropical points (and Placidus cusps with the angles), shared by every section."""
+        return self._cached('ephemeris', self._compute_ephemeris)
+
+    def _compute_ephemeris(self):
+        with stage('ephemeris'):
+            if not self.with_angles:
+                return {'points': compute_points(self.jd, self.points)}
+            houses, ascmc, _, ascmc_speed = swe.houses_ex2(self.jd, self.lat, self.lon, HOUSE_SYSTEM.encode('ascii'))
+            return {'points': compute_points(self.jd, self.points, ascmc, ascmc_speed), 'houses': list(houses)}
+
+    def _frame(self, zodiac):
+        """(ayanamsa, points) in `zodiac`: sidereal points are the tropical ones shifted back."""
+        if zodiac not in self._frames:
+            shift = self._data['ayanamsa'] if zodiac == self.zodiacs[0] else ayanamsa(self.jd, zodiac)
+            points = self._core()['points']
+            if shift:
+                points = [dict(p, lon=(p['lon'] - shift) % 360) for p in points]
+            self._frames[zodiac] = (shift, points)
+        return self._frames[zodiac]
+
+    def _cusps(self, system, shift):
+        if not shift and HOUSE_SYSTEMS[system] == HOUSE_SYSTEM:
+            return self._core()['houses']
+        return house_cusps(self.jd, self.lat, self.lon, system, shift)
+
+    def _load_points(self):
+        return {'points': self._frame(self.zodiacs[0])[1]}
+
+    def _load_houses(self):
+        """The chart's own cusps plus every requested (zodiac, house system) variant.
+
+        Sidereal positions are the tropical ones shifted by the ayanamsa and each extra
+        house system is a single swe.houses call. Without a birth time houses are not
+        shown, so there is one variant per zodiac and no cusps are calculated for them.
+        """
+        houses = self._cusps(self.house_systems[0], self._data['ayanamsa'])
+        house_index = HouseIndex(houses)
+        variants = []
+        for zodiac in self.zodiacs:
+            shift, points = self._frame(zodiac)
+            for system in self.house_systems:
+                variant = {'zodiac': zodiac, 'house_system': system, 'ayanamsa': shift, 'points': points,
+                           'houses': None, 'house_index': None}
+                if self._data['time_unknown']:
+                    variants.append(variant)
+                    break
+                if variants:
+                    variant['houses'] = self._cusps(system, shift)
+                    variant['house_index'] = HouseIndex(variant['houses'])
+                else:
+                    variant['houses'], variant['house_index'] = houses, house_index
+                variants.append(variant)
+        return {'houses': houses, 'house_index': house_index, 'variants': variants}
+
+    # The ephemeris is resolved before the aspects or patterns fill starts: a fill holds
+    # its key's lock (a flock with the shared tier), and waiting there for the ephemeris
+    # key's lock could stall on a shared lock stripe or another worker.
+    def _load_aspects(self):
+        points = self._core()['points']
+        return self._cached('aspects', lambda: self._compute_aspects(points))
+
+    def _compute_aspects(self, points):
+        # If birth time is unknown, avoid aspects involving ASC/MC (and the other sensitive
+        # points) entirely. Otherwise, only skip ASC-MC pair aspects.
+        names = [p['name'] for p in points]
+        time_unknown = self._data['time_unknown']
+        with stage('aspects'):
+            records = find_aspects(
+                [p['lon'] for p in points], self.aspects_to_calculate,
+                pair_mask=sensitive_mask(names, names, time_unknown, time_unknown),
+                speeds1=[p['speed'] for p in points], orb_factors1=orb_factors(names),
+            )
+            return {'aspects': Aspect.from_records(records)}
+
+    def _load_patterns(self):
+        points = self._core()['points']
+        return self._cached('patterns', lambda: self._compute_patterns(points))
+
+    def _compute_patterns(self, points):
+        with stage('patterns'):
+            return {'complex_aspects': detect_complex_aspects(points, self.aspects_to_calculate)}
+
+def calculate_synastry_aspects(chart1, chart2, selected_aspects=None):
+    """Aspects between chart1's points (p1) and chart2's points (p2), sorted by exact orb."""
+    names1 = [p['name'] for p in chart1['points']]
+    names2 = [p['name'] for p in chart2['points']]
+    shift = frame_shift(chart1, chart2)
+    # Omit sensitive points entirely for a chart with unknown time; always skip ASC-MC pairs.
+    records = find_aspects(
+        [p['lon'] for p in chart1['points']], select_aspects(selected_aspects),
+        lons2=[(p['lon'] + shift) % 360 for p in chart2['points']],
+        pair_mask=sensitive_mask(names1, names2, chart1.get('time_unknown'), chart2.get('time_unknown')),
+        orb_factors1=orb_factors(names1), orb_factors2=orb_factors(names2),
+    )
+    return Aspect.from_records(records)
+
+def generate_horoscope_json(data1, selected_aspects1, data2=None, selected_aspects2=None, sections=None):
+    """Structured counterpart of generate_horoscope_markdown() for API callers.
+
+    `sections` limits the charts to those SECTIONS (e.g. 'points' for positions only).
+    """
+    chart1 = calculate_chart(data1, selected_aspects1, sections)
+    result = {'charts': [chart_to_json(chart1)]}
+    if data2:
+        chart2 = calculate_chart(data2, selected_aspects2, sections)
+        names1 = [p['name'] for p in chart1['points']]
+        names2 = [p['name'] for p in chart2['points']]
+        result['charts'].append(chart_to_json(chart2))
+        result['synastry_aspects'] = [
+            asp.to_dict(names1, names2) for asp in calculate_synastry_aspects(chart1, chart2, selected_aspects1)
+        ]
+    return result
+
+def iter_horoscope(output_format, data1, selected_aspects1, data2=None, selected_aspects2=None):
+    """Yields the rendered horoscope in chunks, using the renderer named by `output_format`.
+
+    The header is yielded before any calculation and chart 2 is only calculated after
+    chart 1 has been rendered, so a streaming response can start early. Unknown formats
+    raise ValueError immediately rather than on first iteration.
+    """
+    renderer = get_renderer(output_format)
+
+    def render(method, *args):
+        with stage('render'):
+            return method(*args)
+
+    def chunks():
+        yield from render(renderer.header, data1, data2)
+        # Sections are loaded before rendering so that their time is not counted as render time.
+        chart1 = calculate_chart(data1, selected_aspects1).load()
+        yield from render(renderer.chart, chart1, 1, bool(data2))
+        if data2:
+            chart2 = calculate_chart(data2, selected_aspects2).load()
+            yield from render(renderer.chart, chart2, 2, True)
+            with stage('synastry'):
+                synastry_aspects = calculate_synastry_aspects(chart1, chart2, selected_aspects1)
+            yield from render(renderer.synastry, chart1, chart2, synastry_aspects)
+        yield from render(renderer.footer)
+
+    return chunks()
+
+def iter_horoscope_markdown(data1, selected_aspects1, data2=None, selected_aspects2=None):
+    """Yields the Markdown document section by section; see iter_horoscope()."""
+    return iter_horoscope('markdown', data1, selected_aspects1, data2, selected_aspects2)
+
+def render_request_key(output_format, data1, selected_aspects1, data2=None, selected_aspects2=None):
+    return content_key('render/v1', output_format or 'markdown', data1, selected_aspects1, data2, selected_aspects2)
+
+def generate_horoscope(output_format, data1, selected_aspects1, data2=None, selected_aspects2=None):
+    """Renders the whole document in one string, cached per request; see iter_horoscope()."""
+    request_key = render_request_key(output_format, data1, selected_aspects1, data2, selected_aspects2)
+    return markdown_results.get_or_compute(
+        request_key,
+        lambda: "".join(iter_horoscope(output_format, data1, selected_aspects1, data2, selected_aspects2)),
+        cacheable=lambda document: len(document) <= MARKDOWN_MAX_CHARS,
+    )
 
 def generate_horoscope_markdown(data1, selected_aspects1, data2=None, selected_aspects2=None):
     """Calculates horoscope for one or two charts and returns a Markdown formatted string."""
     try:
-        # In a web context, ephe path should be set once at startup.
-        # base = os.path.dirname(os.path.abspath(__file__))
-        # swe.set_ephe_path(os.path.join(base, "ephe"))
-
-        chart1 = calculate_chart(data1, selected_aspects1)
-        chart2 = calculate_chart(data2, selected_aspects2) if data2 else None
-
-        signs = ["Aries","Taurus","Gemini","Cancer","Leo","Virgo","Libra","Scorpio","Sagittarius","Capricorn","Aquarius","Pisces"]
-        
-        def format_lon(plon, signs_list):
-            sign = signs_list[int(plon // 30)]
-            deg = int(plon % 30)
-            minute = int((plon % 1) * 60)
-            return f"{sign} {deg}°{minute:02d}'"
-
-        name1 = chart1['name'] or "Chart 1"
-        title = f"# Horoscope for {name1}"
-        if chart2:
-            name2 = chart2['name'] or "Chart 2"
-            title = f"# Synastry Chart: {name1} and {name2}"
-        
-        markdown_lines = [title]
-
-        # Add notes if any chart has unknown birth time
-        notes = []
-        if chart1 and chart1.get('time_unknown'):
-            notes.append("- 注記 (Chart 1): 出生時刻が未入力のため、ASC/MCを含むアスペクトは計算していません。")
-        if chart2 and chart2.get('time_unknown'):
-            notes.append("- 注記 (Chart 2): 出生時刻が未入力のため、ASC/MCを含むアスペクトは計算していません。")
-        if notes:
-            markdown_lines.append("\n> 注意\n")
-            markdown_lines.extend([f"> {n}" for n in notes])
-
-        charts_to_process = [chart1]
-        if chart2: charts_to_process.append(chart2)
-
-        for i, chart_data in enumerate(charts_to_process):
-            chart_name = chart_data['name'] or f"Chart {i+1}"
-            if len(charts_to_process) > 1:
-                 markdown_lines.append("\n---\n")
-                 markdown_lines.append(f"## {chart_name}")
-
-            markdown_lines.append(f"- **Date:** {chart_data['date_str']}")
-            markdown_lines.append(f"- **Location:** {chart_data['location_str']}")
-            markdown_lines.append("\n### Planets and Points")
-            if chart_data.get('time_unknown'):
-                markdown_lines.append("| Name      | Position           |")
-                markdown_lines.append("| :-------- | :----------------- |")
-                for point in chart_data['points']:
-                    markdown_lines.append(f"| {point['name']:<10}| {format_lon(point['lon'], signs):<18} |")
-            else:
-                markdown_lines.append("| Name      | Position           | House |")
-                markdown_lines.append("| :-------- | :----------------- | :----:|")
-                for point in chart_data['points']:
-                    house_num = get_house_for_point(point['lon'], chart_data['houses'])
-                    markdown_lines.append(f"| {point['name']:<10}| {format_lon(point['lon'], signs):<18} | {house_num:<5} |")
-
-            # House cusps are meaningful only when birth time is known
-            if not chart_data.get('time_unknown'):
-                markdown_lines.append("\n### House Cusps")
-                markdown_lines.append("| House     | Position           |")
-                markdown_lines.append("| :-------- | :----------------- |")
-                for i_house, cusp in enumerate(chart_data['houses']):
-                    markdown_lines.append(f"| {i_house+1:<10}| {format_lon(cusp, signs):<18} |")
-
-            markdown_lines.append("\n### Aspects (Natal)")
-            if chart_data['aspects']:
-                for aspect_str in chart_data['aspects']:
-                    markdown_lines.append(f"- {aspect_str}")
-            else:
-                markdown_lines.append("- No major aspects found.")
-
-            markdown_lines.append("\n### Complex Aspects")
-            if chart_data['complex_aspects']:
-                for complex_asp in chart_data['complex_aspects']:
-                    markdown_lines.append(f"- **{complex_asp['type']}**: {' '.join(complex_asp['planets'])}")
-                    if complex_asp['type'] == 'YOD':
-                        markdown_lines.append(f"  - Apex Planet: {complex_asp['apex_planet']}")
-                    for asp_detail in complex_asp['aspects']:
-                        markdown_lines.append(f"  - {asp_detail}")
-            else:
-                markdown_lines.append("- No complex aspects found.")
-
-        if chart2:
-            all_aspects_def = {
-                'Conjunction': (0, 8), 'Opposition': (180, 8), 'Trine': (120, 7),
-                'Square': (90, 7), 'Sextile': (60, 5),
-                'Quincunx': (150, 2), 'Semisextile': (30, 2), 'Semisquare': (45, 2),
-                'Sesquiquadrate': (135, 2), 'Quintile': (72, 2), 'Biquintile': (144, 2),
-            }
-            
-            synastry_aspects_to_calculate = {}
-            for aspect_name in ['Conjunction', 'Opposition', 'Trine', 'Square', 'Sextile']:
-                if aspect_name in all_aspects_def:
-                    synastry_aspects_to_calculate[aspect_name] = all_aspects_def[aspect_name]
-
-            if selected_aspects1:
-                for aspect_name, is_selected in selected_aspects1.items():
-                    if is_selected and aspect_name not in synastry_aspects_to_calculate and aspect_name in all_aspects_def:
-                        synastry_aspects_to_calculate[aspect_name] = all_aspects_def[aspect_name]
-
-            name2 = chart2['name'] or "Chart 2"
-            synastry_aspects = []
-            sensitive_points = ['ASC', 'MC']
-            for p1 in chart1['points']:
-                for p2 in chart2['points']:
-                    # Omit sensitive points entirely for a chart with unknown time
-                    if chart1.get('time_unknown') and p1['name'] in sensitive_points:
-                        continue
-                    if chart2.get('time_unknown') and p2['name'] in sensitive_points:
-                        continue
-                    # Otherwise, keep original rule to skip ASC-MC pair aspects
-                    if p1['name'] in sensitive_points and p2['name'] in sensitive_points:
-                        continue
-
-                    angle = abs(p1['lon'] - p2['lon'])
-                    if angle > 180: angle = 360 - angle
-                    for aspect_name, (aspect_angle, orb) in synastry_aspects_to_calculate.items():
-                        if abs(angle - aspect_angle) <= orb:
-                            exact_orb = abs(angle - aspect_angle)
-                            aspect_str = format_aspect_string(f"{name1}'s {p1['name']}", f"{name2}'s {p2['name']}", aspect_name, exact_orb)
-                            synastry_aspects.append(aspect_str)
-            if synastry_aspects:
-                synastry_aspects.sort(key=lambda x: float(x.split('(Orb: ')[1][:-2]))
-
-            house_overlays = []
-            if not chart1.get('time_unknown'):
-                house_cusps1 = chart1['houses']
-                for p2 in chart2['points']:
-                    planet_lon = p2['lon']
-                    for i in range(12):
-                        cusp_start = house_cusps1[i]
-                        cusp_end = house_cusps1[(i + 1) % 12]
-                        if cusp_start < cusp_end:
-                            if cusp_start <= planet_lon < cusp_end:
-                                house_overlays.append(f"{name2}'s {p2['name']} in {name1}'s House {i+1}")
-                                break
-                        else:
-                            if cusp_start <= planet_lon < 360 or 0 <= planet_lon < cusp_end:
-                                house_overlays.append(f"{name2}'s {p2['name']} in {name1}'s House {i+1}")
-                                break
-            
-            markdown_lines.append("\n---\n")
-            markdown_lines.append(f"## Synastry Aspects ({name1} & {name2})")
-            if synastry_aspects:
-                for aspect_str in synastry_aspects:
-                    markdown_lines.append(f"- {aspect_str}")
-            else:
-                markdown_lines.append("- No major synastry aspects found.")
-
-            # Show overlays section only if chart1's time is known
-            if not chart1.get('time_unknown'):
-                markdown_lines.append("\n---\n")
-                markdown_lines.append(f"## House Overlays ({name2} in {name1}'s Houses)")
-                if house_overlays:
-                    for overlay_str in house_overlays:
-                        markdown_lines.append(f"- {overlay_str}")
-                else:
-                    markdown_lines.append("- No house overlays found.")
-
-        return "\n".join(markdown_lines)
-
+        return generate_horoscope('markdown', data1, selected_aspects1, data2, selected_aspects2)
     except Exception as e:
         import traceback
         traceback.print_exc()
         return f"An error occurred: {e}"
-
-def geocode(address):
-    url = f"https://nominatim.openstreetmap.org/search?q={address}&format=json&limit=1"
-    headers = {'User-Agent': 'AstroMD/1.0'}
-    try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        data = response.json()
-        if data:
-            return data[0]["lat"], data[0]["lon"]
-        return None, None
-    except requests.exceptions.RequestException as e:
-        # In a web app, you'd want to log this error properly
-        print(f"Geocoding Error: {e}")
-        return None, None
@@ -0,0 +1,235 @@
+import argparse
+import csv
+import functools
+import json
+import os
+import sys
+from collections import deque
+from contextlib import ExitStack
+from concurrent.futures import ProcessPoolExecutor
+import swisseph as swe
+import columnar
+import ephemeris_store
+from aspect_engine import ALL_ASPECTS_DEF, MAJOR_ASPECTS
+from astrology_logic import calculate_chart, chart_to_json, resolve_points
+from geocoding import geocode
+from points import POINT_CATALOGUE
+
+# --- Bulk chart generation ---
+# Birth records (JSON Lines or CSV) are calculated on a process pool and streamed back
+# as NDJSON in submission order, one line per record, with per-record errors, or
+# written as a columnar dataset (see columnar.py).
+#
+# Record fields: name, year, month, day, hour, minute (local time), lat, lon (or
+# location_name), timezone (optional IANA name), time_unknown, aspects (minor aspects to add, as a list or "Quincunx,Quintile").
+
+project_root = os.path.dirname(os.path.abspath(__file__))
+EPHE_PATH = os.path.join(project_root, 'ephe')
+
+DEFAULT_WORKERS = int(os.environ.get('ASTROMD_BATCH_WORKERS', 0)) or os.cpu_count() or 1
+CHUNK_SIZE = 64
+# Chunks in flight per worker: enough to keep the pool busy without reading the whole input.
+WINDOW_PER_WORKER = 4
+
+MINOR_ASPECTS = [name for name in ALL_ASPECTS_DEF if name not in MAJOR_ASPECTS]
+
+
+def read_records(lines, fmt='jsonl'):
+    """Yields raw records from an iterable of text lines ('jsonl' or 'csv').
+
+    JSON lines are yielded undecoded so that a malformed line becomes that record's
+    error instead of ending the stream.
+    """
+    if fmt == 'csv':
+        yield from csv.DictReader(lines)
+        return
+    for line in lines:
+        line = line.strip()
+        if line:
+            yield line
+
+
+def prepare_record(raw):
+    """Normalizes one raw record into (birth_data, selected_aspects); geocodes when needed."""
+    if isinstance(raw, str):
+        raw = json.loads(raw)
+    if not isinstance(raw, dict):
+        raise ValueError("Record must be a JSON object.")
+    hour = raw.get('hour')
+    minute = raw.get('minute')
+    time_unknown = str(raw.get('time_unknown', '')).strip().lower() in ('1', 'true', 'yes') or hour in (None, '')
+    birth_data = {
+        'name': raw.get('name'),
+        'year': raw.get('year'),
+        'month': raw.get('month'),
+        'day': raw.get('day'),
+        'hour': '12' if time_unknown else hour,
+        'minute': '0' if minute in (None, '') else minute,
+        'time_unknown': time_unknown,
+        'timezone': raw.get('timezone') or None,
+        'house_systems': raw.get('house_systems') or None,
+        'zodiacs': raw.get('zodiacs') or None,
+        'point_set': raw.get('point_set') or None,
+        'sections': raw.get('sections') or None,
+    }
+    lat, lon = raw.get('lat'), raw.get('lon')
+    location_name = raw.get('location_name')
+    if lat in (None, '') or lon in (None, ''):
+        if not location_name:
+            raise ValueError("Either lat/lon or location_name is required.")
+        lat, lon = geocode(location_name)
+        if lat is None or lon is None:
+            raise ValueError(f"Could not find location: {location_name}")
+    birth_data['lat'] = lat
+    birth_data['lon'] = lon
+    if location_name:
+        birth_data['location_name'] = location_name
+
+    aspects = raw.get('aspects') or []
+    if isinstance(aspects, str):
+        aspects = [a.strip() for a in aspects.split(',')]
+    selected_aspects = {name: name in aspects for name in MINOR_ASPECTS}
+    return birth_data, selected_aspects
+
+
+def _init_worker(ephe_path):
+    # Each process keeps its own pyswisseph state (ephemeris path, open files, caches)
+    # and its own mapping of the optional precomputed table.
+    swe.set_ephe_path(ephe_path)
+    ephemeris_store.load_store()
+
+
+def _calculate_chunk(chunk):
+    """Worker entry point: returns one NDJSON line per (index, birth_data, selected_aspects)."""
+    lines = []
+    for index, birth_data, selected_aspects in chunk:
+        try:
+            chart = calculate_chart(birth_data, selected_aspects, birth_data.get('sections'))
+            result = {'index': index, 'chart': chart_to_json(chart)}
+        except Exception as e:
+            result = {'index': index, 'error': str(e)}
+        lines.append(json.dumps(result, ensure_ascii=False))
+    return lines
+
+
+def _calculate_chunk_columns(points, float_dtype, chunk):
+    """Worker entry point for datasets: [column block] plus one error line per failed record.
+
+    Every chart is calculated with the dataset's `points` (catalogue ids) and without
+    complex aspects, which the columnar format does not hold.
+    """
+    point_set = ','.join(points)
+    rows = []
+    errors = []
+    for index, birth_data, selected_aspects in chunk:
+        try:
+            chart = calculate_chart(dict(birth_data, point_set=point_set), selected_aspects, 'points,houses,aspects')
+            rows.append((index, chart.load()))
+        except Exception as e:
+            errors.append(json.dumps({'index': index, 'error': str(e)}, ensure_ascii=False))
+    names = [POINT_CATALOGUE[point][0] for point in points]
+    return [columnar.chart_block(rows, names, float_dtype)] + errors
+
+
+def _chunks(raw_records):
+    """Groups prepared records into chunks; records that fail preparation become error lines."""
+    chunk = []
+    for index, raw in enumerate(raw_records):
+        try:
+            birth_data, selected_aspects = prepare_record(raw)
+        except Exception as e:
+            if chunk:
+                yield chunk
+                chunk = []
+            yield json.dumps({'index': index, 'error': str(e)}, ensure_ascii=False)
+            continue
+        chunk.append((index, birth_data, selected_aspects))
+        if len(chunk) >= CHUNK_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+_pool = None
+
+
+def get_pool(workers=None):
+    """Returns the long-lived process pool (created on first use)."""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=workers or DEFAULT_WORKERS, initializer=_init_worker, initargs=(EPHE_PATH,))
+    return _pool
+
+
+def run_batch(raw_records, pool=None, workers=None, task=_calculate_chunk):
+    """Calculates charts for raw records and yields NDJSON lines in submission order.
+
+    `task` turns a chunk into output items in a worker (default: one NDJSON line each).
+    """
+    pool = pool or get_pool(workers)
+    window = max(1, (workers or DEFAULT_WORKERS) * WINDOW_PER_WORKER)
+    pending = deque()
+    for item in _chunks(raw_records):
+        # Error lines from preparation are queued as plain strings to keep the output order.
+        pending.append(item if isinstance(item, str) else pool.submit(task, item))
+        while len(pending) > window:
+            yield from _drain_one(pending)
+    while pending:
+        yield from _drain_one(pending)
+
+
+def _drain_one(pending):
+    head = pending.popleft()
+    if isinstance(head, str):
+        yield head
+    else:
+        yield from head.result()
+
+
+def write_dataset(raw_records, path, fmt, point_set=None, float_dtype='float32', pool=None, workers=None):
+    """Calculates charts for raw records into a columnar dataset at `path`; returns its metadata."""
+    points = resolve_points(point_set)
+    writer = columnar.open_writer(path, fmt, [POINT_CATALOGUE[point][0] for point in points], float_dtype)
+    task = functools.partial(_calculate_chunk_columns, points, float_dtype)
+    for item in run_batch(raw_records, pool=pool, workers=workers, task=task):
+        if isinstance(item, str):
+            error = json.loads(item)
+            writer.add_error(error['index'], error['error'])
+        else:
+            writer.write(item)
+    writer.close()
+    return writer.meta
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate charts in bulk from JSON Lines or CSV birth records.")
+    parser.add_argument('input', nargs='?', default='-', help="input file ('-' for stdin)")
+    parser.add_argument('-o', '--output', default='-', help="NDJSON output file ('-' for stdout)")
+    parser.add_argument('--format', choices=['jsonl', 'csv'], help="input format (default: from file extension)")
+    parser.add_argument('-j', '--workers', type=int, default=DEFAULT_WORKERS, help="worker processes (default: CPU count)")
+    parser.add_argument('--dataset', choices=columnar.FORMATS, help="write a columnar dataset to --output instead of NDJSON")
+    parser.add_argument('--points', help="point set of the dataset's point columns (default: classic)")
+    parser.add_argument('--dtype', choices=list(columnar.FLOAT_DTYPES), default='float32', help="dataset float type")
+    args = parser.parse_args(argv)
+    if args.dataset and args.output == '-':
+        parser.error("--dataset needs an --output path")
+
+    fmt = args.format or ('csv' if args.input.endswith('.csv') else 'jsonl')
+    with ExitStack() as files:
+        # Files are closed (and the output flushed) even if the run fails; stdin/stdout are not.
+        source = sys.stdin if args.input == '-' else files.enter_context(open(args.input, encoding='utf-8', newline=''))
+        pool = files.enter_context(ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                                                       initargs=(EPHE_PATH,)))
+        if args.dataset:
+            meta = write_dataset(read_records(source, fmt), args.output, args.dataset, args.points, args.dtype,
+                                 pool=pool, workers=args.workers)
+            print(f"{meta['charts']} charts, {len(meta['errors'])} errors -> {args.output}", file=sys.stderr)
+            return
+        sink = sys.stdout if args.output == '-' else files.enter_context(open(args.output, 'w', encoding='utf-8'))
+        for line in run_batch(read_records(source, fmt), pool=pool, workers=args.workers):
+            sink.write(line + '\n')
+        sink.flush()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch import EPHE_PATH, _init_worker, run_batch  # noqa: E402
+from benchmarks.synthetic import synthetic_records  # noqa: E402
+
+# --- Batch throughput vs. worker count ---
+# Usage: python -m benchmarks.bench_batch [-n 20000] [--workers 1 2 4 8]
+
+
+def bench(records, workers):
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(EPHE_PATH,)) as pool:
+        # Warm the pool so process start-up is not counted.
+        list(run_batch(records[:workers * 8], pool=pool, workers=workers))
+        start = time.perf_counter()
+        count = sum(1 for _ in run_batch(records, pool=pool, workers=workers))
+        elapsed = time.perf_counter() - start
+    return count, elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure /generate/batch throughput across worker counts.")
+    parser.add_argument('-n', '--records', type=int, default=10000)
+    parser.add_argument('--workers', type=int, nargs='+')
+    args = parser.parse_args(argv)
+
+    cores = os.cpu_count() or 1
+    worker_counts = args.workers or sorted({1, 2, 4, 8, cores} & set(range(1, cores + 1)))
+    records = synthetic_records(args.records)
+    baseline = None
+    results = []
+    for workers in worker_counts:
+        count, elapsed = bench(records, workers)
+        rate = count / elapsed
+        baseline = baseline or rate
+        results.append({'workers': workers, 'charts': count, 'seconds': round(elapsed, 3),
+                        'charts_per_sec': round(rate, 1), 'speedup': round(rate / baseline, 2)})
+        print(f"workers={workers:<3} {rate:10.1f} charts/s  speedup x{rate / baseline:.2f}")
+    print(json.dumps(results))
+
+
+if __name__ == '__main__':
+    main()
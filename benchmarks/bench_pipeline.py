@@ -0,0 +1,210 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Geocoding results go to a throwaway SQLite cache, never the real one.
+os.environ['ASTROMD_CACHE_DIR'] = tempfile.mkdtemp(prefix='astromd-bench-')
+os.environ.pop('ASTROMD_GEOCODE_DB', None)
+os.environ.pop('ASTROMD_CHART_CACHE_DB', None)
+
+import geocoding  # noqa: E402
+from aspect_engine import select_aspects  # noqa: E402
+from aspect_patterns import detect_complex_aspects  # noqa: E402
+from astrology_logic import calculate_chart, generate_horoscope_markdown  # noqa: E402
+from batch import EPHE_PATH, _init_worker, run_batch  # noqa: E402
+from benchmarks.synthetic import fake_fetch, synthetic_records  # noqa: E402
+from chart_cache import chart_results, markdown_results  # noqa: E402
+from render import MarkdownRenderer  # noqa: E402
+
+# --- Chart pipeline benchmark ---
+# Usage: python -m benchmarks.bench_pipeline [-n 500] [--output run.json] [--compare previous.json]
+#
+# Runs synthetic birth records through each stage with the Nominatim client replaced by a
+# local fake (optionally with simulated latency), and reports latency percentiles,
+# tracemalloc peaks and throughput for single, synastry and batch modes. Chart and
+# Markdown caches are cleared before every timed call, so those are cold-path costs; the
+# geocode cache starts empty and fills as place names repeat, as it would in production.
+
+STAGES = ('geocode', 'calculate_chart', 'detect_complex_aspects', 'render_markdown', 'generate_horoscope_markdown')
+PERCENTILES = (50, 90, 99)
+
+
+def _selection(record):
+    return {name: True for name in record['aspects']}
+
+
+def _birth_data(record, coords):
+    data = {key: record[key] for key in ('name', 'year', 'month', 'day', 'hour', 'minute', 'location_name')}
+    data['lat'], data['lon'] = coords
+    return data
+
+
+def _cold():
+    chart_results.clear()
+    markdown_results.clear()
+
+
+def stage_calls(records):
+    """Yields (stage, zero-argument callable) for every stage of every record, in pipeline order."""
+    for record in records:
+        selected = _selection(record)
+        yield 'geocode', lambda: geocoding.geocode(record['location_name'])
+        data = _birth_data(record, geocoding.geocode(record['location_name']))
+        # Charts are lazy: load() so each stage times its own work, not sections it triggers.
+        yield 'calculate_chart', lambda: (_cold(), calculate_chart(data, selected).load())
+        chart = calculate_chart(data, selected).load()
+        aspects = select_aspects(selected)
+        yield 'detect_complex_aspects', lambda: detect_complex_aspects(chart['points'], aspects)
+        yield 'render_markdown', lambda: "".join(MarkdownRenderer().chart(chart, 1, False))
+        yield 'generate_horoscope_markdown', lambda: (_cold(), generate_horoscope_markdown(data, selected))
+
+
+def summarize(samples_ms, peaks=None):
+    values = np.asarray(samples_ms, dtype=np.float64)
+    summary = {'count': int(values.size), 'mean_ms': round(float(values.mean()), 4)}
+    for q, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+        summary[f'p{q}_ms'] = round(float(value), 4)
+    summary['max_ms'] = round(float(values.max()), 4)
+    summary['throughput_per_s'] = round(1000.0 / float(values.mean()), 1) if values.mean() else None
+    if peaks:
+        summary['alloc_peak_kib_mean'] = round(float(np.mean(peaks)) / 1024, 2)
+        summary['alloc_peak_kib_max'] = round(float(np.max(peaks)) / 1024, 2)
+    return summary
+
+
+def bench_stages(records, alloc_samples):
+    timings = {stage: [] for stage in STAGES}
+    for stage, call in stage_calls(records):
+        start = time.perf_counter()
+        call()
+        timings[stage].append((time.perf_counter() - start) * 1000)
+
+    # Allocation pass, separate so tracing overhead does not distort the timings.
+    peaks = {stage: [] for stage in STAGES}
+    tracemalloc.start()
+    for stage, call in stage_calls(records[:alloc_samples]):
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        call()
+        peaks[stage].append(tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+    return {stage: summarize(timings[stage], peaks[stage]) for stage in STAGES}
+
+
+def bench_single(records):
+    samples = []
+    for record in records:
+        _cold()
+        start = time.perf_counter()
+        data = _birth_data(record, geocoding.geocode(record['location_name']))
+        generate_horoscope_markdown(data, _selection(record))
+        samples.append((time.perf_counter() - start) * 1000)
+    return summarize(samples)
+
+
+def bench_synastry(records):
+    samples = []
+    for first, second in zip(records[::2], records[1::2]):
+        _cold()
+        start = time.perf_counter()
+        coords1, coords2 = geocoding.geocode_many([first['location_name'], second['location_name']])
+        generate_horoscope_markdown(_birth_data(first, coords1), _selection(first),
+                                    _birth_data(second, coords2), _selection(second))
+        samples.append((time.perf_counter() - start) * 1000)
+    return summarize(samples)
+
+
+def bench_batch(records, workers):
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(EPHE_PATH,)) as pool:
+        list(run_batch(records[:workers * 8], pool=pool, workers=workers))  # warm the pool
+        start = time.perf_counter()
+        count = sum(1 for _ in run_batch(records, pool=pool, workers=workers))
+        elapsed = time.perf_counter() - start
+    return {'workers': workers, 'charts': count, 'seconds': round(elapsed, 3), 'throughput_per_s': round(count / elapsed, 1)}
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(current, previous):
+    """Prints p50/p99 changes per stage and mode against an earlier result file."""
+    rows = [(f"stage {name}", stats, previous.get('stages', {}).get(name)) for name, stats in current['stages'].items()]
+    rows += [(f"mode {name}", stats, previous.get('modes', {}).get(name)) for name, stats in current['modes'].items()]
+    print(f"\ncompared with {previous.get('meta', {}).get('git_revision') or 'previous run'}:")
+    for label, stats, before in rows:
+        if not before:
+            continue
+        for key in ('p50_ms', 'p99_ms', 'throughput_per_s'):
+            if stats.get(key) and before.get(key):
+                change = (stats[key] - before[key]) / before[key] * 100
+                print(f"  {label:<38} {key:<17} {before[key]:>10} -> {stats[key]:>10}  ({change:+.1f}%)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the chart pipeline stage by stage.")
+    parser.add_argument('-n', '--records', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--places', type=int, default=500, help="at most this many distinct place names (up to 500)")
+    parser.add_argument('--geocode-latency', type=float, default=0.0, help="simulated lookup latency in ms")
+    parser.add_argument('--alloc-samples', type=int, default=100, help="records traced with tracemalloc")
+    parser.add_argument('--batch-workers', type=int, default=min(4, os.cpu_count() or 1), help="0 skips batch mode")
+    parser.add_argument('--output', help="write results as JSON to this path")
+    parser.add_argument('--compare', help="earlier JSON result to compare against")
+    args = parser.parse_args(argv)
+
+    geocoding._fetch = fake_fetch(args.geocode_latency / 1000)
+    records = synthetic_records(args.records, seed=args.seed, with_location_names=True)
+    for record in records:
+        place = int(record['location_name'].rsplit(' ', 1)[1]) % args.places
+        record['location_name'] = f"Synthetic Place {place}"
+
+    results = {
+        'meta': {
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'args': vars(args),
+        },
+        'stages': bench_stages(records, args.alloc_samples),
+        'modes': {'single': bench_single(records), 'synastry': bench_synastry(records)},
+    }
+    if args.batch_workers:
+        results['modes']['batch'] = bench_batch(records, args.batch_workers)
+    results['geocode_cache'] = geocoding.geocode_cache_stats()
+
+    for group in ('stages', 'modes'):
+        for name, stats in results[group].items():
+            if 'p50_ms' in stats:
+                print(f"{name:<28} p50 {stats['p50_ms']:8.3f} ms  p90 {stats['p90_ms']:8.3f}  p99 {stats['p99_ms']:8.3f}"
+                      f"  {stats['throughput_per_s']:>9}/s" + (f"  peak {stats['alloc_peak_kib_mean']:.1f} KiB"
+                                                               if 'alloc_peak_kib_mean' in stats else ""))
+            else:
+                print(f"{name:<28} {stats['throughput_per_s']:>9}/s with {stats['workers']} workers")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metrics  # noqa: E402
+from astrology_logic import calculate_chart  # noqa: E402
+from benchmarks.synthetic import synthetic_records  # noqa: E402
+from chart_cache import chart_results  # noqa: E402
+from points import POINT_CATALOGUE  # noqa: E402
+from render import MarkdownRenderer  # noqa: E402
+
+# --- Per-chart cost by number of catalogue points ---
+# Usage: python -m benchmarks.bench_points [-n 500] [--sizes 12,25,40]
+#
+# Each size takes the first N catalogue points (12 is the classic set, 40 the whole
+# catalogue). Charts are calculated cold (chart cache cleared) and fully loaded, then
+# rendered as Markdown; the ephemeris / aspects / patterns split comes from the pipeline's
+# own stage timings. Bodies whose ephemeris files are not installed (Chiron and the
+# asteroids need seas_*.se1) are skipped by the chart, so `points` reports how many
+# were actually calculated.
+
+PERCENTILES = (50, 90)
+
+
+def run_size(records, size):
+    point_set = ','.join(list(POINT_CATALOGUE)[:size])
+    totals, renders, point_counts, aspect_counts, lengths = [], [], [], [], []
+    stages = {}
+    for record in records:
+        selected = {name: True for name in record['aspects']}
+        data = dict(record, point_set=point_set)
+        chart_results.clear()
+        metrics.start_request()
+        start = time.perf_counter()
+        chart = calculate_chart(data, selected).load()
+        calculated = time.perf_counter()
+        document = "".join(MarkdownRenderer().chart(chart, 1, False))
+        end = time.perf_counter()
+        totals.append((end - start) * 1e6)
+        renders.append((end - calculated) * 1e6)
+        for name, seconds in metrics.request_timings().items():
+            stages.setdefault(name, []).append(seconds * 1e6)
+        point_counts.append(len(chart['points']))
+        aspect_counts.append(len(chart['aspects']))
+        lengths.append(len(document))
+
+    result = {'size': size, 'points': round(float(np.mean(point_counts)), 1)}
+    for q, value in zip(PERCENTILES, np.percentile(totals, PERCENTILES)):
+        result[f'p{q}_us'] = round(float(value), 1)
+    result['mean_us'] = round(float(np.mean(totals)), 1)
+    for name in ('ephemeris', 'aspects', 'patterns'):
+        if name in stages:
+            result[f'{name}_us'] = round(float(np.mean(stages[name])), 1)
+    result['render_us'] = round(float(np.mean(renders)), 1)
+    result['aspects'] = round(float(np.mean(aspect_counts)), 1)
+    result['markdown_chars'] = round(float(np.mean(lengths)))
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the per-chart cost at several catalogue sizes.")
+    parser.add_argument('-n', '--charts', type=int, default=500)
+    parser.add_argument('--sizes', default='12,25,40', help="comma-separated point counts")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if not metrics.ENABLED:
+        print("warning: ASTROMD_METRICS is off, so there is no per-stage split", file=sys.stderr)
+    records = synthetic_records(args.charts, seed=args.seed)
+    sizes = [min(int(size), len(POINT_CATALOGUE)) for size in args.sizes.split(',')]
+    run_size(records[:20], sizes[-1])  # warm-up: imports, lookup tables, missing-file reports
+
+    results = [run_size(records, size) for size in sizes]
+    for r in results:
+        split = "  ".join(f"{name} {r[name + '_us']:7.1f}" for name in ('ephemeris', 'aspects', 'patterns', 'render')
+                          if name + '_us' in r)
+        print(f"{r['size']:>3} points ({r['points']:>4} calculated)  p50 {r['p50_us']:8.1f} us  p90 {r['p90_us']:8.1f}"
+              f"  | {split}  | {r['aspects']:5.1f} aspects, {r['markdown_chars']} chars")
+    print(json.dumps(results))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from astrology_logic import calculate_chart  # noqa: E402
+from benchmarks.synthetic import synthetic_records  # noqa: E402
+from render import MarkdownRenderer  # noqa: E402
+
+# --- Markdown rendering cost per chart: lookup-table renderer vs. per-row f-strings ---
+# Usage: python -m benchmarks.bench_render [-n 2000] [--repeat 5]
+# Charts are calculated once up front; only rendering is timed.
+
+
+def legacy_house(point_lon, house_cusps):
+    for i in range(12):
+        cusp_start = house_cusps[i]
+        cusp_end = house_cusps[(i + 1) % 12]
+        if cusp_start < cusp_end:
+            if cusp_start <= point_lon < cusp_end:
+                return i + 1
+        else:
+            if point_lon >= cusp_start or point_lon < cusp_end:
+                return i + 1
+    return None
+
+
+def legacy_markdown(chart):
+    """The single-chart Markdown body as rendered before render.py and HouseIndex (reference)."""
+    signs = ["Aries", "Taurus", "Gemini", "Cancer", "Leo", "Virgo",
+             "Libra", "Scorpio", "Sagittarius", "Capricorn", "Aquarius", "Pisces"]
+
+    def format_lon(plon, signs_list):
+        sign = signs_list[int(plon // 30)]
+        deg = int(plon % 30)
+        minute = int((plon % 1) * 60)
+        return f"{sign} {deg}°{minute:02d}'"
+
+    def format_aspect_string(p1_name, p2_name, aspect_name, orb):
+        if aspect_name == 'Opposition' and p2_name == 'MC':
+            return f"{p1_name} Conjunction IC (Orb: {orb:.2f}°)"
+        if aspect_name == 'Opposition' and p1_name == 'MC':
+            return f"{p2_name} Conjunction IC (Orb: {orb:.2f}°)"
+        if aspect_name == 'Opposition' and p2_name == 'ASC':
+            return f"{p1_name} Conjunction DSC (Orb: {orb:.2f}°)"
+        if aspect_name == 'Opposition' and p1_name == 'ASC':
+            return f"{p2_name} Conjunction DSC (Orb: {orb:.2f}°)"
+        return f"{p1_name} {aspect_name} {p2_name} (Orb: {orb:.2f}°)"
+
+    lines = [f"- **Date:** {chart['date_str']}", f"- **Location:** {chart['location_str']}", "\n### Planets and Points"]
+    lines.append("| Name      | Position           | House |")
+    lines.append("| :-------- | :----------------- | :----:|")
+    for point in chart['points']:
+        house_num = legacy_house(point['lon'], chart['houses'])
+        lines.append(f"| {point['name']:<10}| {format_lon(point['lon'], signs):<18} | {house_num:<5} |")
+    lines.append("\n### House Cusps")
+    lines.append("| House     | Position           |")
+    lines.append("| :-------- | :----------------- |")
+    for i_house, cusp in enumerate(chart['houses']):
+        lines.append(f"| {i_house+1:<10}| {format_lon(cusp, signs):<18} |")
+    lines.append("\n### Aspects (Natal)")
+    points = chart['points']
+    for asp in chart['aspects']:
+        aspect_str = format_aspect_string(points[asp.p1]['name'], points[asp.p2]['name'], asp.name, asp.orb)
+        lines.append(f"- {aspect_str}")
+    return "\n".join(lines)
+
+
+def render_markdown(chart):
+    renderer = MarkdownRenderer()
+    points, cusps, aspects, _ = renderer.chart(chart, 1, False)
+    return points + cusps + aspects
+
+
+def measure(render, charts, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for chart in charts:
+            render(chart)
+        best = min(best, time.perf_counter() - start)
+
+    # Peak traced memory while rendering one chart (temporaries included), averaged.
+    tracemalloc.start()
+    peak_total = 0
+    for chart in charts:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        render(chart)
+        peak_total += tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    return best / len(charts), peak_total / len(charts)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure Markdown rendering cost per chart.")
+    parser.add_argument('-n', '--charts', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    charts = []
+    for record in synthetic_records(args.charts):
+        selected = {name: True for name in record.pop('aspects')}
+        charts.append(calculate_chart(record, selected))
+    mismatches = sum(legacy_markdown(chart) != render_markdown(chart) for chart in charts)
+    if mismatches:
+        print(f"warning: {mismatches} charts render differently", file=sys.stderr)
+
+    results = {}
+    for label, render in (('legacy', legacy_markdown), ('render', render_markdown)):
+        seconds, peak = measure(render, charts, args.repeat)
+        results[label] = {'us_per_chart': round(seconds * 1e6, 1), 'peak_bytes_per_chart': round(peak)}
+        print(f"{label:<7} {seconds * 1e6:8.1f} us/chart  {peak / 1024:7.1f} KiB peak/chart")
+    print(json.dumps(results))
+
+
+if __name__ == '__main__':
+    main()
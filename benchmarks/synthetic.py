@@ -0,0 +1,45 @@
+import hashlib
+import random
+import time
+
+# --- Synthetic birth records for benchmarks (no geocoding needed) ---
+
+MINOR_ASPECT_CHOICES = ['Quincunx', 'Semisextile', 'Semisquare', 'Sesquiquadrate', 'Quintile', 'Biquintile']
+
+
+def synthetic_records(n, seed=0, with_location_names=False):
+    """Returns n reproducible birth records spread over 1900-2030 and the inhabited latitudes."""
+    rng = random.Random(seed)
+    records = []
+    for i in range(n):
+        record = {
+            'name': f"Synthetic {i}",
+            'year': rng.randint(1900, 2030),
+            'month': rng.randint(1, 12),
+            'day': rng.randint(1, 28),
+            'hour': rng.randint(0, 23),
+            'minute': rng.randint(0, 59),
+            'aspects': rng.sample(MINOR_ASPECT_CHOICES, rng.randint(0, 3)),
+        }
+        if with_location_names:
+            record['location_name'] = f"Synthetic Place {rng.randint(0, 499)}"
+        else:
+            record['lat'] = round(rng.uniform(-55, 65), 4)
+            record['lon'] = round(rng.uniform(-180, 180), 4)
+        records.append(record)
+    return records
+
+
+def fake_fetch(latency=0.0):
+    """Local stand-in for geocoding._fetch: deterministic coordinates from the query's hash.
+
+    `latency` (seconds) simulates the network round trip of a real Nominatim lookup.
+    """
+    def fetch(address):
+        if latency:
+            time.sleep(latency)
+        digest = hashlib.sha256(address.encode('utf-8')).digest()
+        lat = -55 + 120 * int.from_bytes(digest[:4], 'big') / 2 ** 32
+        lon = -180 + 360 * int.from_bytes(digest[4:8], 'big') / 2 ** 32
+        return round(lat, 4), round(lon, 4)
+    return fetch
@@ -0,0 +1,241 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:  # optional: without it (Windows) coalescing stays within one process
+    fcntl = None
+
+# --- Small cache primitives shared by the geocoding and chart layers ---
+
+def default_cache_dir():
+    """Returns the directory used for on-disk caches (writable on Vercel-style hosts)."""
+    return os.environ.get('ASTROMD_CACHE_DIR') or tempfile.gettempdir()
+
+
+class LRUCache:
+    """A thread-safe, bounded in-process LRU mapping with optional per-entry TTL."""
+
+    _MISSING = object()
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, self._MISSING)
+            if item is self._MISSING:
+                return default
+            value, expires_at = item
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteStore:
+    """A key/value table in SQLite that survives restarts and is shared between processes.
+
+    Values are stored as text; callers serialize. Any SQLite error (e.g. a read-only
+    filesystem) disables the store for the rest of the process instead of failing requests.
+    """
+
+    def __init__(self, path, table='kv'):
+        self.path = path
+        self.table = table
+        self.enabled = True
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    f"CREATE TABLE IF NOT EXISTS {table} "
+                    "(key TEXT PRIMARY KEY, value TEXT, expires_at REAL)"
+                )
+        except sqlite3.Error as e:
+            self._disable(e)
+
+    def _connect(self):
+        # A short-lived connection per operation keeps the store safe across threads and workers.
+        return sqlite3.connect(self.path, timeout=2.0)
+
+    def _disable(self, error):
+        print(f"Cache store disabled ({self.path}): {error}")
+        self.enabled = False
+
+    def get(self, key):
+        """Returns the stored text, or None when absent or expired."""
+        if not self.enabled:
+            return None
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+                ).fetchone()
+        except sqlite3.Error as e:
+            self._disable(e)
+            return None
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at is not None and expires_at <= time.time():
+            return None
+        return value
+
+    def set(self, key, value, ttl=None):
+        if not self.enabled:
+            return
+        expires_at = time.time() + ttl if ttl else None
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, value, expires_at),
+                )
+        except sqlite3.Error as e:
+            self._disable(e)
+
+
+# --- Request coalescing ---
+
+def shared_key_locks():
+    """KeyLocks in ASTROMD_LOCK_DIR, or None when cross-worker coalescing is off (the default)."""
+    directory = os.environ.get('ASTROMD_LOCK_DIR')
+    if not directory or fcntl is None:
+        return None
+    locks = KeyLocks(directory)
+    return locks if locks.enabled else None
+
+
+class KeyLocks:
+    """Advisory per-key locks between processes on one host, via flock on striped lock files.
+
+    Keys hash onto STRIPES files, so unrelated keys occasionally wait for each other; that
+    costs a little latency, never correctness. A lock dies with its process.
+    """
+    STRIPES = 256
+    POLL = 0.01
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.enabled = True
+        try:
+            os.makedirs(directory, exist_ok=True)
+        except OSError as e:
+            print(f"Key locks disabled ({directory}): {e}")
+            self.enabled = False
+
+    def try_acquire(self, key):
+        """Returns a held lock for `key` (pass it to release), or None if someone else holds it."""
+        stripe = zlib.crc32(key.encode('utf-8')) % self.STRIPES
+        try:
+            fd = os.open(os.path.join(self.directory, f'{stripe:03d}.lock'), os.O_RDWR | os.O_CREAT, 0o644)
+        except OSError as e:
+            print(f"Key locks disabled ({self.directory}): {e}")
+            self.enabled = False
+            return None
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return None
+        return fd
+
+    def acquire(self, key, timeout):
+        """Waits up to `timeout` seconds for the lock; None on timeout (callers go ahead unlocked)."""
+        deadline = time.monotonic() + timeout
+        while self.enabled:
+            fd = self.try_acquire(key)
+            if fd is not None or time.monotonic() >= deadline:
+                return fd
+            time.sleep(self.POLL)
+        return None
+
+    async def acquire_async(self, key, timeout):
+        """acquire() for event-loop callers."""
+        deadline = time.monotonic() + timeout
+        while self.enabled:
+            fd = self.try_acquire(key)
+            if fd is not None or time.monotonic() >= deadline:
+                return fd
+            await asyncio.sleep(self.POLL)
+        return None
+
+    def release(self, fd):
+        if fd is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+
+class _Call:
+    __slots__ = ('done', 'value', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time; concurrent callers wait and share its result.
+
+    With `locks` (KeyLocks) the running call also holds the key's lock across processes, so
+    `fn` should first re-check the shared store the previous holder may just have filled.
+    """
+    LOCK_TIMEOUT = 10.0
+
+    def __init__(self, locks=None):
+        self.locks = locks
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        held = self.locks.acquire(key, self.LOCK_TIMEOUT) if self.locks is not None else None
+        try:
+            call.value = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            if held is not None:
+                self.locks.release(held)
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.value
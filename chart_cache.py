@@ -0,0 +1,141 @@
+import hashlib
+import json
+import os
+import threading
+from aspect_engine import Aspect
+from cache_store import LRUCache, SingleFlight, SQLiteStore, shared_key_locks
+
+# --- Content-addressed caches for computed charts and rendered Markdown ---
+# Chart results are keyed only on the inputs that affect the astronomy (UT instant,
+# coordinates, house system, aspect set, points shown, time_unknown). Names and location
+# labels are presentation and are applied by the caller after the lookup. Each chart section
+# (ephemeris, aspects, patterns) is stored under chart_key() plus a suffix.
+
+CHART_CACHE_SIZE = int(os.environ.get('ASTROMD_CHART_CACHE_SIZE', 4096))
+MARKDOWN_CACHE_SIZE = int(os.environ.get('ASTROMD_MARKDOWN_CACHE_SIZE', 1024))
+# Rendered documents can be large; skip caching anything above this many characters.
+MARKDOWN_MAX_CHARS = int(os.environ.get('ASTROMD_MARKDOWN_MAX_CHARS', 200_000))
+# When set, computed charts are also written to this SQLite file so that every
+# Gunicorn worker on the host can reuse the others' work.
+SHARED_DB_PATH = os.environ.get('ASTROMD_CHART_CACHE_DB')
+
+
+def content_key(*parts):
+    """Returns a stable SHA-256 hex digest for JSON-serializable parts."""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def chart_key(jd, lat, lon, time_unknown, house_system, aspects, points):
+    """Key for a computed chart at Julian day `jd` (UT).
+
+    `aspects` maps aspect name -> (angle, orb); `points` are the catalogue ids shown.
+    """
+    return content_key(
+        'chart/v5', jd, round(lat, 6), round(lon, 6), bool(time_unknown), house_system,
+        sorted((name, list(definition)) for name, definition in aspects.items()), list(points),
+    )
+
+
+class ResultCache:
+    """In-process LRU with an optional shared SQLite tier; counts hits and misses.
+
+    Concurrent misses for one key are computed once (SingleFlight). With the shared tier
+    and ASTROMD_LOCK_DIR set, that holds across the workers on the host as well.
+    """
+
+    def __init__(self, maxsize, shared_path=None, table='results', encode=None, decode=None):
+        self._memory = LRUCache(maxsize=maxsize)
+        # encode/decode convert values to and from JSON-compatible form for the shared tier.
+        self._encode = encode or (lambda value: value)
+        self._decode = decode or (lambda value: value)
+        self._shared = SQLiteStore(shared_path, table=table) if shared_path else None
+        self._flight = SingleFlight(shared_key_locks() if self._shared is not None else None)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self._memory.get(key)
+        if value is not None:
+            with self._lock:
+                self.hits += 1
+            return value
+        if self._shared is not None:
+            stored = self._shared.get(key)
+            if stored is not None:
+                value = self._decode(json.loads(stored))
+                self._memory.set(key, value)
+                with self._lock:
+                    self.shared_hits += 1
+                return value
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, value):
+        self._memory.set(key, value)
+        if self._shared is not None:
+            self._shared.set(key, json.dumps(self._encode(value), ensure_ascii=False))
+
+    def get_or_compute(self, key, compute, cacheable=None):
+        """Returns the cached value for `key`, computing and storing it on a miss.
+
+        Concurrent misses for the same key share one compute() call. `cacheable(value)`
+        can veto storing a result. Cached values are shared between callers and must be
+        treated as read-only.
+        """
+        value = self.get(key)
+        if value is None:
+            value = self._flight.do(key, lambda: self._fill(key, compute, cacheable))
+        return value
+
+    def _fill(self, key, compute, cacheable):
+        # The previous computation of this key (here or, with key locks, in another worker)
+        # may have finished between our miss and taking the key.
+        value = self._memory.get(key)
+        if value is None and self._shared is not None:
+            stored = self._shared.get(key)
+            value = self._decode(json.loads(stored)) if stored is not None else None
+        if value is None:
+            value = compute()
+            if cacheable is None or cacheable(value):
+                self.set(key, value)
+        return value
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'shared_hits': self.shared_hits, 'misses': self.misses,
+                    'coalesced': self._flight.coalesced, 'size': len(self._memory)}
+
+    def clear(self):
+        self._memory.clear()
+
+
+def _encode_chart(section):
+    if 'aspects' not in section:
+        return section
+    return dict(section, aspects=[asp.to_row() for asp in section['aspects']])
+
+
+def _decode_chart(stored):
+    if 'aspects' not in stored:
+        return stored
+    return dict(stored, aspects=[Aspect.from_row(row) for row in stored['aspects']])
+
+
+chart_results = ResultCache(
+    CHART_CACHE_SIZE, shared_path=SHARED_DB_PATH, table='charts', encode=_encode_chart, decode=_decode_chart,
+)
+markdown_results = ResultCache(MARKDOWN_CACHE_SIZE)
+
+
+def chart_cache_stats():
+    """Returns hit/miss counters for the chart and Markdown caches."""
+    return {'charts': chart_results.stats(), 'markdown': markdown_results.stats()}
+
+
+def markdown_etag(markdown):
+    """Strong ETag value for a rendered document."""
+    return hashlib.sha256(markdown.encode('utf-8')).hexdigest()[:32]
@@ -0,0 +1,358 @@
+import json
+import os
+import shutil
+import struct
+import tempfile
+import zipfile
+import numpy as np
+from aspect_engine import ASPECT_NAMES
+from houses import HOUSE_SYSTEMS
+from zodiac import ZODIACS
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# --- Columnar chart datasets ---
+# Batches of calculated charts stored as flat arrays instead of one JSON object each,
+# for research pipelines that scan millions of charts. Every chart in a dataset has the
+# same point columns (`points` in the metadata); a point a chart lacks is NaN.
+#
+# Per chart (n rows):
+#   index int64 (input record), jd float64 (UT), lat, lon, ayanamsa, time_unknown bool,
+#   zodiac / house_system int8 (into the metadata lists),
+#   point_lon, point_speed (n x points), point_house int8 (n x points, 0 = no houses),
+#   cusps (n x 12, NaN without a birth time)
+# Per aspect, chart i owning rows aspect_offsets[i]:aspect_offsets[i + 1]:
+#   aspect_p1, aspect_p2 int16 (point columns), aspect_type int8 (into `aspects`),
+#   aspect_orb, aspect_applying int8 (1 applying, 0 separating, -1 unknown)
+#
+# Formats: 'npy' (a directory of .npy files plus meta.json), 'npz' (the same files in
+# one uncompressed zip) and, with pyarrow installed, 'arrow' (IPC file) and 'parquet'
+# (aspects as list columns). npy, npz and arrow are read memory-mapped, so scanning a
+# column only touches that column's pages.
+
+FORMATS = ['npy', 'npz', 'arrow', 'parquet']
+FLOAT_DTYPES = {'float32': np.float32, 'float64': np.float64}
+CHART_COLUMNS = ['index', 'jd', 'lat', 'lon', 'ayanamsa', 'time_unknown', 'zodiac', 'house_system',
+                 'point_lon', 'point_speed', 'point_house', 'cusps']
+ASPECT_COLUMNS = ['aspect_p1', 'aspect_p2', 'aspect_type', 'aspect_orb', 'aspect_applying']
+ZODIAC_NAMES = list(ZODIACS)
+HOUSE_SYSTEM_NAMES = list(HOUSE_SYSTEMS)
+
+# Fixed-size .npy header, so it can be rewritten with the final row count on close.
+NPY_HEADER_BYTES = 128
+
+
+def chart_block(rows, points, float_dtype=np.float32):
+    """Column arrays for [(record index, Chart)]; `points` are the point column names."""
+    float_dtype = np.dtype(float_dtype)
+    n, width = len(rows), len(points)
+    column_of = {name: k for k, name in enumerate(points)}
+    block = {
+        'index': np.array([index for index, _ in rows], dtype=np.int64),
+        'jd': np.array([chart.jd for _, chart in rows], dtype=np.float64),
+        'lat': np.array([chart.lat for _, chart in rows], dtype=float_dtype),
+        'lon': np.array([chart.lon for _, chart in rows], dtype=float_dtype),
+        'ayanamsa': np.array([chart['ayanamsa'] for _, chart in rows], dtype=float_dtype),
+        'time_unknown': np.array([chart['time_unknown'] for _, chart in rows], dtype=bool),
+        'zodiac': np.array([ZODIAC_NAMES.index(chart['zodiac']) for _, chart in rows], dtype=np.int8),
+        'house_system': np.array([HOUSE_SYSTEM_NAMES.index(chart['house_system']) for _, chart in rows], dtype=np.int8),
+        'point_lon': np.full((n, width), np.nan, dtype=float_dtype),
+        'point_speed': np.full((n, width), np.nan, dtype=float_dtype),
+        'point_house': np.zeros((n, width), dtype=np.int8),
+        'cusps': np.full((n, 12), np.nan, dtype=float_dtype),
+    }
+    aspects = {name: [] for name in ASPECT_COLUMNS}
+    counts = np.zeros(n, dtype=np.int64)
+    for r, (_, chart) in enumerate(rows):
+        columns = [column_of.get(p['name']) for p in chart['points']]
+        for p, k in zip(chart['points'], columns):
+            if k is not None:
+                block['point_lon'][r, k] = p['lon']
+                block['point_speed'][r, k] = p['speed']
+        if 'houses' in chart and not chart['time_unknown']:
+            block['cusps'][r] = chart['houses'][:12]
+            lons = block['point_lon'][r]
+            known = ~np.isnan(lons)
+            block['point_house'][r, known] = chart['house_index'].houses_of(lons[known])
+        for asp in chart.get('aspects', ()):
+            k1, k2 = columns[asp.p1], columns[asp.p2]
+            if k1 is None or k2 is None:
+                continue
+            aspects['aspect_p1'].append(k1)
+            aspects['aspect_p2'].append(k2)
+            aspects['aspect_type'].append(asp.aspect)
+            aspects['aspect_orb'].append(asp.orb)
+            aspects['aspect_applying'].append(-1 if asp.applying is None else int(asp.applying))
+            counts[r] += 1
+    block['aspect_count'] = counts
+    block['aspect_p1'] = np.array(aspects['aspect_p1'], dtype=np.int16)
+    block['aspect_p2'] = np.array(aspects['aspect_p2'], dtype=np.int16)
+    block['aspect_type'] = np.array(aspects['aspect_type'], dtype=np.int8)
+    block['aspect_orb'] = np.array(aspects['aspect_orb'], dtype=float_dtype)
+    block['aspect_applying'] = np.array(aspects['aspect_applying'], dtype=np.int8)
+    return block
+
+
+def dataset_meta(points, float_dtype):
+    return {
+        'format_version': 1,
+        'points': list(points),
+        'aspects': ASPECT_NAMES,
+        'zodiacs': ZODIAC_NAMES,
+        'house_systems': HOUSE_SYSTEM_NAMES,
+        'float_dtype': np.dtype(float_dtype).name,
+    }
+
+
+# --- Writers ---
+
+class _NpyAppender:
+    """One .npy file written in row blocks; the header gets the final shape on close."""
+
+    def __init__(self, path, dtype, row_shape=()):
+        self.dtype = np.dtype(dtype)
+        self.row_shape = tuple(row_shape)
+        self.rows = 0
+        self._file = open(path, 'wb')
+        self._write_header()
+
+    def _write_header(self):
+        header = repr({
+            'descr': np.lib.format.dtype_to_descr(self.dtype),
+            'fortran_order': False,
+            'shape': (self.rows,) + self.row_shape,
+        })
+        length = NPY_HEADER_BYTES - 10
+        self._file.write(b'\x93NUMPY\x01\x00' + struct.pack('<H', length) + header.ljust(length - 1).encode('latin-1') + b'\n')
+
+    def append(self, array):
+        self._file.write(np.ascontiguousarray(array, dtype=self.dtype).tobytes())
+        self.rows += len(array)
+
+    def close(self):
+        self._file.seek(0)
+        self._write_header()
+        self._file.close()
+
+
+class NpyWriter:
+    """Writes a dataset as a directory of .npy files (or, with `npz_path`, one .npz)."""
+
+    def __init__(self, path, points, float_dtype=np.float32, npz_path=None):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.npz_path = npz_path
+        self.meta = dataset_meta(points, float_dtype)
+        self.errors = []
+        float_dtype = np.dtype(float_dtype)
+        width = (len(points),)
+        specs = {
+            'index': (np.int64, ()), 'jd': (np.float64, ()), 'lat': (float_dtype, ()), 'lon': (float_dtype, ()),
+            'ayanamsa': (float_dtype, ()), 'time_unknown': (bool, ()), 'zodiac': (np.int8, ()),
+            'house_system': (np.int8, ()), 'point_lon': (float_dtype, width), 'point_speed': (float_dtype, width),
+            'point_house': (np.int8, width), 'cusps': (float_dtype, (12,)),
+            'aspect_offsets': (np.int64, ()), 'aspect_p1': (np.int16, ()), 'aspect_p2': (np.int16, ()),
+            'aspect_type': (np.int8, ()), 'aspect_orb': (float_dtype, ()), 'aspect_applying': (np.int8, ()),
+        }
+        self._files = {name: _NpyAppender(os.path.join(path, name + '.npy'), dtype, shape)
+                       for name, (dtype, shape) in specs.items()}
+        self._aspect_total = 0
+        self._files['aspect_offsets'].append(np.zeros(1, dtype=np.int64))
+
+    def write(self, block):
+        for name in CHART_COLUMNS + ASPECT_COLUMNS:
+            self._files[name].append(block[name])
+        offsets = self._aspect_total + np.cumsum(block['aspect_count'])
+        self._files['aspect_offsets'].append(offsets)
+        if len(offsets):
+            self._aspect_total = int(offsets[-1])
+
+    def add_error(self, index, error):
+        self.errors.append({'index': index, 'error': error})
+
+    def close(self):
+        for appender in self._files.values():
+            appender.close()
+        self.meta['charts'] = self._files['index'].rows
+        self.meta['errors'] = self.errors
+        with open(os.path.join(self.path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f, ensure_ascii=False)
+        if self.npz_path:
+            # Stored, not deflated: members stay memory-mappable.
+            with zipfile.ZipFile(self.npz_path, 'w', zipfile.ZIP_STORED, allowZip64=True) as zf:
+                for name in sorted(os.listdir(self.path)):
+                    zf.write(os.path.join(self.path, name), name)
+            shutil.rmtree(self.path)
+
+
+class ArrowWriter:
+    """Writes a dataset as an Arrow IPC file or Parquet, one record batch / row group per block."""
+
+    def __init__(self, path, points, float_dtype=np.float32, fmt='arrow'):
+        if pa is None:
+            raise RuntimeError("The arrow and parquet formats need pyarrow (pip install pyarrow).")
+        self.path = path
+        self.fmt = fmt
+        self.meta = dataset_meta(points, float_dtype)
+        self.errors = []
+        self._width = len(points)
+        self._writer = None
+        self._schema = None
+        self._rows = 0
+
+    def _batch(self, block):
+        offsets = np.concatenate([[0], np.cumsum(block['aspect_count'])]).astype(np.int64)
+        columns = {name: pa.array(block[name]) for name in CHART_COLUMNS if block[name].ndim == 1}
+        for name, width in (('point_lon', self._width), ('point_speed', self._width), ('point_house', self._width),
+                            ('cusps', 12)):
+            columns[name] = pa.FixedSizeListArray.from_arrays(pa.array(block[name].reshape(-1)), width)
+        for name in ASPECT_COLUMNS:
+            columns[name] = pa.LargeListArray.from_arrays(pa.array(offsets), pa.array(block[name]))
+        return pa.record_batch(list(columns.values()), names=list(columns))
+
+    def write(self, block):
+        batch = self._batch(block)
+        if self._writer is None:
+            self._schema = batch.schema.with_metadata({'astromd': json.dumps(self.meta)})
+            if self.fmt == 'parquet':
+                self._writer = pq.ParquetWriter(self.path, self._schema)
+            else:
+                self._writer = pa.ipc.new_file(self.path, self._schema)
+        batch = batch.replace_schema_metadata(self._schema.metadata)
+        self._rows += len(block['index'])
+        if self.fmt == 'parquet':
+            self._writer.write_batch(batch)
+        else:
+            self._writer.write(batch)
+
+    def add_error(self, index, error):
+        self.errors.append({'index': index, 'error': error})
+
+    def close(self):
+        if self._writer is None:
+            self.write(chart_block([], self.meta['points'], self.meta['float_dtype']))
+        self._writer.close()
+        self.meta['charts'] = self._rows
+        self.meta['errors'] = self.errors
+        # Schema metadata is written up front, so the errors go to a sidecar file.
+        with open(self.path + '.errors.json', 'w', encoding='utf-8') as f:
+            json.dump(self.errors, f, ensure_ascii=False)
+
+
+def open_writer(path, fmt, points, float_dtype=np.float32):
+    """Returns a dataset writer with write(block), add_error(index, error) and close()."""
+    if fmt == 'npy':
+        return NpyWriter(path, points, float_dtype)
+    if fmt == 'npz':
+        return NpyWriter(tempfile.mkdtemp(prefix='astromd-npz-', dir=os.path.dirname(os.path.abspath(path))),
+                         points, float_dtype, npz_path=path)
+    if fmt in ('arrow', 'parquet'):
+        return ArrowWriter(path, points, float_dtype, fmt)
+    raise ValueError(f"Unknown dataset format: {fmt} (expected one of {', '.join(FORMATS)})")
+
+
+# --- Reading ---
+
+class ChartDataset:
+    """A dataset opened for reading; `columns` maps the names above to (mostly mmap'd) arrays.
+
+    Aspect columns are flat; aspects(i) slices out chart i's rows without copying.
+    """
+
+    def __init__(self, columns, meta, keep_alive=None):
+        self.columns = columns
+        self.meta = meta
+        self.points = meta['points']
+        self._keep_alive = keep_alive  # e.g. the Arrow table the arrays point into
+
+    def __len__(self):
+        return len(self.columns['index'])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def aspects(self, i):
+        start, end = self.columns['aspect_offsets'][i:i + 2]
+        return {name: self.columns[name][start:end] for name in ASPECT_COLUMNS}
+
+    def point(self, name):
+        """Longitudes of one point across all charts (a strided view)."""
+        return self.columns['point_lon'][:, self.points.index(name)]
+
+
+def _npz_member(f, info):
+    # Offset of a stored member's data: its local header is 30 bytes plus name and extra field.
+    f.seek(info.header_offset)
+    local = f.read(30)
+    name_length, extra_length = struct.unpack('<HH', local[26:30])
+    return info.header_offset + 30 + name_length + extra_length
+
+
+def _mmap_npy(path, offset=0):
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        if np.lib.format.read_magic(f) == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        data_offset = f.tell()
+    if not shape or shape[0] == 0:
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=data_offset, shape=shape,
+                     order='F' if fortran_order else 'C')
+
+
+def open_dataset(path):
+    """Opens a dataset written by open_writer(); the format is taken from the path."""
+    if os.path.isdir(path):
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        columns = {name[:-4]: _mmap_npy(os.path.join(path, name))
+                   for name in os.listdir(path) if name.endswith('.npy')}
+        return ChartDataset(columns, meta)
+    if zipfile.is_zipfile(path):
+        columns = {}
+        with zipfile.ZipFile(path) as zf, open(path, 'rb') as f:
+            meta = json.loads(zf.read('meta.json'))
+            for info in zf.infolist():
+                if info.filename.endswith('.npy'):
+                    if info.compress_type != zipfile.ZIP_STORED:
+                        raise ValueError(f"{info.filename} is compressed and cannot be memory-mapped")
+                    columns[info.filename[:-4]] = _mmap_npy(path, _npz_member(f, info))
+        return ChartDataset(columns, meta)
+    if pa is None:
+        raise RuntimeError("Reading arrow and parquet datasets needs pyarrow (pip install pyarrow).")
+    with open(path, 'rb') as f:
+        parquet = f.read(4) == b'PAR1'
+    if parquet:
+        table = pq.read_table(path, memory_map=True)
+    else:
+        table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+    meta = json.loads(table.schema.metadata[b'astromd'])
+    return ChartDataset(_arrow_columns(table, len(meta['points'])), meta, keep_alive=table)
+
+
+def _arrow_columns(table, width):
+    # An Arrow IPC table is itself memory-mapped; the numpy views are zero-copy when a
+    # column is a single chunk, otherwise its chunks are combined once here.
+    columns = {}
+    for name in table.column_names:
+        chunks = table.column(name).chunks
+        array = chunks[0] if len(chunks) == 1 else table.column(name).combine_chunks()
+        if name in ASPECT_COLUMNS:
+            columns.setdefault('aspect_offsets', np.asarray(array.offsets).astype(np.int64))
+            array = array.flatten()
+        elif name in ('point_lon', 'point_speed', 'point_house', 'cusps'):
+            array = array.flatten()
+        values = array.to_numpy(zero_copy_only=False)
+        if name in ('point_lon', 'point_speed', 'point_house'):
+            values = values.reshape(-1, width)
+        elif name == 'cusps':
+            values = values.reshape(-1, 12)
+        columns[name] = values
+    return columns
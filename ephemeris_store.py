@@ -0,0 +1,223 @@
+import argparse
+import mmap
+import os
+import random
+import struct
+import sys
+import numpy as np
+import swisseph as swe
+
+# --- Precomputed ephemeris tables (Chebyshev coefficients, memory-mapped) ---
+# The geocentric ecliptic longitude of each planet is stored as Chebyshev series over
+# fixed-length intervals, like the JPL ephemerides. Queries evaluate one series straight
+# from the mmap'd file (no per-call array allocation) and fall back to pyswisseph for
+# bodies or dates the table does not cover.
+#
+# File layout (little endian):
+#   header : magic(8s) version(I) body_count(I) start_jd(d) end_jd(d)
+#   bodies : body_count x [planet_id(i) interval_days(d) degree(I) segments(I) offset(Q)]
+#   data   : float64 coefficients; segment k of a body starts at offset + k * (degree + 1)
+
+MAGIC = b'AMDEPH01'
+VERSION = 1
+HEADER = struct.Struct('<8sIIdd')
+BODY = struct.Struct('<idIIQ')
+
+# With 13 coefficients per interval the series error itself is far below 0.01"; the
+# verified error against pyswisseph with the built-in Moshier ephemeris, which has
+# sub-day wiggles no smooth fit follows, is up to ~4" (Mars through Neptune; shorter
+# intervals do not reduce it). That is still far below the 1' display precision and the
+# 0.01 degree orb precision; VERIFY_TOLERANCE leaves some margin above it.
+INTERVAL_DAYS = {
+    swe.MOON: 4.0,
+    swe.SUN: 16.0, swe.MERCURY: 8.0, swe.VENUS: 16.0, swe.MARS: 8.0,
+    swe.JUPITER: 32.0, swe.SATURN: 32.0, swe.URANUS: 32.0, swe.NEPTUNE: 32.0, swe.PLUTO: 32.0,
+}
+DEGREE = 12
+VERIFY_TOLERANCE = 5.0  # arcseconds
+
+DEFAULT_TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'ephemeris.bin')
+
+
+def _fit_matrix(degree):
+    """Chebyshev nodes on [-1, 1] and the matrix turning values there into coefficients."""
+    n = degree + 1
+    k = np.arange(n)
+    nodes = np.cos(np.pi * (k + 0.5) / n)
+    matrix = np.cos(np.pi * np.outer(k, k + 0.5) / n) * (2.0 / n)
+    matrix[0] *= 0.5
+    return nodes, matrix
+
+
+def build(path, start_year, end_year, flags=swe.FLG_SWIEPH | swe.FLG_SPEED):
+    """Fits every planet over [start_year, end_year] and writes the table to `path`.
+
+    `flags` must match what calc_longitude() falls back to: with FLG_SPEED pyswisseph
+    applies a slightly different light-time correction.
+    """
+    start_jd = swe.julday(start_year, 1, 1, 0.0)
+    end_jd = swe.julday(end_year + 1, 1, 1, 0.0)
+    nodes, matrix = _fit_matrix(DEGREE)
+    bodies = []
+    blocks = []
+    offset = 0
+    for planet_id, interval in INTERVAL_DAYS.items():
+        segments = int(np.ceil((end_jd - start_jd) / interval))
+        coefficients = np.empty((segments, DEGREE + 1))
+        for seg in range(segments):
+            seg_start = start_jd + seg * interval
+            jds = seg_start + (nodes + 1.0) * (interval / 2.0)
+            lons = np.array([swe.calc_ut(jd, planet_id, flags)[0][0] for jd in jds])
+            coefficients[seg] = matrix @ np.unwrap(lons, period=360)
+        bodies.append((planet_id, interval, DEGREE, segments, offset))
+        blocks.append(coefficients.ravel())
+        offset += coefficients.size
+
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(bodies), start_jd, end_jd))
+        for body in bodies:
+            f.write(BODY.pack(*body))
+        for block in blocks:
+            f.write(block.astype('<f8').tobytes())
+
+
+class EphemerisStore:
+    """Read-only view of a table written by build(), memory-mapped from disk."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, body_count, self.start_jd, self.end_jd = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Not an ephemeris table (or unsupported version): {path}")
+        self._bodies = {}
+        position = HEADER.size
+        for _ in range(body_count):
+            planet_id, interval, degree, segments, offset = BODY.unpack_from(self._mmap, position)
+            self._bodies[planet_id] = (interval, degree, segments, offset)
+            position += BODY.size
+        # A memoryview cast to doubles indexes straight into the mapping and yields Python floats.
+        self._coefficients = memoryview(self._mmap)[position:].cast('d')
+
+    def covers(self, jd, planet_id):
+        return planet_id in self._bodies and self.start_jd <= jd < self.end_jd
+
+    def longitude(self, jd, planet_id):
+        """Returns (longitude, speed in deg/day); the caller must check covers() first."""
+        interval, degree, segments, offset = self._bodies[planet_id]
+        seg = min(int((jd - self.start_jd) / interval), segments - 1)
+        seg_start = self.start_jd + seg * interval
+        x = 2.0 * (jd - seg_start) / interval - 1.0
+        c = self._coefficients
+        base = offset + seg * (degree + 1)
+
+        # Evaluate the series and its derivative together via the T_k recurrences.
+        t_prev, t_curr = 1.0, x
+        d_prev, d_curr = 0.0, 1.0
+        value = c[base] + c[base + 1] * x
+        slope = c[base + 1]
+        for k in range(2, degree + 1):
+            t_prev, t_curr = t_curr, 2.0 * x * t_curr - t_prev
+            d_prev, d_curr = d_curr, 2.0 * t_prev + 2.0 * x * d_curr - d_prev
+            value += c[base + k] * t_curr
+            slope += c[base + k] * d_curr
+        return value % 360.0, slope * 2.0 / interval
+
+    def close(self):
+        self._coefficients.release()
+        self._mmap.close()
+
+
+_store = None
+
+
+def load_store(path=None):
+    """Opens the table for calc_longitude(); returns it or None.
+
+    The table is `path`, else $ASTROMD_EPHEMERIS_TABLE, else DEFAULT_TABLE_PATH (where
+    `build` writes) when that file exists.
+    """
+    global _store
+    path = path or os.environ.get('ASTROMD_EPHEMERIS_TABLE')
+    if not path:
+        if not os.path.exists(DEFAULT_TABLE_PATH):
+            return None
+        path = DEFAULT_TABLE_PATH
+    try:
+        _store = EphemerisStore(path)
+    except (OSError, ValueError) as e:
+        print(f"Ephemeris table not loaded ({path}): {e}")
+        _store = None
+    return _store
+
+
+def warm_up():
+    """Forces pyswisseph to open its ephemeris files now instead of on the first request."""
+    swe.calc_ut(2451545.0, swe.SUN)
+    swe.calc_ut(2451545.0, swe.MOON)
+
+
+def calc_longitude(jd, planet_id):
+    """(longitude, speed) of a planet at Julian day `jd` (UT), from the table when it covers jd."""
+    store = _store
+    if store is not None and store.covers(jd, planet_id):
+        return store.longitude(jd, planet_id)
+    xx, _ = swe.calc_ut(jd, planet_id)
+    return xx[0], xx[3]
+
+
+def verify(path, samples=20000, seed=0):
+    """Compares the table against pyswisseph at random instants; returns max errors per body."""
+    store = EphemerisStore(path)
+    rng = random.Random(seed)
+    report = {}
+    for planet_id in store._bodies:
+        max_lon_error = 0.0
+        max_speed_error = 0.0
+        for _ in range(samples // len(store._bodies)):
+            jd = rng.uniform(store.start_jd, store.end_jd - 1e-6)
+            lon, speed = store.longitude(jd, planet_id)
+            xx, _ = swe.calc_ut(jd, planet_id)
+            max_lon_error = max(max_lon_error, abs((lon - xx[0] + 180.0) % 360.0 - 180.0))
+            max_speed_error = max(max_speed_error, abs(speed - xx[3]))
+        report[swe.get_planet_name(planet_id)] = {
+            'max_lon_error_arcsec': max_lon_error * 3600.0,
+            'max_speed_error_deg_per_day': max_speed_error,
+        }
+    store.close()
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or verify the precomputed ephemeris table.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    build_parser = sub.add_parser('build', help="fit Chebyshev tables from pyswisseph")
+    build_parser.add_argument('--start', type=int, default=1900, help="first year covered")
+    build_parser.add_argument('--end', type=int, default=2100, help="last year covered")
+    build_parser.add_argument('-o', '--output', default=DEFAULT_TABLE_PATH)
+    verify_parser = sub.add_parser('verify', help="compare a table against pyswisseph")
+    verify_parser.add_argument('table', nargs='?', default=DEFAULT_TABLE_PATH)
+    verify_parser.add_argument('--samples', type=int, default=20000)
+    verify_parser.add_argument('--tolerance', type=float, default=VERIFY_TOLERANCE,
+                                help="max longitude error in arcseconds")
+    args = parser.parse_args(argv)
+
+    swe.set_ephe_path(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ephe'))
+    if args.command == 'build':
+        build(args.output, args.start, args.end)
+        print(f"Wrote {args.output} ({os.path.getsize(args.output) / 1e6:.1f} MB)")
+        return 0
+
+    report = verify(args.table, args.samples)
+    failed = False
+    for body, errors in report.items():
+        ok = errors['max_lon_error_arcsec'] <= args.tolerance
+        failed |= not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {body:<8} max |dlon| {errors['max_lon_error_arcsec']:.6f}\"  "
+              f"max |dspeed| {errors['max_speed_error_deg_per_day']:.2e} deg/day")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,410 @@
+import asyncio
+import contextvars
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from cache_store import LRUCache, SingleFlight, SQLiteStore, default_cache_dir, shared_key_locks
+from metrics import stage
+
+try:
+    import httpx
+except ImportError:  # optional: without it geocode_async runs the blocking client in a thread
+    httpx = None
+
+# --- Geocoding with a layered cache ---
+# Lookup order: offline gazetteer -> in-process LRU -> SQLite store -> Nominatim.
+# Concurrent misses for the same place share one Nominatim call (and, with
+# ASTROMD_LOCK_DIR set, so do the workers on the host: the SQLite store is shared).
+
+NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
+USER_AGENT = 'AstroMD/1.0'
+
+# Upstream budget for one lookup: all attempts must finish within the deadline.
+CONNECT_TIMEOUT = 3.05
+READ_TIMEOUT = float(os.environ.get('ASTROMD_GEOCODE_TIMEOUT', 5))
+DEADLINE = float(os.environ.get('ASTROMD_GEOCODE_DEADLINE', 8))
+MAX_ATTEMPTS = 3
+BACKOFF_BASE = 0.25
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# Nominatim usage policy: at most 1 request/second on average. A bucket of 2 lets the
+# two lookups of a synastry request start together while keeping the sustained rate.
+RATE_PER_SEC = float(os.environ.get('ASTROMD_NOMINATIM_RATE', 1.0))
+RATE_BURST = 2
+MAX_CONCURRENCY = 2
+
+POSITIVE_TTL = 90 * 24 * 3600  # Places do not move; keep found coordinates for a long time.
+NEGATIVE_TTL = 24 * 3600       # "Not found" may be a typo that OSM later learns; expire sooner.
+
+project_root = os.path.dirname(os.path.abspath(__file__))
+GAZETTEER_PATH = os.path.join(project_root, 'data', 'gazetteer.json')
+
+_memory = LRUCache(maxsize=int(os.environ.get('ASTROMD_GEOCODE_LRU_SIZE', 2048)))
+_disk = None
+_disk_lock = threading.Lock()
+_gazetteer = None
+
+_session = None
+_session_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='geocode')
+_async_client = None  # httpx.AsyncClient, created on first use inside the running event loop
+_locks = shared_key_locks()
+_flight = SingleFlight(_locks)
+_pending = {}  # normalized query -> asyncio.Task of the in-flight geocode_async lookup
+
+_stats_lock = threading.Lock()
+_stats = {
+    'gazetteer_hits': 0,
+    'memory_hits': 0,
+    'disk_hits': 0,
+    'negative_hits': 0,
+    'misses': 0,
+    'errors': 0,
+    'retries': 0,
+    'coalesced': 0,
+}
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def geocode_cache_stats():
+    """Returns a snapshot of the geocoding hit/miss counters."""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['coalesced'] += _flight.coalesced
+    return stats
+
+
+def normalize_query(address):
+    """Normalizes a free-text place name into a cache key (width, case, whitespace, punctuation)."""
+    text = unicodedata.normalize('NFKC', address or '').casefold()
+    text = re.sub(r'[\s、，,]+', ' ', text)
+    return text.strip(' .。')
+
+
+def _get_disk():
+    global _disk
+    if _disk is None:
+        with _disk_lock:
+            if _disk is None:
+                path = os.environ.get('ASTROMD_GEOCODE_DB') or os.path.join(default_cache_dir(), 'astromd_geocode.sqlite3')
+                _disk = SQLiteStore(path, table='geocode')
+    return _disk
+
+
+def _get_gazetteer():
+    global _gazetteer
+    if _gazetteer is None:
+        table = {}
+        try:
+            with open(GAZETTEER_PATH, encoding='utf-8') as f:
+                for place in json.load(f)['places']:
+                    for place_name in place['names']:
+                        table[normalize_query(place_name)] = (place['lat'], place['lon'])
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Gazetteer unavailable: {e}")
+        _gazetteer = table
+    return _gazetteer
+
+
+def _get_session():
+    """Returns the shared keep-alive session used for all Nominatim requests."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                session.headers['User-Agent'] = USER_AGENT
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=MAX_CONCURRENCY * 2, max_retries=0)
+                session.mount('https://', adapter)
+                _session = session
+    return _session
+
+
+class _RateLimiter:
+    """Token bucket plus a concurrency cap for outbound Nominatim calls.
+
+    Shared by the blocking and the async client, so the process keeps one budget.
+    """
+    SLOT_POLL = 0.05  # async waiters re-check the concurrency slots this often (seconds)
+
+    def __init__(self, rate, burst, concurrency):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(concurrency)
+
+    def _reserve(self):
+        """Takes one token and returns how long the caller must wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0 or self.rate <= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self, deadline):
+        """Blocks until a request may be sent; returns False if that would pass the deadline."""
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not self._slots.acquire(timeout=remaining):
+            return False
+        wait = self._reserve()
+        if time.monotonic() + wait >= deadline:
+            self._slots.release()
+            return False
+        if wait:
+            time.sleep(wait)
+        return True
+
+    async def acquire_async(self, deadline):
+        """acquire() for event-loop callers: waits with asyncio.sleep instead of blocking the loop."""
+        while not self._slots.acquire(blocking=False):
+            if time.monotonic() + self.SLOT_POLL >= deadline:
+                return False
+            await asyncio.sleep(self.SLOT_POLL)
+        wait = self._reserve()
+        if time.monotonic() + wait >= deadline:
+            self._slots.release()
+            return False
+        if wait:
+            await asyncio.sleep(wait)
+        return True
+
+    def release(self):
+        self._slots.release()
+
+
+_limiter = _RateLimiter(RATE_PER_SEC, RATE_BURST, MAX_CONCURRENCY)
+
+
+def _fetch(address):
+    """Queries Nominatim. Returns (lat, lon), (None, None) when not found; raises on transport errors.
+
+    Retries timeouts, connection errors and 429/5xx with exponential backoff, but never
+    beyond DEADLINE seconds in total.
+    """
+    params = {'q': address, 'format': 'json', 'limit': 1}
+    deadline = time.monotonic() + DEADLINE
+    last_error = None
+    for attempt in range(MAX_ATTEMPTS):
+        if attempt:
+            _count('retries')
+            time.sleep(min(BACKOFF_BASE * (2 ** (attempt - 1)), max(0.0, deadline - time.monotonic())))
+        if not _limiter.acquire(deadline):
+            break
+        try:
+            remaining = deadline - time.monotonic()
+            timeout = (min(CONNECT_TIMEOUT, remaining), min(READ_TIMEOUT, remaining))
+            response = _get_session().get(NOMINATIM_URL, params=params, timeout=timeout)
+            if response.status_code in RETRY_STATUS:
+                last_error = requests.exceptions.HTTPError(f"{response.status_code} from Nominatim", response=response)
+                continue
+            response.raise_for_status()
+            data = response.json()
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+            last_error = e
+            continue
+        finally:
+            _limiter.release()
+        if data:
+            return float(data[0]["lat"]), float(data[0]["lon"])
+        return None, None
+    raise last_error or requests.exceptions.Timeout(f"Geocoding deadline of {DEADLINE}s exceeded")
+
+
+def _get_async_client():
+    global _async_client
+    if _async_client is None:
+        limits = httpx.Limits(max_connections=MAX_CONCURRENCY * 2, max_keepalive_connections=MAX_CONCURRENCY)
+        _async_client = httpx.AsyncClient(headers={'User-Agent': USER_AGENT}, limits=limits)
+    return _async_client
+
+
+async def close_async_client():
+    """Closes the async client's connections (call on event-loop shutdown)."""
+    global _async_client
+    if _async_client is not None:
+        client, _async_client = _async_client, None
+        await client.aclose()
+
+
+async def _fetch_async(address):
+    """_fetch for the event loop: same retries, deadline and rate limit, but awaits the network."""
+    if httpx is None:
+        return await asyncio.to_thread(_fetch, address)
+    params = {'q': address, 'format': 'json', 'limit': 1}
+    deadline = time.monotonic() + DEADLINE
+    last_error = None
+    for attempt in range(MAX_ATTEMPTS):
+        if attempt:
+            _count('retries')
+            await asyncio.sleep(min(BACKOFF_BASE * (2 ** (attempt - 1)), max(0.0, deadline - time.monotonic())))
+        if not await _limiter.acquire_async(deadline):
+            break
+        try:
+            remaining = deadline - time.monotonic()
+            timeout = httpx.Timeout(min(READ_TIMEOUT, remaining), connect=min(CONNECT_TIMEOUT, remaining))
+            response = await _get_async_client().get(NOMINATIM_URL, params=params, timeout=timeout)
+            if response.status_code in RETRY_STATUS:
+                last_error = requests.exceptions.HTTPError(f"{response.status_code} from Nominatim")
+                continue
+            if response.is_error:
+                raise requests.exceptions.HTTPError(f"{response.status_code} from Nominatim")
+            data = response.json()
+        except (httpx.TimeoutException, httpx.TransportError) as e:
+            # Reported as the requests exceptions so callers handle both clients alike.
+            last_error = requests.exceptions.ConnectionError(str(e) or type(e).__name__)
+            continue
+        finally:
+            _limiter.release()
+        if data:
+            return float(data[0]["lat"]), float(data[0]["lon"])
+        return None, None
+    raise last_error or requests.exceptions.Timeout(f"Geocoding deadline of {DEADLINE}s exceeded")
+
+
+def _cached(key):
+    """Looks `key` up in the gazetteer, the LRU and the SQLite store; None on a miss."""
+    coords = _cached_in_memory(key)
+    return coords if coords is not None else _cached_on_disk(key)
+
+
+def _cached_in_memory(key):
+    # The gazetteer and the LRU: no I/O, so safe to call on the event loop.
+    coords = _get_gazetteer().get(key)
+    if coords is not None:
+        _count('gazetteer_hits')
+        return coords
+
+    coords = _memory.get(key)
+    if coords is not None:
+        _count('negative_hits' if coords == (None, None) else 'memory_hits')
+    return coords
+
+
+def _cached_on_disk(key):
+    stored = _get_disk().get(key)
+    if stored is not None:
+        coords = tuple(json.loads(stored))
+        _memory.set(key, coords, ttl=NEGATIVE_TTL if coords == (None, None) else None)
+        _count('negative_hits' if coords == (None, None) else 'disk_hits')
+        return coords
+
+    _count('misses')
+    return None
+
+
+def _stored(key):
+    # The LRU and SQLite tiers only, without counting: the re-check after waiting for a key.
+    coords = _memory.get(key)
+    if coords is None:
+        stored = _get_disk().get(key)
+        coords = tuple(json.loads(stored)) if stored is not None else None
+    return coords
+
+
+def _store(key, coords):
+    ttl = NEGATIVE_TTL if coords == (None, None) else POSITIVE_TTL
+    _memory.set(key, coords, ttl=NEGATIVE_TTL if coords == (None, None) else None)
+    _get_disk().set(key, json.dumps(coords), ttl=ttl)
+
+
+def geocode(address):
+    """Resolves a place name to (lat, lon), or (None, None) if it cannot be found."""
+    key = normalize_query(address)
+    if not key:
+        return None, None
+    coords = _cached(key)
+    if coords is not None:
+        return coords
+    return _flight.do(key, lambda: _lookup(key, address))
+
+
+def _lookup(key, address):
+    # Runs for one caller per key at a time; the previous one may just have stored the answer.
+    coords = _stored(key)
+    if coords is not None:
+        return coords
+    try:
+        with stage('nominatim'):
+            coords = _fetch(address)
+    except requests.exceptions.RequestException as e:
+        # Transport errors are not cached: the next request should try again.
+        _count('errors')
+        print(f"Geocoding Error: {e}")
+        return None, None
+
+    _store(key, coords)
+    return coords
+
+
+async def geocode_async(address):
+    """geocode() for the event loop: memory hits return at once; SQLite reads and writes run
+    in a thread and Nominatim is awaited, so the loop never blocks."""
+    key = normalize_query(address)
+    if not key:
+        return None, None
+    coords = _cached_in_memory(key)
+    if coords is None:
+        coords = await asyncio.to_thread(_cached_on_disk, key)
+    if coords is not None:
+        return coords
+
+    task = _pending.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_lookup_async(key, address))
+        _pending[key] = task
+        task.add_done_callback(lambda _: _pending.pop(key, None))
+    else:
+        _count('coalesced')
+    # Shielded: a waiter that is cancelled (client gone) must not cancel the others' lookup.
+    return await asyncio.shield(task)
+
+
+async def _lookup_async(key, address):
+    held = await _locks.acquire_async(key, SingleFlight.LOCK_TIMEOUT) if _locks is not None else None
+    try:
+        coords = await asyncio.to_thread(_stored, key)
+        if coords is not None:
+            return coords
+        try:
+            with stage('nominatim'):
+                coords = await _fetch_async(address)
+        except requests.exceptions.RequestException as e:
+            _count('errors')
+            print(f"Geocoding Error: {e}")
+            return None, None
+
+        await asyncio.to_thread(_store, key, coords)
+        return coords
+    finally:
+        if held is not None:
+            _locks.release(held)
+
+
+def geocode_many(addresses):
+    """Resolves several place names concurrently, returning results in input order."""
+    if len(addresses) <= 1:
+        return [geocode(address) for address in addresses]
+    # Each call runs in a copy of the caller's context, so its stages (nominatim) are
+    # counted in the request's timings.
+    futures = [_executor.submit(contextvars.copy_context().run, geocode, address) for address in addresses]
+    return [future.result() for future in futures]
+
+
+async def geocode_many_async(addresses):
+    """Resolves several place names concurrently on the event loop, in input order."""
+    return list(await asyncio.gather(*(geocode_async(address) for address in addresses)))
@@ -0,0 +1,74 @@
+from bisect import bisect_right
+import numpy as np
+import swisseph as swe
+
+# --- House placement ---
+# Cusps come from swe.houses in zodiac order but wrap through 0° Aries somewhere. Rotating
+# them to start at the lowest longitude gives one increasing array, so placement is a
+# binary search. Longitudes are compared as-is (no offsets are subtracted), so a point
+# exactly on or just below a cusp lands where the cusp-by-cusp comparison puts it.
+
+
+class HouseIndex:
+    """House placement (1-12) for one chart's cusps; build once, query many times.
+
+    Around the 0° wrap and exactly on a cusp (run with `python -m doctest houses.py`):
+
+    >>> index = HouseIndex([359.9] + [30.0 * k for k in range(1, 12)])
+    >>> index.house_of(0.05), index.house_of(359.95), index.house_of(359.85), index.house_of(30.0)
+    (1, 1, 12, 2)
+    >>> index.houses_of([0.05, 359.95, 359.85, 30.0]).tolist()
+    [1, 1, 12, 2]
+    """
+    __slots__ = ('cusps', 'bounds', 'houses', '_arrays')
+
+    def __init__(self, house_cusps):
+        self.cusps = list(house_cusps[:12])
+        # First cusp after the 360° -> 0° wrap (0 if the cusps do not wrap).
+        wrap = next((i for i in range(1, 12) if self.cusps[i] < self.cusps[i - 1]), 0)
+        self.bounds = self.cusps[wrap:] + self.cusps[:wrap]
+        # houses[k] is the house that starts at bounds[k]. Longitudes below bounds[0]
+        # belong to the house that wraps through 0°, i.e. houses[-1].
+        self.houses = [(wrap + k) % 12 + 1 for k in range(12)]
+        self._arrays = None
+
+    def house_of(self, lon):
+        """House number of one longitude."""
+        return self.houses[bisect_right(self.bounds, lon) - 1]
+
+    def houses_of(self, lons):
+        """House numbers for an array of longitudes (any shape), as an int array."""
+        if self._arrays is None:
+            self._arrays = (np.array(self.bounds), np.array(self.houses))
+        bounds, houses = self._arrays
+        return houses[np.searchsorted(bounds, np.asarray(lons, dtype=np.float64), side='right') - 1]
+
+
+def get_house_for_point(point_lon, house_cusps):
+    """Determines the house number (1-12) for a given point longitude."""
+    return HouseIndex(house_cusps).house_of(point_lon)
+
+
+# --- House systems ---
+# Form/API names -> Swiss Ephemeris house system codes.
+HOUSE_SYSTEMS = {
+    'placidus': 'P', 'koch': 'K', 'whole_sign': 'W', 'equal': 'E', 'porphyry': 'O',
+    'regiomontanus': 'R', 'campanus': 'C', 'alcabitius': 'B', 'morinus': 'M',
+}
+
+
+def house_system_label(system):
+    return system.replace('_', ' ').title()
+
+
+def house_cusps(jd, lat, lon, system, ayanamsa=0.0):
+    """Cusps of `system` (a HOUSE_SYSTEMS name) in a zodiac `ayanamsa` degrees behind tropical."""
+    code = HOUSE_SYSTEMS[system]
+    cusps, ascmc = swe.houses_ex(jd, lat, lon, code.encode('ascii'))
+    if not ayanamsa:
+        return list(cusps)
+    if code == 'W':
+        # Whole sign houses start at the sidereal sign of the ASC, not the tropical one.
+        first = (ascmc[0] - ayanamsa) % 360 // 30 * 30
+        return [(first + 30 * k) % 360 for k in range(12)]
+    return [(cusp - ayanamsa) % 360 for cusp in cusps]
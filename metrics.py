@@ -0,0 +1,179 @@
+import os
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+from time import perf_counter
+
+# --- Stage timing and in-process metrics ---
+# `with stage('geocode'):` times a block with a monotonic clock, feeds a per-stage histogram
+# and, inside a request started with start_request(), adds to that request's timings (used
+# for the Server-Timing header). Set ASTROMD_METRICS=0 to turn every stage() into a shared
+# no-op context manager.
+
+ENABLED = os.environ.get('ASTROMD_METRICS', '1').strip().lower() not in ('0', 'false', 'no', 'off')
+
+# Upper bounds in seconds, Prometheus style (cumulative; +Inf is implicit).
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram; observe() is O(log buckets) under a lock."""
+    __slots__ = ('counts', 'sum', 'count', '_lock')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        index = bisect_left(BUCKETS, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += seconds
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+
+_registry_lock = threading.Lock()
+_histograms = {}  # (metric name, label items) -> Histogram
+_counters = {}    # (metric name, label items) -> int
+_collectors = []  # callables returning extra exposition lines, evaluated at scrape time
+_HELP = {
+    'astromd_stage_seconds': ('histogram', "Time spent in each pipeline stage."),
+    'astromd_request_seconds': ('histogram', "Request handling time until the response is returned."),
+    'astromd_requests_total': ('counter', "Handled requests by route and status."),
+    'astromd_errors_total': ('counter', "Unhandled exceptions by route."),
+}
+
+_request_timings = ContextVar('astromd_request_timings', default=None)
+
+
+def _histogram(name, labels):
+    key = (name, labels)
+    histogram = _histograms.get(key)
+    if histogram is None:
+        with _registry_lock:
+            histogram = _histograms.setdefault(key, Histogram())
+    return histogram
+
+
+def observe(name, seconds, **labels):
+    _histogram(name, tuple(sorted(labels.items()))).observe(seconds)
+
+
+def increment(name, amount=1, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with _registry_lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def record_stage(name, seconds):
+    _histogram('astromd_stage_seconds', (('stage', name),)).observe(seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        # Worker threads of one request (geocode_many) share its timings dict.
+        with _registry_lock:
+            timings[name] = timings.get(name, 0.0) + seconds
+
+
+class _Stage:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record_stage(self.name, perf_counter() - self.start)
+        return False
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+def stage(name):
+    """Context manager timing one pipeline stage (a no-op when metrics are disabled)."""
+    return _Stage(name) if ENABLED else _NULL_STAGE
+
+
+def start_request():
+    """Starts collecting stage timings for the current request; returns the start time."""
+    if ENABLED:
+        _request_timings.set({})
+    return perf_counter()
+
+
+def request_timings():
+    return _request_timings.get() or {}
+
+
+def server_timing(timings, total=None):
+    """Server-Timing header value: one entry per stage plus `total`, durations in ms."""
+    entries = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in timings.items()]
+    if total is not None:
+        entries.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(entries)
+
+
+def register_collector(collector):
+    """Adds a callable returning extra Prometheus exposition lines (e.g. cache statistics)."""
+    _collectors.append(collector)
+
+
+def _label_text(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in items) + "}"
+
+
+def exposition():
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    with _registry_lock:
+        histograms = sorted(_histograms.items())
+        counters = sorted(_counters.items())
+    lines = []
+    described = set()
+
+    def describe(name):
+        if name not in described and name in _HELP:
+            kind, text = _HELP[name]
+            lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} {kind}")
+            described.add(name)
+
+    for (name, labels), histogram in histograms:
+        describe(name)
+        counts, total, count = histogram.snapshot()
+        cumulative = 0
+        for bound, bucket_count in zip(BUCKETS + ('+Inf',), counts):
+            cumulative += bucket_count
+            lines.append(f"{name}_bucket{_label_text(labels, [('le', bound)])} {cumulative}")
+        lines.append(f"{name}_sum{_label_text(labels)} {total:.6f}")
+        lines.append(f"{name}_count{_label_text(labels)} {count}")
+    for (name, labels), value in counters:
+        describe(name)
+        lines.append(f"{name}{_label_text(labels)} {value}")
+    for collector in _collectors:
+        try:
+            lines.extend(collector())
+        except Exception as e:
+            print(f"Metrics collector failed: {e}")
+    return "\n".join(lines) + "\n"
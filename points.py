@@ -0,0 +1,160 @@
+import swisseph as swe
+from ephemeris_store import calc_longitude
+
+# --- Point catalogue ---
+# Every point a chart can show, by option id: (display name, group, kind, source).
+# Kinds say where the longitude comes from:
+#   body      swe.calc_ut body id (from the ephemeris table when it covers the body)
+#   angle     index into the ascmc array of swe.houses (needs the birth time)
+#   opposite  180 degrees from another catalogue point
+#   lot       Hermetic lot: ASC + a - b by day, ASC + b - a by night, for source (a, b)
+# Sources are listed before the points derived from them. Display names fit the
+# 10-character name column of the Markdown tables.
+
+POINT_CATALOGUE = {
+    'sun': ('Sun', 'planet', 'body', swe.SUN),
+    'moon': ('Moon', 'planet', 'body', swe.MOON),
+    'mercury': ('Mercury', 'planet', 'body', swe.MERCURY),
+    'venus': ('Venus', 'planet', 'body', swe.VENUS),
+    'mars': ('Mars', 'planet', 'body', swe.MARS),
+    'jupiter': ('Jupiter', 'planet', 'body', swe.JUPITER),
+    'saturn': ('Saturn', 'planet', 'body', swe.SATURN),
+    'uranus': ('Uranus', 'planet', 'body', swe.URANUS),
+    'neptune': ('Neptune', 'planet', 'body', swe.NEPTUNE),
+    'pluto': ('Pluto', 'planet', 'body', swe.PLUTO),
+    'asc': ('ASC', 'angle', 'angle', 0),
+    'mc': ('MC', 'angle', 'angle', 1),
+    'north_node': ('North Node', 'node', 'body', swe.MEAN_NODE),
+    'south_node': ('South Node', 'node', 'opposite', 'north_node'),
+    'chiron': ('Chiron', 'asteroid', 'body', swe.CHIRON),
+    'ceres': ('Ceres', 'asteroid', 'body', swe.CERES),
+    'pallas': ('Pallas', 'asteroid', 'body', swe.PALLAS),
+    'juno': ('Juno', 'asteroid', 'body', swe.JUNO),
+    'vesta': ('Vesta', 'asteroid', 'body', swe.VESTA),
+    'lilith': ('Lilith', 'apogee', 'body', swe.MEAN_APOG),  # Black Moon Lilith (mean)
+    'vertex': ('Vertex', 'angle', 'angle', 3),
+    'fortune': ('Fortune', 'lot', 'lot', ('moon', 'sun')),
+    'spirit': ('Spirit', 'lot', 'lot', ('sun', 'moon')),
+    'eros': ('Eros', 'lot', 'lot', ('venus', 'spirit')),
+    'necessity': ('Necessity', 'lot', 'lot', ('fortune', 'mercury')),
+    'courage': ('Courage', 'lot', 'lot', ('fortune', 'mars')),
+    'victory': ('Victory', 'lot', 'lot', ('jupiter', 'spirit')),
+    'nemesis': ('Nemesis', 'lot', 'lot', ('fortune', 'saturn')),
+    'true_node': ('True Node', 'node', 'body', swe.TRUE_NODE),
+    'east_point': ('East Point', 'angle', 'angle', 4),
+    'pholus': ('Pholus', 'asteroid', 'body', swe.PHOLUS),
+    'cupido': ('Cupido', 'uranian', 'body', swe.CUPIDO),
+    'hades': ('Hades', 'uranian', 'body', swe.HADES),
+    'zeus': ('Zeus', 'uranian', 'body', swe.ZEUS),
+    'kronos': ('Kronos', 'uranian', 'body', swe.KRONOS),
+    'apollon': ('Apollon', 'uranian', 'body', swe.APOLLON),
+    'admetos': ('Admetos', 'uranian', 'body', swe.ADMETOS),
+    'vulkanus': ('Vulkanus', 'uranian', 'body', swe.VULKANUS),
+    'poseidon': ('Poseidon', 'uranian', 'body', swe.POSEIDON),
+    'transpluto': ('Transpluto', 'uranian', 'body', swe.ISIS),
+}
+
+PLANET_IDS = {name: source for name, group, kind, source in POINT_CATALOGUE.values() if group == 'planet'}
+
+CLASSIC_POINTS = [point for point, entry in POINT_CATALOGUE.items() if entry[1] == 'planet'] + ['asc', 'mc']
+POINT_SETS = {
+    'classic': CLASSIC_POINTS,
+    'extended': CLASSIC_POINTS + ['north_node', 'south_node', 'chiron', 'ceres', 'pallas', 'juno', 'vesta',
+                                  'lilith', 'vertex', 'fortune'],
+    'lots': ['fortune', 'spirit', 'eros', 'necessity', 'courage', 'victory', 'nemesis'],
+    'uranian': [point for point, entry in POINT_CATALOGUE.items() if entry[1] == 'uranian'],
+    'full': list(POINT_CATALOGUE),
+}
+DEFAULT_POINT_SET = ['classic']
+POINT_OPTIONS = list(POINT_SETS) + list(POINT_CATALOGUE)
+
+# Pair rules, by display name (see aspect_engine.sensitive_mask):
+# - sensitive points depend on the birth time; two of them never aspect each other.
+# - minor points aspect the planets and angles only, with MINOR_ORB_FACTOR times the orb,
+#   so the aspect list grows linearly with the catalogue instead of quadratically.
+# - pattern points are the bodies that take part in complex aspects.
+# - an opposite point (South Node) adds nothing while its source is shown: its aspects
+#   mirror the source's, so only the source's are listed.
+SENSITIVE_POINTS = [entry[0] for entry in POINT_CATALOGUE.values() if entry[1] in ('angle', 'lot')]
+MINOR_POINTS = [entry[0] for entry in POINT_CATALOGUE.values() if entry[1] not in ('planet', 'angle')]
+PATTERN_POINTS = [entry[0] for entry in POINT_CATALOGUE.values() if entry[1] in ('planet', 'asteroid')]
+OPPOSITE_POINTS = {entry[0]: POINT_CATALOGUE[entry[3]][0] for entry in POINT_CATALOGUE.values() if entry[2] == 'opposite'}
+MINOR_ORB_FACTOR = 0.5
+
+_missing_bodies = set()  # bodies already reported as unavailable
+
+
+def expand_points(names):
+    """Catalogue ids for a list of point set and point ids, in catalogue order."""
+    selected = set()
+    for name in names:
+        selected.update(POINT_SETS.get(name, [name]))
+    return tuple(point for point in POINT_CATALOGUE if point in selected)
+
+
+def _with_sources(points):
+    needed = set(points)
+    for point in reversed(list(POINT_CATALOGUE)):
+        if point in needed:
+            kind, source = POINT_CATALOGUE[point][2:]
+            if kind == 'opposite':
+                needed.add(source)
+            elif kind == 'lot':
+                needed.update(source + ('asc', 'sun'))
+    return [point for point in POINT_CATALOGUE if point in needed]
+
+
+def _body_position(jd, body):
+    """(lon, speed) of a swe body, or None when its ephemeris file is not installed."""
+    try:
+        return calc_longitude(jd, body)
+    except swe.Error as e:
+        if body not in _missing_bodies:
+            _missing_bodies.add(body)
+            print(f"Skipping point {swe.get_planet_name(body)}: {e}")
+        return None
+
+
+def compute_points(jd, points, ascmc=None, ascmc_speed=None):
+    """[{'name', 'lon', 'speed'}] for catalogue `points` at Julian day `jd` (UT).
+
+    Each body is calculated once (in one pass, including those only needed as a source);
+    angles come from the given swe.houses result and opposites and lots are arithmetic
+    on those. Without `ascmc` the angles and lots are left out, as are bodies whose
+    ephemeris file is missing.
+    """
+    positions = {}
+    for point in _with_sources(points):
+        kind, source = POINT_CATALOGUE[point][2:]
+        if kind == 'body':
+            position = _body_position(jd, source)
+        elif kind == 'opposite':
+            position = positions.get(source)
+            if position is not None:
+                position = ((position[0] + 180) % 360, position[1])
+        elif ascmc is None:
+            position = None
+        elif kind == 'angle':
+            position = (ascmc[source], ascmc_speed[source])
+        else:
+            position = _lot(positions, *source)
+        positions[point] = position
+    return [{'name': POINT_CATALOGUE[point][0], 'lon': positions[point][0], 'speed': positions[point][1]}
+            for point in points if positions.get(point) is not None]
+
+
+def _lot(positions, a, b):
+    asc, sun = positions['asc'], positions['sun']
+    if positions.get(a) is None or positions.get(b) is None:
+        return None
+    # By night (Sun below the horizon, i.e. within 180 degrees after the ASC) a and b swap.
+    if (sun[0] - asc[0]) % 360 < 180:
+        a, b = b, a
+    (lon_a, speed_a), (lon_b, speed_b) = positions[a], positions[b]
+    return (asc[0] + lon_a - lon_b) % 360, asc[1] + speed_a - speed_b
+
+
+def orb_factors(names):
+    """Per-point orb multipliers for find_aspects(), or None when every point has the full orb."""
+    factors = [MINOR_ORB_FACTOR if name in MINOR_POINTS else 1.0 for name in names]
+    return factors if MINOR_ORB_FACTOR in factors else None
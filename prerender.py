@@ -0,0 +1,185 @@
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shutil
+from flask import Response, render_template, request, url_for
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# --- Build-time rendering of the content pages ---
+# Usage: python prerender.py [--output build]
+#
+# The content pages never change between deploys, so they are rendered once here
+# instead of per request. Every file under static/ is copied to assets/ under a
+# content-hashed name (css/main.css -> css/main.<hash>.css) and the pages link to those
+# names, which is what makes year-long immutable caching safe. Text files get .gz
+# (and, with the brotli package, .br) siblings. When a build exists, the app serves
+# pages and assets from memory with the best encoding the client accepts; a front-end
+# server can serve the same files directly (e.g. nginx gzip_static / brotli_static).
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+BUILD_DIR = os.environ.get('ASTROMD_BUILD_DIR') or os.path.join(PROJECT_ROOT, 'build')
+PAGES = {'/': 'index.html', '/faq': 'faq.html', '/synastry': 'synastry.html', '/examples': 'examples.html'}
+ASSET_PREFIX = '/assets/'
+
+COMPRESSIBLE = ('.html', '.css', '.js', '.json', '.svg', '.txt', '.ico')
+MIN_COMPRESS_BYTES = 256
+# Preferred first; the identity encoding is always available.
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+ASSET_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Page URLs are not fingerprinted: clients revalidate with the ETag (a 304 costs nothing).
+PAGE_CACHE_CONTROL = 'no-cache'
+MIMETYPES = {
+    '.html': 'text/html; charset=utf-8', '.css': 'text/css; charset=utf-8',
+    '.js': 'text/javascript; charset=utf-8', '.json': 'application/json', '.svg': 'image/svg+xml',
+    '.txt': 'text/plain; charset=utf-8', '.ico': 'image/x-icon', '.png': 'image/png',
+}
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def fingerprinted(filename, data):
+    stem, ext = os.path.splitext(filename)
+    return f"{stem}.{content_hash(data)}{ext}"
+
+
+def write_variants(path, data):
+    """Writes `path` plus whichever compressed siblings are smaller; returns their encodings."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    if not path.endswith(COMPRESSIBLE) or len(data) < MIN_COMPRESS_BYTES:
+        return []
+    compressed = {'gzip': gzip.compress(data, compresslevel=9, mtime=0)}  # mtime=0: reproducible builds
+    if brotli is not None:
+        compressed['br'] = brotli.compress(data, quality=11)
+    encodings = []
+    for encoding, suffix in ENCODINGS:
+        body = compressed.get(encoding)
+        if body is not None and len(body) < len(data):
+            with open(path + suffix, 'wb') as f:
+                f.write(body)
+            encodings.append(encoding)
+    return encodings
+
+
+def build(app, output=BUILD_DIR):
+    """Renders PAGES and fingerprints the static files into `output`; returns the manifest."""
+    shutil.rmtree(output, ignore_errors=True)
+    assets = {}
+    for root, _, files in os.walk(app.static_folder):
+        for name in sorted(files):
+            source = os.path.join(root, name)
+            relative = os.path.relpath(source, app.static_folder).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                data = f.read()
+            target = fingerprinted(relative, data)
+            assets[relative] = {'file': target, 'etag': content_hash(data),
+                                'encodings': write_variants(os.path.join(output, 'assets', target), data)}
+
+    def asset_url_for(endpoint, **values):
+        if endpoint == 'static' and values.get('filename') in assets:
+            return ASSET_PREFIX + assets[values['filename']]['file']
+        return url_for(endpoint, **values)
+
+    pages = {}
+    with app.test_request_context():
+        for route, template in PAGES.items():
+            html = render_template(template, url_for=asset_url_for).encode('utf-8')
+            encodings = write_variants(os.path.join(output, 'pages', template), html)
+            pages[route] = {'file': template, 'etag': content_hash(html), 'encodings': encodings}
+
+    manifest = {'assets': assets, 'pages': pages}
+    with open(os.path.join(output, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+# --- Serving a build ---
+
+class _Entry:
+    """One file of the build with its encoded variants, held in memory."""
+    __slots__ = ('bodies', 'etag', 'mimetype', 'cache_control')
+
+    def __init__(self, path, encodings, etag, cache_control):
+        self.bodies = {}
+        for encoding, suffix in ENCODINGS:
+            if encoding in encodings:
+                with open(path + suffix, 'rb') as f:
+                    self.bodies[encoding] = f.read()
+        with open(path, 'rb') as f:
+            self.bodies['identity'] = f.read()
+        self.etag = etag
+        self.mimetype = MIMETYPES.get(os.path.splitext(path)[1], 'application/octet-stream')
+        self.cache_control = cache_control
+
+    def response(self):
+        accepted = request.accept_encodings
+        encoding = next((name for name, _ in ENCODINGS if name in self.bodies and accepted[name]), 'identity')
+        # Each encoding is its own representation, so it gets its own strong ETag.
+        etag = self.etag if encoding == 'identity' else f"{self.etag}-{encoding}"
+        headers = {'Cache-Control': self.cache_control, 'Vary': 'Accept-Encoding', 'ETag': f'"{etag}"'}
+        if request.if_none_match.contains(etag):
+            return Response(status=304, headers=headers)
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return Response(self.bodies[encoding], content_type=self.mimetype, headers=headers)
+
+
+class Site:
+    """A build loaded for serving: pages by route and assets by fingerprinted name."""
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, 'manifest.json'), encoding='utf-8') as f:
+            manifest = json.load(f)
+        self.pages = {
+            route: _Entry(os.path.join(directory, 'pages', page['file']), page['encodings'], page['etag'],
+                          PAGE_CACHE_CONTROL)
+            for route, page in manifest['pages'].items()
+        }
+        self.assets = {
+            asset['file']: _Entry(os.path.join(directory, 'assets', asset['file']), asset['encodings'], asset['etag'],
+                                  ASSET_CACHE_CONTROL)
+            for asset in manifest['assets'].values()
+        }
+
+    def page(self, route):
+        entry = self.pages.get(route)
+        return entry.response() if entry else None
+
+    def asset(self, name):
+        entry = self.assets.get(name)
+        return entry.response() if entry else None
+
+
+def load_site(directory=BUILD_DIR):
+    """The build in `directory`, or None when there is none (pages are then rendered per request)."""
+    if not os.path.exists(os.path.join(directory, 'manifest.json')):
+        return None
+    try:
+        return Site(directory)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Ignoring pre-rendered build in {directory}: {e}")
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-render the content pages and fingerprint static assets.")
+    parser.add_argument('-o', '--output', default=BUILD_DIR, help="build directory (default: ASTROMD_BUILD_DIR or ./build)")
+    args = parser.parse_args(argv)
+
+    from app import app
+    manifest = build(app, args.output)
+    print(f"{len(manifest['pages'])} pages, {len(manifest['assets'])} assets -> {args.output}"
+          + ("" if brotli else " (no brotli package: gzip only)"))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,462 @@
+import csv
+import io
+import json
+from functools import lru_cache
+
+from aspect_engine import ASPECT_NAMES
+from houses import house_system_label
+from zodiac import frame_shift, zodiac_label
+
+# --- Chart renderers ---
+# Static text (zodiac positions, table headers, aspect-name fragments) is built once at
+# import time, so rendering a chart mostly concatenates interned pieces instead of running
+# padded f-strings per row. Renderers are pluggable output modes looked up by name.
+
+SIGNS = ("Aries", "Taurus", "Gemini", "Cancer", "Leo", "Virgo",
+         "Libra", "Scorpio", "Sagittarius", "Capricorn", "Aquarius", "Pisces")
+SIGN_ABBREVIATIONS = ("Ari", "Tau", "Gem", "Cnc", "Leo", "Vir", "Lib", "Sco", "Sgr", "Cap", "Aqr", "Psc")
+ASPECT_ABBREVIATIONS = {
+    'Conjunction': 'Cnj', 'Opposition': 'Opp', 'Trine': 'Tri', 'Square': 'Sqr', 'Sextile': 'Sxt',
+    'Quincunx': 'Qcx', 'Semisextile': 'SSx', 'Semisquare': 'SSq', 'Sesquiquadrate': 'Ses',
+    'Quintile': 'Qnt', 'Biquintile': 'BQn',
+}
+
+# --- Lookup tables (one entry per arc minute of the zodiac) ---
+LON_TEXT = tuple(f"{sign} {deg}°{minute:02d}'" for sign in SIGNS for deg in range(30) for minute in range(60))
+LON_CELL = tuple(f"{text:<18}" for text in LON_TEXT)
+LON_COMPACT = tuple(f"{sign}{deg}°{minute:02d}" for sign in SIGN_ABBREVIATIONS for deg in range(30) for minute in range(60))
+
+HOUSE_CELL = {house: f"{house:<5}" for house in range(1, 13)}
+CUSP_CELL = tuple(f"{house:<10}" for house in range(1, 13))
+
+ASPECT_FRAGMENT = {name: f" {name} " for name in ASPECT_NAMES}
+# Oppositions to the angles (and the North Node) read better as conjunctions to the opposite point.
+OPPOSITE_ANGLE = {'MC': ' Conjunction IC', 'ASC': ' Conjunction DSC', 'North Node': ' Conjunction South Node'}
+
+TIME_UNKNOWN_NOTE = "出生時刻が未入力のため、ASC/MCを含むアスペクトは計算していません。"
+POINTS_HEADING = "\n### Planets and Points"
+POINTS_TABLE = "| Name      | Position           | House |\n| :-------- | :----------------- | :----:|"
+POINTS_TABLE_NO_HOUSES = "| Name      | Position           |\n| :-------- | :----------------- |"
+CUSPS_TABLE = "\n### House Cusps\n| House     | Position           |\n| :-------- | :----------------- |"
+SECTION_RULE = "\n---\n"
+
+
+def lon_index(lon):
+    """Index into the LON_* tables: the arc minute of the zodiac that `lon` falls in."""
+    return int(lon // 30) * 1800 + int(lon % 30) * 60 + int((lon % 1) * 60)
+
+
+def format_lon(lon):
+    return LON_TEXT[lon_index(lon)]
+
+
+@lru_cache(maxsize=1024)
+def name_cell(name):
+    return f"{name:<10}"
+
+
+def orb_text(orb):
+    return " (Orb: " + format(orb, '.2f') + "°)"
+
+
+def format_aspect_string(p1_name, p2_name, aspect_name, orb):
+    """Formats the aspect string with special handling for MC/ASC oppositions."""
+    if aspect_name == 'Opposition':
+        if p2_name in OPPOSITE_ANGLE:
+            return p1_name + OPPOSITE_ANGLE[p2_name] + orb_text(orb)
+        if p1_name in OPPOSITE_ANGLE:
+            return p2_name + OPPOSITE_ANGLE[p1_name] + orb_text(orb)
+    return p1_name + ASPECT_FRAGMENT[aspect_name] + p2_name + orb_text(orb)
+
+
+def display_name(birth_data, index):
+    """Chart heading name, available before the chart is calculated."""
+    return (birth_data.get('name') or '').strip() or f"Chart {index}"
+
+
+def chart_label(chart, index):
+    return chart['name'] or f"Chart {index}"
+
+
+def house_overlays(chart1, chart2):
+    """(point name, house of chart1) for each of chart2's points."""
+    house_of = chart1['house_index'].house_of
+    shift = frame_shift(chart1, chart2)
+    return [(p2['name'], house_of((p2['lon'] + shift) % 360)) for p2 in chart2['points']]
+
+
+def variant_label(variant):
+    return zodiac_label(variant['zodiac']) + " / " + house_system_label(variant['house_system'])
+
+
+def shown_variants(chart):
+    """Variants worth listing: all of them, or one per zodiac when houses are not shown."""
+    variants = chart.get('variants') or []
+    if not chart.get('time_unknown'):
+        return variants
+    seen = set()
+    return [v for v in variants if not (v['zodiac'] in seen or seen.add(v['zodiac']))]
+
+
+def format_angle(angle):
+    return f"{int(angle)}°{int((angle % 1) * 60):02d}'"
+
+
+def chart_to_json(chart):
+    """Returns a JSON-serializable view of a calculated chart, with numbers instead of text.
+
+    Sections the chart was calculated without (see calculate_chart) are left out.
+    """
+    time_known = not chart.get('time_unknown')
+    with_houses = 'house_index' in chart
+    names = [p['name'] for p in chart['points']]
+    house_of = chart['house_index'].house_of if time_known and with_houses else None
+    points = []
+    for point in chart['points']:
+        entry = {'name': point['name'], 'lon': point['lon'], 'speed': point.get('speed')}
+        if house_of:
+            entry['house'] = house_of(point['lon'])
+        points.append(entry)
+    result = {
+        'name': chart['name'],
+        'date': chart['date_str'],
+        'location': chart['location_str'],
+        'time_unknown': chart['time_unknown'],
+        'timezone': chart['timezone'],
+        'utc_offset': chart['utc_offset'],
+        'points': points,
+    }
+    if with_houses:
+        result['houses'] = chart['houses'] if time_known else None
+    if 'aspects' in chart:
+        result['aspects'] = [asp.to_dict(names) for asp in chart['aspects']]
+    if 'complex_aspects' in chart:
+        result['complex_aspects'] = chart['complex_aspects']
+    result['house_system'] = chart.get('house_system', 'placidus')
+    result['zodiac'] = chart.get('zodiac', 'tropical')
+    result['ayanamsa'] = chart.get('ayanamsa', 0.0)
+    if with_houses:
+        result['variants'] = [_variant_to_json(chart, variant) for variant in shown_variants(chart)[1:]]
+    return result
+
+
+def _variant_to_json(chart, variant):
+    time_known = not chart.get('time_unknown')
+    points = []
+    for point in variant['points']:
+        entry = {'name': point['name'], 'lon': point['lon']}
+        if time_known:
+            entry['house'] = variant['house_index'].house_of(point['lon'])
+        points.append(entry)
+    return {
+        'zodiac': variant['zodiac'],
+        'house_system': variant['house_system'],
+        'ayanamsa': variant['ayanamsa'],
+        'points': points,
+        'houses': variant['houses'] if time_known else None,
+    }
+
+
+class Renderer:
+    """One output mode. A fresh instance renders one document.
+
+    The driver calls header() before anything is calculated, chart() once per chart as it
+    becomes available, synastry() for two-chart requests and finally footer(). Each returns
+    a list of text chunks; the document is their concatenation.
+    """
+    name = None
+    mimetype = 'text/plain'
+
+    def __init__(self):
+        self._first = True
+
+    def _chunk(self, lines):
+        # Markdown-style chunks: sections joined by newlines, no trailing newline.
+        text = "\n".join(lines)
+        if not self._first:
+            text = "\n" + text
+        self._first = False
+        return text
+
+    def header(self, data1, data2):
+        return []
+
+    def chart(self, chart, index, is_synastry):
+        return []
+
+    def synastry(self, chart1, chart2, aspects):
+        return []
+
+    def footer(self):
+        return []
+
+
+class MarkdownRenderer(Renderer):
+    """The full Markdown document served by /generate."""
+    name = 'markdown'
+    mimetype = 'text/markdown'
+
+    def header(self, data1, data2):
+        name1 = display_name(data1, 1)
+        lines = [f"# Synastry Chart: {name1} and {display_name(data2, 2)}" if data2 else f"# Horoscope for {name1}"]
+        notes = [f"- 注記 (Chart {index}): {TIME_UNKNOWN_NOTE}"
+                 for index, data in ((1, data1), (2, data2)) if data and data.get('time_unknown')]
+        if notes:
+            lines.append("\n> 注意\n")
+            lines.extend(["> " + note for note in notes])
+        return [self._chunk(lines)]
+
+    def chart(self, chart, index, is_synastry):
+        chunks = [self._chunk(self._points(chart, index, is_synastry))]
+        if not chart.get('time_unknown'):
+            chunks.append(self._chunk(self._cusps(chart)))
+        if len(shown_variants(chart)) > 1:
+            chunks.append(self._chunk(self._variants(chart)))
+        chunks.append(self._chunk(self._aspects(chart)))
+        chunks.append(self._chunk(self._complex_aspects(chart)))
+        return chunks
+
+    def _points(self, chart, index, is_synastry):
+        lines = [SECTION_RULE, "## " + chart_label(chart, index)] if is_synastry else []
+        lines.append("- **Date:** " + chart['date_str'])
+        lines.append("- **Location:** " + chart['location_str'])
+        if chart.get('zodiac', 'tropical') != 'tropical' or chart.get('house_system', 'placidus') != 'placidus':
+            zodiac = zodiac_label(chart['zodiac'])
+            if chart['ayanamsa']:
+                zodiac += " (Ayanamsa " + format_angle(chart['ayanamsa']) + ")"
+            lines.append("- **Zodiac / Houses:** " + zodiac + " / " + house_system_label(chart['house_system']))
+        lines.append(POINTS_HEADING)
+        if chart.get('time_unknown'):
+            lines.append(POINTS_TABLE_NO_HOUSES)
+            for point in chart['points']:
+                lines.append("| " + name_cell(point['name']) + "| " + LON_CELL[lon_index(point['lon'])] + " |")
+        else:
+            lines.append(POINTS_TABLE)
+            house_of = chart['house_index'].house_of
+            for point in chart['points']:
+                lon = point['lon']
+                lines.append("| " + name_cell(point['name']) + "| " + LON_CELL[lon_index(lon)] + " | "
+                             + HOUSE_CELL[house_of(lon)] + " |")
+        return lines
+
+    def _cusps(self, chart):
+        lines = [CUSPS_TABLE]
+        for cell, cusp in zip(CUSP_CELL, chart['houses']):
+            lines.append("| " + cell + "| " + LON_CELL[lon_index(cusp)] + " |")
+        return lines
+
+    def _variants(self, chart):
+        # One column per zodiac / house system pair; the first is the chart's own.
+        variants = shown_variants(chart)
+        time_known = not chart.get('time_unknown')
+        labels = [zodiac_label(v['zodiac']) if not time_known else variant_label(v) for v in variants]
+        widths = [max(len(label), 24) for label in labels]
+        lines = ["\n### Zodiacs and House Systems",
+                 "| Name      | " + " | ".join([label.ljust(w) for label, w in zip(labels, widths)]) + " |",
+                 "| :-------- | " + " | ".join([":" + "-" * (w - 1) for w in widths]) + " |"]
+        for n, point in enumerate(chart['points']):
+            cells = []
+            for variant, width in zip(variants, widths):
+                lon = variant['points'][n]['lon']
+                cell = LON_TEXT[lon_index(lon)]
+                if time_known:
+                    cell += " (H" + str(variant['house_index'].house_of(lon)) + ")"
+                cells.append(cell.ljust(width))
+            lines.append("| " + name_cell(point['name']) + "| " + " | ".join(cells) + " |")
+        return lines
+
+    def _aspects(self, chart):
+        lines = ["\n### Aspects (Natal)"]
+        if not chart['aspects']:
+            lines.append("- No major aspects found.")
+        points = chart['points']
+        for asp in chart['aspects']:
+            lines.append("- " + format_aspect_string(points[asp.p1]['name'], points[asp.p2]['name'], asp.name, asp.orb))
+        return lines
+
+    def _complex_aspects(self, chart):
+        lines = ["\n### Complex Aspects"]
+        if not chart['complex_aspects']:
+            lines.append("- No complex aspects found.")
+        for complex_asp in chart['complex_aspects']:
+            lines.append("- **" + complex_asp['type'] + "**: " + " ".join(complex_asp['planets']))
+            if complex_asp.get('apex_planet'):
+                lines.append("  - Apex Planet: " + complex_asp['apex_planet'])
+            for asp_detail in complex_asp['aspects']:
+                lines.append("  - " + asp_detail)
+        return lines
+
+    def synastry(self, chart1, chart2, aspects):
+        name1 = chart_label(chart1, 1)
+        name2 = chart_label(chart2, 2)
+        prefix1 = name1 + "'s "
+        prefix2 = name2 + "'s "
+        points1 = chart1['points']
+        points2 = chart2['points']
+        lines = [SECTION_RULE, f"## Synastry Aspects ({name1} & {name2})"]
+        if not aspects:
+            lines.append("- No major synastry aspects found.")
+        for asp in aspects:
+            lines.append("- " + format_aspect_string(prefix1 + points1[asp.p1]['name'], prefix2 + points2[asp.p2]['name'],
+                                                     asp.name, asp.orb))
+        chunks = [self._chunk(lines)]
+
+        # Show overlays section only if chart1's time is known
+        if not chart1.get('time_unknown'):
+            lines = [SECTION_RULE, f"## House Overlays ({name2} in {name1}'s Houses)"]
+            overlays = house_overlays(chart1, chart2)
+            if not overlays:
+                lines.append("- No house overlays found.")
+            for point_name, house in overlays:
+                lines.append(f"- {prefix2}{point_name} in {prefix1}House {house}")
+            chunks.append(self._chunk(lines))
+        return chunks
+
+
+class CompactRenderer(Renderer):
+    """Terse Markdown for language-model prompts: no tables, abbreviated signs and aspects."""
+    name = 'compact'
+    mimetype = 'text/markdown'
+
+    def header(self, data1, data2):
+        title = "# " + display_name(data1, 1)
+        if data2:
+            title += " × " + display_name(data2, 2)
+        lines = [title]
+        for index, data in ((1, data1), (2, data2)):
+            if data and data.get('time_unknown'):
+                lines.append(f"note: Chart {index} time unknown, no houses or ASC/MC aspects")
+        return [self._chunk(lines)]
+
+    def chart(self, chart, index, is_synastry):
+        lines = ["## " + chart_label(chart, index), chart['date_str'] + " | " + chart['location_str']]
+        time_known = not chart.get('time_unknown')
+        house_of = chart['house_index'].house_of if time_known else None
+        for point in chart['points']:
+            lon = point['lon']
+            line = point['name'] + " " + LON_COMPACT[lon_index(lon)]
+            if time_known:
+                line += " H" + str(house_of(lon))
+            lines.append(line)
+        if time_known:
+            lines.append("cusps: " + " ".join([LON_COMPACT[lon_index(cusp)] for cusp in chart['houses']]))
+        for variant in shown_variants(chart)[1:]:
+            label = variant['zodiac'] if not time_known else variant['zodiac'] + "/" + variant['house_system']
+            index_of = variant['house_index'].house_of if time_known else None
+            lines.append(label + ": " + " ".join([
+                LON_COMPACT[lon_index(p['lon'])] + (" H" + str(index_of(p['lon'])) if time_known else "")
+                for p in variant['points']
+            ]))
+        points = chart['points']
+        if chart['aspects']:
+            lines.append("aspects: " + "; ".join([
+                points[asp.p1]['name'] + " " + ASPECT_ABBREVIATIONS[asp.name] + " " + points[asp.p2]['name']
+                + " " + format(asp.orb, '.1f') for asp in chart['aspects']
+            ]))
+        for complex_asp in chart['complex_aspects']:
+            line = complex_asp['type'] + ": " + " ".join(complex_asp['planets'])
+            if complex_asp.get('apex_planet'):
+                line += " (apex " + complex_asp['apex_planet'] + ")"
+            lines.append(line)
+        return [self._chunk(lines)]
+
+    def synastry(self, chart1, chart2, aspects):
+        name1 = chart_label(chart1, 1)
+        name2 = chart_label(chart2, 2)
+        points1 = chart1['points']
+        points2 = chart2['points']
+        lines = [f"## {name1} × {name2}"]
+        if aspects:
+            lines.append("aspects: " + "; ".join([
+                "1." + points1[asp.p1]['name'] + " " + ASPECT_ABBREVIATIONS[asp.name] + " 2." + points2[asp.p2]['name']
+                + " " + format(asp.orb, '.1f') for asp in aspects
+            ]))
+        if not chart1.get('time_unknown'):
+            lines.append("overlays: " + " ".join([f"2.{name} H{house}" for name, house in house_overlays(chart1, chart2)]))
+        return [self._chunk(lines)]
+
+
+class JsonRenderer(Renderer):
+    """The generate_horoscope_json() structure, serialized as it is produced."""
+    name = 'json'
+    mimetype = 'application/json'
+
+    def __init__(self):
+        super().__init__()
+        self._charts_open = True
+
+    def header(self, data1, data2):
+        return ['{"charts": [']
+
+    def chart(self, chart, index, is_synastry):
+        text = json.dumps(chart_to_json(chart), ensure_ascii=False)
+        return [text if index == 1 else ", " + text]
+
+    def synastry(self, chart1, chart2, aspects):
+        names1 = [p['name'] for p in chart1['points']]
+        names2 = [p['name'] for p in chart2['points']]
+        self._charts_open = False
+        rows = [asp.to_dict(names1, names2) for asp in aspects]
+        return ['], "synastry_aspects": ' + json.dumps(rows, ensure_ascii=False)]
+
+    def footer(self):
+        return [']}' if self._charts_open else '}']
+
+
+class CsvRenderer(Renderer):
+    """One row per point, cusp, aspect, pattern and overlay."""
+    name = 'csv'
+    mimetype = 'text/csv'
+    FIELDS = ('section', 'chart', 'name', 'lon', 'position', 'house', 'aspect', 'other_chart', 'other', 'orb', 'variant')
+
+    def _rows(self, rows):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        return buffer.getvalue()
+
+    def header(self, data1, data2):
+        return [self._rows([self.FIELDS])]
+
+    def chart(self, chart, index, is_synastry):
+        time_known = not chart.get('time_unknown')
+        points = chart['points']
+        rows = []
+        # Points and cusps once per zodiac / house system variant, the chart's own first.
+        for variant in shown_variants(chart) or [chart]:
+            label = variant.get('zodiac', 'tropical') + "/" + variant.get('house_system', 'placidus')
+            house_of = variant['house_index'].house_of if time_known else None
+            for point in variant['points']:
+                lon = point['lon']
+                house = house_of(lon) if time_known else ''
+                rows.append(('point', index, point['name'], format(lon, '.6f'), LON_TEXT[lon_index(lon)], house,
+                             '', '', '', '', label))
+            if time_known:
+                for house, cusp in enumerate(variant['houses'], 1):
+                    rows.append(('cusp', index, house, format(cusp, '.6f'), LON_TEXT[lon_index(cusp)], house,
+                                 '', '', '', '', label))
+        for asp in chart['aspects']:
+            rows.append(('aspect', index, points[asp.p1]['name'], '', '', '', asp.name, index, points[asp.p2]['name'],
+                         format(asp.orb, '.4f'), ''))
+        for complex_asp in chart['complex_aspects']:
+            rows.append(('pattern', index, complex_asp['type'], '', '', '', '', '', " ".join(complex_asp['planets']), '', ''))
+        return [self._rows(rows)]
+
+    def synastry(self, chart1, chart2, aspects):
+        points1 = chart1['points']
+        points2 = chart2['points']
+        rows = [('synastry', 1, points1[asp.p1]['name'], '', '', '', asp.name, 2, points2[asp.p2]['name'],
+                 format(asp.orb, '.4f'), '') for asp in aspects]
+        if not chart1.get('time_unknown'):
+            rows.extend(('overlay', 2, name, '', '', house, '', 1, '', '', '') for name, house in house_overlays(chart1, chart2))
+        return [self._rows(rows)]
+
+
+RENDERERS = {renderer.name: renderer for renderer in (MarkdownRenderer, CompactRenderer, JsonRenderer, CsvRenderer)}
+
+
+def get_renderer(name):
+    """Returns a fresh renderer for output mode `name`; raises ValueError for unknown modes."""
+    try:
+        return RENDERERS[name or 'markdown']()
+    except KeyError:
+        raise ValueError(f"Unknown output format: {name} (expected one of {', '.join(RENDERERS)})")
@@ -0,0 +1,65 @@
+from datetime import datetime, timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+try:
+    from timezonefinder import TimezoneFinder
+except ImportError:  # optional: without it every chart is treated as Japan time, as before
+    TimezoneFinder = None
+
+# --- Birth-place time zones ---
+# The zone is looked up from coordinates with timezonefinder's in-process index of the
+# time-zone polygons (no network call), and the UTC offset for the local date comes from
+# the IANA transition tables via zoneinfo, so historical DST and zone changes apply.
+
+DEFAULT_TIMEZONE = 'Asia/Tokyo'
+
+_finder = None
+
+
+def _get_finder():
+    global _finder
+    if _finder is None and TimezoneFinder is not None:
+        _finder = TimezoneFinder(in_memory=True)
+    return _finder
+
+
+@lru_cache(maxsize=8192)
+def _timezone_at(lat, lon):
+    finder = _get_finder()
+    if finder is None:
+        return DEFAULT_TIMEZONE
+    return finder.timezone_at(lat=lat, lng=lon) or finder.timezone_at_land(lat=lat, lng=lon) or DEFAULT_TIMEZONE
+
+
+def timezone_name_at(lat, lon):
+    """IANA zone name for a coordinate (rounded to ~100 m so nearby lookups share the cache)."""
+    return _timezone_at(round(float(lat), 3), round(float(lon), 3))
+
+
+def to_utc(year, month, day, hour, minute, tz_name):
+    """Converts local civil time at `tz_name` to UTC.
+
+    Returns (utc datetime, UTC offset as timedelta, display label such as 'JST' or 'UTC+05:45').
+    Raises ValueError for an invalid date or unknown zone.
+    """
+    try:
+        zone = ZoneInfo(tz_name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Unknown time zone: {tz_name}")
+    local = datetime(year, month, day, hour, minute, tzinfo=zone)
+    offset = local.utcoffset()
+    abbreviation = local.tzname() or ''
+    if abbreviation[:1].isalpha() and abbreviation not in ('LMT', 'UTC', 'GMT'):
+        label = abbreviation
+    else:
+        label = f"UTC{format_offset(offset)}"
+    return local.astimezone(timezone.utc), offset, label
+
+
+def format_offset(offset):
+    """Formats a timedelta UTC offset as +HH:MM (seconds, as in LMT, are dropped)."""
+    total = int(offset.total_seconds()) // 60
+    sign = '+' if total >= 0 else '-'
+    total = abs(total)
+    return f"{sign}{total // 60:02d}:{total % 60:02d}"
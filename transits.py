@@ -0,0 +1,212 @@
+from functools import lru_cache
+import numpy as np
+import swisseph as swe
+from aspect_engine import ASPECT_NAMES, ASPECT_IDS, SENSITIVE_POINTS, select_aspects
+from points import PLANET_IDS
+from ephemeris_store import calc_longitude
+
+# --- Transit time series ---
+# Planet positions are sampled once per day at 0h UT (cached per day, so overlapping
+# ranges and repeated natal charts reuse them). Between samples, longitudes are
+# interpolated with cubic Hermite polynomials using the daily speeds, which is vectorized
+# over every day, body and natal target at once. Exact aspect times are then found by
+# bracketing sign changes on the daily grid and refining with Newton's method on the
+# interpolant, instead of stepping through time.
+
+MAX_RANGE_DAYS = 366 * 20
+MAX_POSITIONS = 20000  # sampled positions per request (e.g. hourly over two years)
+CHUNK_DAYS = 128  # days of the crossing search held in memory at once
+NEWTON_ITERATIONS = 5
+TRANSIT_BODIES = list(PLANET_IDS)
+
+
+@lru_cache(maxsize=366 * 50)
+def _daily_positions(jd_day):
+    """(longitudes, speeds) of the transit bodies at one 0h UT Julian day."""
+    lons = []
+    speeds = []
+    for planet_id in PLANET_IDS.values():
+        lon, speed = calc_longitude(jd_day, planet_id)
+        lons.append(lon)
+        speeds.append(speed)
+    return tuple(lons), tuple(speeds)
+
+
+def sample_positions(start_jd, end_jd):
+    """Daily grid covering [start_jd, end_jd]: returns (days, unwrapped lons, speeds).
+
+    Longitudes are unwrapped along time so that interpolation never crosses 360 -> 0.
+    """
+    first = np.floor(start_jd - 0.5) + 0.5
+    last = np.ceil(end_jd - 0.5) + 0.5
+    days = np.arange(first, last + 1.0)
+    if len(days) < 2:
+        days = np.array([first, first + 1.0])
+    samples = [_daily_positions(float(day)) for day in days]
+    lons = np.array([sample[0] for sample in samples])
+    speeds = np.array([sample[1] for sample in samples])
+    return days, np.unwrap(lons, period=360, axis=0), speeds
+
+
+def _hermite(p0, p1, m0, m1, s):
+    """Value and derivative (deg/day) of the cubic Hermite interpolant at day fraction s."""
+    s2 = s * s
+    s3 = s2 * s
+    value = (2 * s3 - 3 * s2 + 1) * p0 + (s3 - 2 * s2 + s) * m0 + (-2 * s3 + 3 * s2) * p1 + (s3 - s2) * m1
+    slope = (6 * s2 - 6 * s) * p0 + (3 * s2 - 4 * s + 1) * m0 + (-6 * s2 + 6 * s) * p1 + (3 * s2 - 2 * s) * m1
+    return value, slope
+
+
+def interpolate_positions(days, lons, speeds, jds):
+    """Longitudes (0-360) of every transit body at each Julian day in `jds`."""
+    jds = np.asarray(jds, dtype=np.float64)
+    index = np.clip((jds - days[0]).astype(int), 0, len(days) - 2)
+    s = (jds - days[index])[:, None]
+    value, _ = _hermite(lons[index], lons[index + 1], speeds[index], speeds[index + 1], s)
+    return value % 360
+
+
+def _wrap(angle):
+    return (angle + 180) % 360 - 180
+
+
+def _crossings(days, lons, speeds, target_lons):
+    """(jds, body, target, longitude, speed) of every exact crossing within the daily grid."""
+    # Signed distance from every target on the daily grid: shape (days, bodies, targets).
+    distance = _wrap(lons[:, :, None] - target_lons[None, None, :])
+    crossing = (np.sign(distance[:-1]) != np.sign(distance[1:])) & \
+               (np.abs(distance[:-1]) < 90) & (np.abs(distance[1:]) < 90)
+    day_index, body, target = np.nonzero(crossing)
+
+    # Newton's method on the interpolant, starting from the linear estimate in each bracket.
+    d0 = distance[day_index, body, target]
+    d1 = distance[day_index + 1, body, target]
+    p0, p1 = lons[day_index, body], lons[day_index + 1, body]
+    m0, m1 = speeds[day_index, body], speeds[day_index + 1, body]
+    goal = target_lons[target]
+    s = np.clip(d0 / (d0 - d1), 0.0, 1.0)
+    for _ in range(NEWTON_ITERATIONS):
+        value, slope = _hermite(p0, p1, m0, m1, s)
+        step = np.divide(_wrap(value - goal), slope, out=np.zeros_like(s), where=slope != 0)
+        s = np.clip(s - step, 0.0, 1.0)
+    value, slope = _hermite(p0, p1, m0, m1, s)
+    return days[day_index] + s, body, target, value, slope
+
+
+def find_transit_hits(natal_chart, start_jd, end_jd, aspects_to_calculate):
+    """Exact transit-to-natal aspect times in [start_jd, end_jd], sorted by time."""
+    days, lons, speeds = sample_positions(start_jd, end_jd)
+    natal_points = [p for p in natal_chart['points']
+                    if not (natal_chart.get('time_unknown') and p['name'] in SENSITIVE_POINTS)]
+    # Transits are found in the tropical frame; a sidereal natal chart is shifted back.
+    shift = natal_chart.get('ayanamsa', 0.0)
+
+    # One target longitude per (natal point, aspect, side); 0 and 180 have a single side.
+    target_lons, target_point, target_aspect = [], [], []
+    for n, point in enumerate(natal_points):
+        for aspect_name, (angle, _) in aspects_to_calculate.items():
+            for side in ((angle,) if angle in (0, 180) else (angle, -angle)):
+                target_lons.append((point['lon'] + shift + side) % 360)
+                target_point.append(n)
+                target_aspect.append(ASPECT_IDS[aspect_name])
+    target_lons = np.array(target_lons)
+
+    # Chunks of CHUNK_DAYS brackets (consecutive chunks share their boundary day), so the
+    # dense distance array stays small however long the range is.
+    chunks = [_crossings(days[lo:lo + CHUNK_DAYS + 1], lons[lo:lo + CHUNK_DAYS + 1], speeds[lo:lo + CHUNK_DAYS + 1],
+                         target_lons)
+              for lo in range(0, len(days) - 1, CHUNK_DAYS)]
+    hit_jds, body, target, value, slope = (np.concatenate(column) for column in zip(*chunks))
+
+    keep = (hit_jds >= start_jd) & (hit_jds <= end_jd)
+    # Natal house the transiting body is passing through at the exact time.
+    houses = None if natal_chart.get('time_unknown') else natal_chart['house_index'].houses_of((value[keep] - shift) % 360).tolist()
+    hits = []
+    for n, (jd, b, t, rate) in enumerate(zip(hit_jds[keep].tolist(), body[keep].tolist(), target[keep].tolist(), slope[keep].tolist())):
+        hit = {
+            'jd': jd,
+            'date': jd_to_utc_string(jd),
+            'transit': TRANSIT_BODIES[b],
+            'aspect': ASPECT_NAMES[target_aspect[t]],
+            'natal': natal_points[target_point[t]]['name'],
+            'retrograde': rate < 0,
+        }
+        if houses is not None:
+            hit['house'] = houses[n]
+        hits.append(hit)
+    hits.sort(key=lambda hit: hit['jd'])
+    return hits
+
+
+def jd_to_utc_string(jd):
+    year, month, day, hour = swe.revjul(jd)
+    total_minutes = int(round(hour * 60))
+    if total_minutes >= 24 * 60:
+        year, month, day, _ = swe.revjul(jd + 0.5 / 1440)
+        total_minutes = 0
+    return f"{year}-{month:02d}-{day:02d} {total_minutes // 60:02d}:{total_minutes % 60:02d} UTC"
+
+
+def calculate_transits(natal_chart, start_jd, end_jd, step_days=1.0, selected_aspects=None, with_positions=True):
+    """Transit timeline for a calculated natal chart.
+
+    Returns {'hits': exact aspect times, 'positions': body longitudes every `step_days`};
+    without `with_positions` (e.g. for Markdown, which only lists the hits) 'positions'
+    is None and not sampled.
+    """
+    if end_jd < start_jd:
+        raise ValueError("The transit end date must not be before the start date.")
+    if end_jd - start_jd > MAX_RANGE_DAYS:
+        raise ValueError(f"The transit range is limited to {MAX_RANGE_DAYS} days.")
+    if step_days <= 0:
+        raise ValueError("The transit step must be positive.")
+    if with_positions and (end_jd - start_jd) / step_days + 1 > MAX_POSITIONS:
+        raise ValueError(f"The transit step is too small for this range (at most {MAX_POSITIONS} positions).")
+
+    aspects_to_calculate = select_aspects(selected_aspects)
+    hits = find_transit_hits(natal_chart, start_jd, end_jd, aspects_to_calculate)
+    if not with_positions:
+        return {'hits': hits, 'positions': None}
+
+    days, lons, speeds = sample_positions(start_jd, end_jd)
+    step_jds = np.arange(start_jd, end_jd + 1e-9, step_days)
+    step_lons = interpolate_positions(days, lons, speeds, step_jds)
+    positions = [
+        {'jd': jd, 'date': jd_to_utc_string(jd), 'lons': dict(zip(TRANSIT_BODIES, row))}
+        for jd, row in zip(step_jds.tolist(), step_lons.tolist())
+    ]
+    if not natal_chart.get('time_unknown'):
+        shift = natal_chart.get('ayanamsa', 0.0)
+        step_houses = natal_chart['house_index'].houses_of((step_lons - shift) % 360).tolist()
+        for position, row in zip(positions, step_houses):
+            position['houses'] = dict(zip(TRANSIT_BODIES, row))
+    return {'hits': hits, 'positions': positions}
+
+
+def transits_to_markdown(natal_chart, start_label, end_label, transits):
+    """Renders the transit hit timeline as a Markdown section."""
+    name = natal_chart['name'] or "Chart 1"
+    lines = [
+        f"# Transits for {name}",
+        f"- **Natal Date:** {natal_chart['date_str']}",
+        f"- **Natal Location:** {natal_chart['location_str']}",
+        f"- **Period:** {start_label} – {end_label}",
+        "\n### Exact Transit Aspects",
+    ]
+    if not transits['hits']:
+        lines.append("- No exact transit aspects in this period.")
+        return "\n".join(lines)
+    with_houses = not natal_chart.get('time_unknown')
+    if with_houses:
+        lines.append("| Date (UTC)        | Transit   | Aspect         | Natal     | House |")
+        lines.append("| :---------------- | :-------- | :------------- | :-------- | :----:|")
+    else:
+        lines.append("| Date (UTC)        | Transit   | Aspect         | Natal     |")
+        lines.append("| :---------------- | :-------- | :------------- | :-------- |")
+    for hit in transits['hits']:
+        transit = hit['transit'] + (' R' if hit['retrograde'] else '')
+        row = f"| {hit['date'][:16]:<17} | {transit:<9} | {hit['aspect']:<14} | {hit['natal']:<9} |"
+        if with_houses:
+            row += f" {hit['house']:<5} |"
+        lines.append(row)
+    return "\n".join(lines)
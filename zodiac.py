@@ -0,0 +1,45 @@
+import threading
+import swisseph as swe
+
+# --- Zodiacs ---
+# 'tropical' plus sidereal zodiacs identified by their ayanamsa. A sidereal longitude is the
+# tropical one minus the ayanamsa at that moment (this matches swe.FLG_SIDEREAL to well
+# under a milliarcsecond), so one tropical ephemeris pass serves every zodiac.
+
+ZODIACS = {
+    'tropical': None,
+    'lahiri': swe.SIDM_LAHIRI,
+    'fagan_bradley': swe.SIDM_FAGAN_BRADLEY,
+    'krishnamurti': swe.SIDM_KRISHNAMURTI,
+    'raman': swe.SIDM_RAMAN,
+    'yukteshwar': swe.SIDM_YUKTESHWAR,
+    'true_citra': swe.SIDM_TRUE_CITRA,
+}
+
+# swe.set_sid_mode() is process-wide state; hold the lock from setting it to reading the value.
+_sid_mode_lock = threading.Lock()
+
+
+def zodiac_label(zodiac):
+    return zodiac.replace('_', ' ').title().replace('Fagan Bradley', 'Fagan/Bradley')
+
+
+def ayanamsa(jd, zodiac):
+    """Degrees the `zodiac` (a ZODIACS name) lags the tropical zodiac at `jd` (UT); 0 for tropical."""
+    mode = ZODIACS[zodiac]
+    if mode is None:
+        return 0.0
+    with _sid_mode_lock:
+        swe.set_sid_mode(mode)
+        return swe.get_ayanamsa_ex_ut(jd, swe.FLG_SWIEPH)[1]
+
+
+def frame_shift(chart, other):
+    """Degrees to add to `other`'s longitudes to express them in `chart`'s zodiac.
+
+    Charts in the same zodiac are compared as-is (sidereal to sidereal); otherwise both
+    are referred back to the tropical zodiac.
+    """
+    if chart.get('zodiac', 'tropical') == other.get('zodiac', 'tropical'):
+        return 0.0
+    return other.get('ayanamsa', 0.0) - chart.get('ayanamsa', 0.0)